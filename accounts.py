@@ -0,0 +1,187 @@
+"""
+Multi-Account Module
+Detects account sections in combined statements so each balance chain is parsed independently
+"""
+
+import logging
+import os
+import re
+from pathlib import Path
+
+from pdf_extractor import PageExtraction, format_plain_text
+from transactions import parse_amount, parse_transactions
+from scheduler import run_jobs
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ACCOUNT_WORKERS = int(os.getenv('ACCOUNT_WORKERS', '4'))
+
+# "Account No: 1234 5678 9012", "A/C Number - XXXX1234", "Account # 000123456"
+ACCOUNT_PATTERN = re.compile(
+    r'\b(?:a/c|acct|account)\s*(?:no\.?|number|num|#)?\s*[:\-#]?\s*([0-9Xx*][0-9Xx*\- ]{4,}[0-9])',
+    re.IGNORECASE
+)
+OPENING_BALANCE_PATTERN = re.compile(
+    r'\bopening\s+balance\b[^0-9\-(]*([\-(]?[\d,]+\.\d{1,2}\)?)',
+    re.IGNORECASE
+)
+# Transaction rows start with a date or carry an amount; account numbers in
+# their narrations ("NEFT TRF TO A/C ...") are counterparties, not headers
+TRANSACTION_LINE = re.compile(r'^\s*(\d{1,2}[/\-. ](\d{1,2}|[A-Za-z]{3})([/\-. ]\d{2,4})?|\d{4}-\d{2}-\d{2})\b')
+AMOUNT = re.compile(r'\d[\d,]*\.\d{2}\b')
+# Lines after a mid-page header within which its opening balance must appear
+HEADER_CONTEXT_LINES = 3
+
+def normalize_account(number):
+    """Strip separators so '1234 5678' and '1234-5678' are the same account"""
+    return re.sub(r'[\s\-]', '', number).upper()
+
+def _slice_page(extraction, lines, first, last):
+    """Text-only copy of part of a page (tables cannot be split by line)"""
+    text = '\n'.join(lines[first:last])
+    return PageExtraction(extraction.page_number, text=text, layout_text=text, ocr=extraction.ocr)
+
+def _section_pages(pages, page_lines, start, end):
+    """Collect the pages (or page slices) between two (page_index, line) positions"""
+    (start_page, start_line), (end_page, end_line) = start, end
+    section_pages = []
+    
+    for page_index in range(start_page, min(end_page, len(pages) - 1) + 1):
+        lines = page_lines[page_index]
+        first = start_line if page_index == start_page else 0
+        last = end_line if page_index == end_page else len(lines)
+        if first >= last:
+            continue
+        if first == 0 and last == len(lines):
+            section_pages.append(pages[page_index])
+        else:
+            section_pages.append(_slice_page(pages[page_index], lines, first, last))
+    
+    return section_pages
+
+def _header_account(lines, line_num, seen_transaction):
+    """
+    Account number named by an account header on this line, or None
+    
+    Transaction lines never count. After the page's first transaction line,
+    a header only counts when an opening balance follows within
+    HEADER_CONTEXT_LINES lines, so a wrapped narration such as "TO A/C 1234..."
+    on its own line does not start a section.
+    """
+    line = lines[line_num]
+    match = ACCOUNT_PATTERN.search(line)
+    if not match:
+        return None
+    if TRANSACTION_LINE.match(line) or (AMOUNT.search(line) and not OPENING_BALANCE_PATTERN.search(line)):
+        return None
+    if seen_transaction:
+        context = lines[line_num:line_num + HEADER_CONTEXT_LINES + 1]
+        if not any(OPENING_BALANCE_PATTERN.search(following) for following in context):
+            return None
+    return normalize_account(match.group(1))
+
+def detect_account_sections(pages):
+    """
+    Split extracted pages into one section per account
+    
+    A new section starts wherever an account header names a different
+    account from the current one; repeated headers for the same account (page
+    headers) do not start a new section. Account numbers inside transaction
+    lines are ignored (see _header_account). Pages shared by two accounts are
+    cut at the header line, keeping only their text. Anything before the
+    first header (bank address, customer details) goes with the first account.
+    An account can own several sections if its rows resume after another
+    account's; group_by_account merges them again.
+    
+    Args:
+        pages (list): PageExtraction objects
+    
+    Returns:
+        list: Sections as dicts with 'account', 'opening_balance' (minor units
+            or None) and 'pages'. Single-account statements give one section.
+    """
+    page_lines = [extraction.text.split('\n') if extraction.text else [] for extraction in pages]
+    sections = []
+    
+    for page_index, lines in enumerate(page_lines):
+        seen_transaction = False
+        for line_num, line in enumerate(lines):
+            account = _header_account(lines, line_num, seen_transaction)
+            if account and (not sections or sections[-1]['account'] != account):
+                sections.append({'account': account, 'opening_balance': None, 'start': (page_index, line_num)})
+            seen_transaction = seen_transaction or bool(TRANSACTION_LINE.match(line))
+            
+            opening = OPENING_BALANCE_PATTERN.search(line)
+            if opening and sections and sections[-1]['opening_balance'] is None:
+                sections[-1]['opening_balance'] = parse_amount(opening.group(1))
+    
+    if len(sections) < 2:
+        section = sections[0] if sections else {'account': None, 'opening_balance': None}
+        section.pop('start', None)
+        section['pages'] = list(pages)
+        return [section]
+    
+    sections[0]['start'] = (0, 0)
+    for i, section in enumerate(sections):
+        end = sections[i + 1]['start'] if i + 1 < len(sections) else (len(pages), 0)
+        section['pages'] = _section_pages(pages, page_lines, section['start'], end)
+    
+    for section in sections:
+        section.pop('start')
+    
+    logger.info(f"Detected {len(sections)} account sections: {[s['account'] for s in sections]}")
+    return sections
+
+def parse_sections(sections, parse_text, formatter=format_plain_text, workers=ACCOUNT_WORKERS):
+    """
+    Parse every account section concurrently as an independent job
+    
+    The largest sections are submitted first so the document finishes as
+    early as the quota allows.
+    
+    Args:
+        sections (list): Sections from detect_account_sections
+        parse_text (callable): parse_text(text_data) -> CSV string or None
+        formatter (callable): Turns a section's pages into text (plain or layout)
+        workers (int): Sections parsed at the same time
+    
+    Returns:
+        list: CSV string per section, in section order (None if that section failed)
+    """
+    texts = {index: formatter(section['pages']) for index, section in enumerate(sections)}
+    results = run_jobs(texts, lambda index, text: parse_text(text), policy='largest_first', workers=workers)
+    
+    for index, result in results.items():
+        if isinstance(result, Exception):
+            logger.error(f"Parsing account {sections[index]['account']} failed: {str(result)}")
+            results[index] = None
+    
+    return [results[index] for index in range(len(sections))]
+
+def account_output_path(output_path, account):
+    """Per-account output path, e.g. data.csv -> data_XXXX1234.csv"""
+    path = Path(output_path)
+    safe_account = re.sub(r'[^0-9A-Za-z]', '_', account or 'unknown')
+    return str(path.with_name(f"{path.stem}_{safe_account}{path.suffix}"))
+
+def group_by_account(sections, results):
+    """
+    Merge parsed sections that belong to the same account, in statement order
+    
+    Args:
+        sections (list): Sections from detect_account_sections
+        results (list): CSV strings from parse_sections (already cleaned)
+    
+    Returns:
+        dict: account -> list of Transaction objects, or None if any of its sections failed
+    """
+    accounts = {}
+    for section, csv_result in zip(sections, results):
+        account = section['account']
+        if csv_result is None or (account in accounts and accounts[account] is None):
+            accounts[account] = None
+            continue
+        accounts.setdefault(account, []).extend(parse_transactions(csv_result))
+    return accounts
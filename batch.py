@@ -0,0 +1,338 @@
+"""
+Batch Processing Module
+Lets several independent workers drain one shared input directory using only the filesystem
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+from isolation import DocumentTimeout, WorkerCrashed
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATE_DIR_NAME = '.batch_state'
+LEASE_TTL = int(os.getenv('BATCH_LEASE_TTL', '900'))
+MAX_ATTEMPTS = int(os.getenv('BATCH_MAX_ATTEMPTS', '3'))
+# Documents whose worker had to be killed this many times are quarantined
+QUARANTINE_AFTER = int(os.getenv('BATCH_QUARANTINE_AFTER', '2'))
+
+def default_worker_id():
+    """Worker identity unique across containers sharing the directory"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json_atomic(path, data):
+    """Write JSON via a temp file and rename so readers never see partial content"""
+    temp_path = f"{path}.{default_worker_id()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def _lease_expired(lease_path, lease):
+    """A lease is expired past its expiry time; unreadable leases age out by mtime"""
+    if lease and 'expires_at' in lease:
+        return lease['expires_at'] <= time.time()
+    try:
+        return os.path.getmtime(lease_path) + LEASE_TTL <= time.time()
+    except OSError:
+        return True
+
+def acquire_lease(lease_path, worker_id, ttl=LEASE_TTL):
+    """
+    Claim a document by creating its lease file exclusively
+    
+    An expired lease is moved aside with an atomic rename, so only one of the
+    workers racing to take it over succeeds.
+    
+    Args:
+        lease_path (str): Lease file for the document
+        worker_id (str): Identity of the claiming worker
+        ttl (int): Lease lifetime in seconds
+    
+    Returns:
+        bool: True if this worker now holds the lease
+    """
+    payload = json.dumps({'worker': worker_id, 'expires_at': time.time() + ttl})
+    
+    for _ in range(2):
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            lease = _read_json(lease_path)
+            if not _lease_expired(lease_path, lease):
+                return False
+            
+            stale_path = f"{lease_path}.{worker_id}.stale"
+            try:
+                os.rename(lease_path, stale_path)
+            except FileNotFoundError:
+                return False
+            
+            # Another worker may have replaced the expired lease between our read and rename
+            if not _lease_expired(stale_path, _read_json(stale_path)):
+                try:
+                    os.link(stale_path, lease_path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            
+            os.remove(stale_path)
+            logger.info(f"Took over expired lease {os.path.basename(lease_path)} (held by {lease and lease.get('worker')})")
+            continue
+        
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        return True
+    
+    return False
+
+def owns_lease(lease_path, worker_id):
+    """Check whether the lease file is still held by this worker"""
+    lease = _read_json(lease_path)
+    return bool(lease) and lease.get('worker') == worker_id
+
+def renew_lease(lease_path, worker_id, ttl=LEASE_TTL):
+    """Extend a lease this worker still holds"""
+    if not owns_lease(lease_path, worker_id):
+        return False
+    write_json_atomic(lease_path, {'worker': worker_id, 'expires_at': time.time() + ttl})
+    return True
+
+def release_lease(lease_path, worker_id):
+    """Remove a lease this worker holds"""
+    if owns_lease(lease_path, worker_id):
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            pass
+
+class LeaseKeeper:
+    """Context manager that renews a lease in the background while a document is processed"""
+    
+    def __init__(self, lease_path, worker_id, ttl=LEASE_TTL):
+        self.lease_path = lease_path
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            if not renew_lease(self.lease_path, self.worker_id, self.ttl):
+                logger.warning(f"Lost lease {os.path.basename(self.lease_path)}")
+                return
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+def state_paths(output_dir, state_dir=None):
+    """
+    Get (and create) the coordination directories shared by all workers
+    
+    Returns:
+        dict: Paths for 'leases', 'done', 'failed' and 'quarantine'
+    """
+    root = Path(state_dir) if state_dir else Path(output_dir) / STATE_DIR_NAME
+    paths = {name: root / name for name in ('leases', 'done', 'failed', 'quarantine')}
+    for path in paths.values():
+        path.mkdir(parents=True, exist_ok=True)
+    return paths
+
+def read_manifest(output_dir, state_dir=None):
+    """
+    Collect the completed and failed documents recorded by all workers
+    
+    Returns:
+        dict: {'done': {name: record}, 'failed': {name: record},
+            'quarantine': {name: record}, 'in_progress': [names]}
+    """
+    paths = state_paths(output_dir, state_dir)
+    manifest = {'done': {}, 'failed': {}, 'quarantine': {}, 'in_progress': []}
+    
+    for status in ('done', 'failed', 'quarantine'):
+        for marker in sorted(paths[status].glob('*.json')):
+            record = _read_json(marker)
+            if record is not None:
+                manifest[status][marker.stem] = record
+    
+    for lease in sorted(paths['leases'].glob('*.lease')):
+        if not _lease_expired(str(lease), _read_json(lease)):
+            manifest['in_progress'].append(lease.stem)
+    
+    return manifest
+
+def commit_output(temp_path, output_path):
+    """Publish a finished output with an atomic rename"""
+    with open(temp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, output_path)
+
+def list_pending(input_dir, paths, max_attempts=MAX_ATTEMPTS, order='smallest_first'):
+    """
+    List input PDFs that are neither done, quarantined nor out of attempts
+    
+    'smallest_first' (default) returns quick documents first for latency,
+    'largest_first' starts long documents early, 'name' keeps directory order.
+    """
+    pending = []
+    for pdf in sorted(Path(input_dir).glob('*.pdf')):
+        if (paths['done'] / f"{pdf.name}.json").exists():
+            continue
+        if (paths['quarantine'] / f"{pdf.name}.json").exists():
+            continue
+        failure = _read_json(paths['failed'] / f"{pdf.name}.json")
+        if failure and failure.get('attempts', 0) >= max_attempts:
+            continue
+        pending.append(pdf)
+    
+    if order in ('smallest_first', 'largest_first'):
+        pending.sort(key=lambda pdf: pdf.stat().st_size, reverse=order == 'largest_first')
+    return pending
+
+def process_one(pdf, output_dir, paths, worker_id, process, lease_ttl, quarantine_after=QUARANTINE_AFTER):
+    """
+    Process one claimed document and record the outcome
+    
+    Documents whose isolated worker had to be killed (deadline or crash)
+    quarantine_after times are quarantined and no longer claimed. If the
+    lease expired and was taken over while the document was processed, the
+    result is discarded and nothing is recorded: the new holder owns it.
+    
+    Returns:
+        bool: True if the document was converted, None if the lease was lost
+    """
+    lease_path = str(paths['leases'] / f"{pdf.name}.lease")
+    done_marker = paths['done'] / f"{pdf.name}.json"
+    failed_marker = paths['failed'] / f"{pdf.name}.json"
+    output_path = Path(output_dir) / f"{pdf.stem}.csv"
+    temp_path = Path(output_dir) / f".{pdf.stem}.csv.{worker_id}.tmp"
+    
+    started = time.time()
+    error = None
+    killed = False
+    try:
+        with LeaseKeeper(lease_path, worker_id, lease_ttl):
+            success = process(str(pdf), str(temp_path))
+    except (DocumentTimeout, WorkerCrashed) as e:
+        success, error, killed = False, str(e), True
+    except Exception as e:
+        success, error = False, str(e)
+    
+    # Renewing both confirms ownership and keeps the lease from expiring while the outcome is recorded
+    if not renew_lease(lease_path, worker_id, lease_ttl):
+        if temp_path.exists():
+            temp_path.unlink()
+        logger.warning(f"[{worker_id}] Lost the lease on {pdf.name}; discarding this worker's result")
+        return None
+    
+    record = {
+        'worker': worker_id,
+        'finished_at': time.time(),
+        'seconds': round(time.time() - started, 2)
+    }
+    
+    if success and temp_path.exists():
+        commit_output(temp_path, output_path)
+        record['output'] = str(output_path)
+        write_json_atomic(done_marker, record)
+        if failed_marker.exists():
+            failed_marker.unlink()
+        logger.info(f"[{worker_id}] Completed {pdf.name}")
+        return True
+    
+    previous = _read_json(failed_marker) or {}
+    record['attempts'] = previous.get('attempts', 0) + 1
+    record['killed'] = previous.get('killed', 0) + int(killed)
+    record['error'] = error or 'processing returned failure'
+    write_json_atomic(failed_marker, record)
+    if temp_path.exists():
+        temp_path.unlink()
+    logger.warning(f"[{worker_id}] Failed {pdf.name} (attempt {record['attempts']}): {record['error']}")
+    
+    if quarantine_after and record['killed'] >= quarantine_after:
+        write_json_atomic(paths['quarantine'] / f"{pdf.name}.json", record)
+        logger.warning(f"[{worker_id}] Quarantined {pdf.name} after its worker was killed {record['killed']} times")
+    return False
+
+def run_worker(input_dir, output_dir, process, worker_id=None, state_dir=None,
+               lease_ttl=LEASE_TTL, max_attempts=MAX_ATTEMPTS, order='smallest_first',
+               quarantine_after=QUARANTINE_AFTER):
+    """
+    Drain a shared input directory, cooperating with other workers through lease files
+    
+    Any number of workers (processes or containers) can run this against the
+    same directories. Each document is claimed with a lease, its CSV is
+    committed with an atomic rename, and the outcome is recorded as a done or
+    failed marker. Workers keep rescanning until nothing is left to claim, which
+    also picks up documents whose worker died (expired lease) or that failed
+    fewer than max_attempts times. Wrap process in isolation.IsolatedProcess
+    to enforce per-document deadlines and recycle leaky workers.
+    
+    Args:
+        input_dir (str): Directory of input PDFs shared by all workers
+        output_dir (str): Directory for CSV outputs and coordination state
+        process (callable): process(input_path, output_path) -> bool
+        worker_id (str): Identity of this worker (defaults to host-pid)
+        state_dir (str): Coordination directory (defaults to output_dir/.batch_state)
+        lease_ttl (int): Seconds before an unrenewed lease can be taken over
+        max_attempts (int): Failures after which a document is no longer retried
+        order (str): Claim order - 'smallest_first', 'largest_first' or 'name'
+        quarantine_after (int): Worker kills after which a document is quarantined (0 to disable)
+    
+    Returns:
+        dict: Counts of 'processed' and 'failed' documents for this worker
+    """
+    worker_id = worker_id or default_worker_id()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    paths = state_paths(output_dir, state_dir)
+    summary = {'processed': 0, 'failed': 0}
+    
+    logger.info(f"[{worker_id}] Draining {input_dir}")
+    
+    while True:
+        claimed = 0
+        for pdf in list_pending(input_dir, paths, max_attempts, order):
+            lease_path = str(paths['leases'] / f"{pdf.name}.lease")
+            if not acquire_lease(lease_path, worker_id, lease_ttl):
+                continue
+            
+            try:
+                # Another worker may have finished it between listing and claiming
+                if (paths['done'] / f"{pdf.name}.json").exists():
+                    continue
+                claimed += 1
+                converted = process_one(pdf, output_dir, paths, worker_id, process, lease_ttl, quarantine_after)
+                if converted:
+                    summary['processed'] += 1
+                elif converted is not None:
+                    summary['failed'] += 1
+            finally:
+                release_lease(lease_path, worker_id)
+        
+        if not claimed:
+            break
+    
+    logger.info(f"[{worker_id}] Finished: {summary['processed']} processed, {summary['failed']} failed")
+    return summary
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Extraction Benchmark
+Measures pages/sec with and without the table pre-check on a set of PDFs
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+from pdf_extractor import extract_pages, get_table_profile, TABLE_PROFILES
+
+def collect_pdfs(inputs):
+    """Expand files and directories into a list of PDF paths"""
+    pdfs = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            pdfs.extend(sorted(path.glob('*.pdf')))
+        elif path.suffix.lower() == '.pdf':
+            pdfs.append(path)
+    return pdfs
+
+def time_extraction(pdfs, profile, repeat):
+    """
+    Extract every PDF repeat times and keep the fastest run
+    
+    Returns:
+        tuple: (seconds, pages, list of PageExtraction lists from the last run)
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [extract_pages(str(pdf), use_ocr=False, profile=profile) for pdf in pdfs]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    
+    pages = sum(len(result) for result in results)
+    return best, pages, results
+
+def run_benchmark(pdfs, profile_name, repeat=3):
+    """
+    Compare extraction with the pre-check off (baseline) and on
+    
+    Returns:
+        dict: Throughput for both runs, pages skipped and pages whose tables changed
+    """
+    profile = get_table_profile(profile_name)
+    baseline_seconds, pages, baseline = time_extraction(pdfs, dict(profile, precheck=False), repeat)
+    precheck_seconds, _, checked = time_extraction(pdfs, dict(profile, precheck=True), repeat)
+    
+    skipped = sum(1 for result in checked for extraction in result if not extraction.table_checked)
+    tables_changed = sum(
+        1
+        for before, after in zip(baseline, checked)
+        for a, b in zip(before, after)
+        if a.tables != b.tables
+    )
+    
+    return {
+        'pages': pages,
+        'skipped': skipped,
+        'baseline_pages_per_sec': pages / baseline_seconds if baseline_seconds else 0.0,
+        'precheck_pages_per_sec': pages / precheck_seconds if precheck_seconds else 0.0,
+        'tables_changed': tables_changed
+    }
+
+def main():
+    """Benchmark CLI"""
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction with and without the table pre-check")
+    parser.add_argument('inputs', nargs='+', help='PDF files or directories of PDFs')
+    parser.add_argument('--profile', choices=sorted(TABLE_PROFILES), help='Table profile to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode (fastest is reported)')
+    args = parser.parse_args()
+    
+    logging.disable(logging.INFO)
+    
+    pdfs = collect_pdfs(args.inputs)
+    if not pdfs:
+        print("No PDF files found")
+        sys.exit(1)
+    
+    result = run_benchmark(pdfs, args.profile, max(1, args.repeat))
+    speedup = result['precheck_pages_per_sec'] / result['baseline_pages_per_sec'] if result['baseline_pages_per_sec'] else 0.0
+    
+    print(f"PDFs: {len(pdfs)}, pages: {result['pages']}")
+    print(f"Table finder skipped on {result['skipped']} pages")
+    print(f"Without pre-check: {result['baseline_pages_per_sec']:.1f} pages/sec")
+    print(f"With pre-check:    {result['precheck_pages_per_sec']:.1f} pages/sec ({speedup:.2f}x)")
+    # Ruling-line checks are exact; alignment checks may drop spurious text-strategy tables
+    print(f"Pages whose tables changed: {result['tables_changed']}")
+
+if __name__ == "__main__":
+    main()
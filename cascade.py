@@ -0,0 +1,210 @@
+"""
+Model Cascade Module
+Parses with the cheapest model tier first and escalates only when validation fails
+"""
+
+import logging
+import os
+import threading
+import time
+
+from llm_parser import GeminiRequestError, get_model_usage, DEFAULT_MODEL_NAME
+from csv_handler import validate_csv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Comma-separated model names, cheapest first
+MODEL_LADDER_ENV = os.getenv('GEMINI_MODEL_LADDER', f"gemini-2.0-flash-lite,{DEFAULT_MODEL_NAME}")
+
+# USD per million (input, output) tokens; override or extend with
+# GEMINI_MODEL_PRICES="model=input:output,..."
+MODEL_PRICES = {
+    'gemini-1.5-flash-8b': (0.0375, 0.15),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-pro': (1.25, 5.00),
+    'gemini-2.0-flash-lite': (0.075, 0.30),
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-2.0-flash-exp': (0.10, 0.40),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00)
+}
+# Cached prompt tokens are billed at a fraction of the input price
+CACHED_PRICE_RATIO = 0.25
+
+_tier_stats = {}
+_stats_lock = threading.Lock()
+
+def parse_ladder(value):
+    """
+    Parse a comma-separated model ladder
+    
+    Returns:
+        tuple: Model names in escalation order (duplicates dropped)
+    """
+    ladder = []
+    for name in (value or '').split(','):
+        name = name.strip()
+        if name and name not in ladder:
+            ladder.append(name)
+    return tuple(ladder)
+
+def parse_prices(value):
+    """Parse 'model=input:output,...' into {model: (input, output)} USD per million tokens"""
+    prices = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        try:
+            name, rates = item.split('=')
+            input_price, output_price = rates.split(':')
+            prices[name.strip()] = (float(input_price), float(output_price))
+        except ValueError:
+            logger.warning(f"Ignoring malformed model price {item.strip()!r}")
+    return prices
+
+MODEL_LADDER = parse_ladder(MODEL_LADDER_ENV)
+MODEL_PRICES.update(parse_prices(os.getenv('GEMINI_MODEL_PRICES')))
+
+def escalation_reason(report):
+    """
+    Decide whether a tier's output must be escalated
+    
+    Args:
+        report (dict): Validation report from validate_csv
+    
+    Returns:
+        str: Why the output is not acceptable, or None to accept it
+    """
+    if report['errors']:
+        return f"validation errors {report['errors'][:2]}"
+    if not report['row_count']:
+        return "no transactions"
+    if 'balance_inconsistency' in report['issues_found']:
+        return f"{len(set(report['flagged_rows']))} rows break the running balance"
+    return None
+
+def _record_tier(model_name, latency, outcome):
+    with _stats_lock:
+        stats = _tier_stats.setdefault(model_name, {
+            'attempts': 0, 'accepted': 0, 'escalated': 0, 'failed_requests': 0, 'latency_total': 0.0
+        })
+        stats['attempts'] += 1
+        stats[outcome] += 1
+        stats['latency_total'] += latency
+
+def estimate_cost(model_name, usage):
+    """
+    Estimate the USD cost of a model's token usage
+    
+    Returns:
+        float: Cost, or None if the model has no known price
+    """
+    prices = MODEL_PRICES.get(model_name)
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    uncached = usage['prompt_tokens'] - usage['cached_tokens']
+    return (uncached * input_price
+            + usage['cached_tokens'] * input_price * CACHED_PRICE_RATIO
+            + usage['output_tokens'] * output_price) / 1_000_000
+
+def get_tier_counters():
+    """Raw per-tier counters (summed across processes by isolation.IsolatedProcess)"""
+    with _stats_lock:
+        return {model_name: dict(stats) for model_name, stats in _tier_stats.items()}
+
+def get_cascade_stats(tiers=None, usage=None):
+    """
+    Per-tier outcomes, latency and cost
+    
+    Token counts and cost cover every request made with the tier's model
+    (including targeted repairs), not only the cascade's own parse requests.
+    
+    Args:
+        tiers (dict): Raw tier counters (defaults to this process's get_tier_counters())
+        usage (dict): Token usage per model (defaults to this process's get_model_usage())
+    
+    Returns:
+        dict: {model name: {'attempts', 'accepted', 'escalated', 'failed_requests',
+            'hit_rate', 'latency_avg', 'prompt_tokens', 'output_tokens', 'cost'}}
+    """
+    tiers = {model_name: dict(stats) for model_name, stats in
+             (get_tier_counters() if tiers is None else tiers).items()}
+    usage = get_model_usage() if usage is None else usage
+    
+    for model_name, stats in tiers.items():
+        stats['hit_rate'] = stats['accepted'] / stats['attempts'] if stats['attempts'] else 0.0
+        stats['latency_avg'] = stats.pop('latency_total') / stats['attempts'] if stats['attempts'] else 0.0
+        model_usage = usage.get(model_name)
+        stats['prompt_tokens'] = model_usage['prompt_tokens'] if model_usage else 0
+        stats['output_tokens'] = model_usage['output_tokens'] if model_usage else 0
+        stats['cost'] = estimate_cost(model_name, model_usage) if model_usage else 0.0
+    return tiers
+
+def reset_cascade_stats():
+    """Reset the per-tier counters"""
+    with _stats_lock:
+        _tier_stats.clear()
+
+def parse_with_cascade(text_data, parse_tier, ladder=MODEL_LADDER):
+    """
+    Parse text with each model tier in turn until one passes validation
+    
+    A tier's output is accepted when validate_csv reports no errors and no
+    balance inconsistencies. Failed requests and rejected output escalate to
+    the next tier. If no tier passes, the output with the fewest problems is
+    returned (later tiers win ties) so a hard statement is never worse off
+    than with the strongest model alone.
+    
+    Args:
+        text_data (str): Extracted text of one statement (or one account section)
+        parse_tier (callable): parse_tier(text_data, model_name) -> CSV string or None
+        ladder (tuple): Model names, cheapest first
+    
+    Returns:
+        str: CSV string, or None if no tier produced output
+    
+    Raises:
+        GeminiRequestError: If every tier's request failed
+    """
+    best = None
+    last_error = None
+    
+    for tier, model_name in enumerate(ladder):
+        started = time.monotonic()
+        try:
+            csv_result = parse_tier(text_data, model_name)
+        except GeminiRequestError as e:
+            _record_tier(model_name, time.monotonic() - started, 'failed_requests')
+            last_error = e
+            logger.warning(f"Tier {model_name} failed ({str(e)})")
+            continue
+        latency = time.monotonic() - started
+        
+        if not csv_result:
+            _record_tier(model_name, latency, 'escalated')
+            logger.info(f"Tier {model_name} returned no rows")
+            continue
+        
+        _, report = validate_csv(csv_result)
+        reason = escalation_reason(report)
+        if reason is None:
+            _record_tier(model_name, latency, 'accepted')
+            logger.info(f"Accepted {model_name} output ({latency:.1f}s)")
+            return csv_result
+        
+        _record_tier(model_name, latency, 'escalated')
+        problems = (len(report['errors']), not report['row_count'], len(set(report['flagged_rows'])))
+        if best is None or problems <= best[0]:
+            best = (problems, csv_result, model_name)
+        if tier + 1 < len(ladder):
+            logger.info(f"Escalating from {model_name} to {ladder[tier + 1]}: {reason}")
+    
+    if best is not None:
+        logger.warning(f"No model tier passed validation; keeping the {best[2]} output")
+        return best[1]
+    if last_error is not None:
+        raise last_error
+    return None
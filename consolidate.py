@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Ledger Consolidation Module
+Streams many per-statement CSV outputs into one chronological ledger with bounded memory
+"""
+
+import argparse
+import csv
+import heapq
+import logging
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+from transactions import CSV_COLUMNS, Transaction, format_amount
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_EXAMPLES = 5
+
+def read_statement(handle, source):
+    """
+    Lazily read one statement output as (sort date, transaction) pairs
+    
+    Columns are matched by header name. Rows whose date could not be parsed
+    sort with the previous row so each stream stays in date order for the
+    merge; undated rows before the first dated one (an "Opening Balance"
+    line) are held back and sort with the first dated row, so they stay at
+    the start of their statement's period instead of the top of the ledger.
+    
+    Args:
+        handle: Open CSV file
+        source (str): Name used in messages
+    
+    Yields:
+        tuple: (date ordinal, Transaction)
+    
+    Raises:
+        ValueError: If the file is not a single-account statement output
+    """
+    reader = csv.reader(handle)
+    header = [name.strip() for name in next(reader, [])]
+    if 'Account' in header:
+        raise ValueError(f"{source} combines several accounts; consolidate per-account outputs (--accounts split)")
+    missing = [name for name in CSV_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f"{source} is missing columns {missing}")
+    
+    positions = [header.index(name) for name in CSV_COLUMNS]
+    last_date = None
+    out_of_order = 0
+    leading = []
+    
+    for row_number, row in enumerate(reader, 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        cells = [row[i] if i < len(row) else '' for i in positions]
+        transaction = Transaction.from_row(cells, row_number)
+        
+        if transaction.date is not None:
+            if last_date is not None and transaction.date < last_date:
+                out_of_order += 1
+            else:
+                last_date = transaction.date
+        if last_date is None:
+            leading.append(transaction)
+            continue
+        for held in leading:
+            yield last_date, held
+        leading = []
+        yield last_date, transaction
+    
+    # No dated rows at all
+    for held in leading:
+        yield 0, held
+    
+    if out_of_order:
+        logger.warning(f"{source}: {out_of_order} rows dated before an earlier row were kept in place")
+
+def first_date(path):
+    """Date of the first dated row in a statement output (used to order inputs by period)"""
+    with open(path, 'r', encoding='utf-8', newline='') as handle:
+        for ordinal, transaction in read_statement(handle, str(path)):
+            if transaction.date is not None:
+                return ordinal
+    return None
+
+def _tag_source(rows, index):
+    """Tag each row with its input's position so sources are known after the merge"""
+    for ordinal, transaction in rows:
+        yield ordinal, index, transaction
+
+def _note(report, key, example):
+    report[key] += 1
+    if len(report['examples'][key]) < MAX_EXAMPLES:
+        report['examples'][key].append(example)
+
+def consolidate(paths, output_path):
+    """
+    Merge statement outputs into one ledger ordered by date
+    
+    Inputs are ordered by their first date and merged with heapq.merge, so
+    only one pending row per input is held in memory. Rows are written as they
+    come out of the merge. Because the merge groups each day's rows, overlap
+    duplicates (the same transaction in two statements whose periods overlap)
+    are found by remembering only the current day's rows. Every written row is
+    checked against the previous written balance; breaks where the previous
+    row came from another statement indicate a missing or misordered period.
+    
+    Args:
+        paths (list): Per-statement CSV outputs for one account
+        output_path (str): Consolidated ledger CSV
+    
+    Returns:
+        dict: Counts of rows written, duplicates removed, balance breaks within
+            and across statements, and examples of each
+    """
+    dated = [(first_date(path), str(path)) for path in paths]
+    ordered = [path for ordinal, path in sorted(dated, key=lambda item: (item[0] is None, item[0] or 0, item[1]))]
+    
+    report = {
+        'inputs': len(ordered),
+        'rows': 0,
+        'duplicates_removed': 0,
+        'balance_breaks': 0,
+        'boundary_breaks': 0,
+        'examples': {'duplicates_removed': [], 'balance_breaks': [], 'boundary_breaks': []}
+    }
+    
+    with ExitStack() as stack:
+        streams = []
+        for index, path in enumerate(ordered):
+            handle = stack.enter_context(open(path, 'r', encoding='utf-8', newline=''))
+            streams.append(_tag_source(read_statement(handle, path), index))
+        
+        output = stack.enter_context(open(output_path, 'w', encoding='utf-8', newline=''))
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(CSV_COLUMNS)
+        
+        current_day = None
+        day_rows = {}
+        prev_balance = None
+        prev_source = None
+        
+        for ordinal, source, transaction in heapq.merge(*streams, key=lambda item: item[0]):
+            if ordinal != current_day:
+                current_day = ordinal
+                day_rows = {}
+            
+            fingerprint = transaction.fingerprint()
+            seen_in = day_rows.setdefault(fingerprint, set())
+            if seen_in and source not in seen_in:
+                _note(report, 'duplicates_removed', f"{transaction.date_text()} {transaction.narration} ({ordered[source]})")
+                continue
+            seen_in.add(source)
+            
+            if transaction.balance is not None and prev_balance is not None:
+                expected = prev_balance + transaction.net_amount
+                if expected != transaction.balance:
+                    kind = 'boundary_breaks' if source != prev_source else 'balance_breaks'
+                    _note(report, kind, f"{transaction.date_text()}: expected {format_amount(expected)}, "
+                                        f"got {format_amount(transaction.balance)} ({ordered[source]})")
+            if transaction.balance is not None:
+                prev_balance = transaction.balance
+                prev_source = source
+            
+            writer.writerow(transaction.to_row())
+            report['rows'] += 1
+    
+    logger.info(f"Consolidated {report['rows']} rows from {report['inputs']} statements into {output_path}")
+    if report['duplicates_removed']:
+        logger.info(f"Removed {report['duplicates_removed']} overlap duplicates")
+    if report['boundary_breaks']:
+        logger.warning(f"Balance does not carry over between statements {report['boundary_breaks']} times: "
+                       f"{report['examples']['boundary_breaks']}")
+    if report['balance_breaks']:
+        logger.warning(f"Balance inconsistencies within statements: {report['balance_breaks']}")
+    return report
+
+def collect_inputs(inputs, output_path=None):
+    """Expand files and directories into CSV paths, excluding the output itself"""
+    paths = []
+    for item in inputs:
+        path = Path(item)
+        paths.extend(sorted(path.glob('*.csv')) if path.is_dir() else [path])
+    output = Path(output_path).resolve() if output_path else None
+    return [path for path in paths if path.resolve() != output]
+
+def main():
+    """Consolidation CLI"""
+    parser = argparse.ArgumentParser(
+        description="Merge per-statement CSV outputs for one account into a chronological ledger",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python consolidate.py outputs/ -o ledger.csv
+  python consolidate.py jan.csv feb.csv mar.csv -o q1.csv --strict
+        """
+    )
+    parser.add_argument('inputs', nargs='+', help='Statement CSV files or directories of them')
+    parser.add_argument('--output', '-o', required=True, help='Path for the consolidated ledger CSV')
+    parser.add_argument('--strict', action='store_true',
+                        help='Exit with an error if the balance breaks between statements')
+    args = parser.parse_args()
+    
+    paths = collect_inputs(args.inputs, args.output)
+    if not paths:
+        print("✗ No statement CSV files found")
+        sys.exit(1)
+    
+    try:
+        report = consolidate(paths, args.output)
+    except (OSError, ValueError) as e:
+        print(f"✗ Consolidation failed: {str(e)}")
+        sys.exit(1)
+    
+    print(f"✓ {report['rows']} rows from {report['inputs']} statements written to {args.output} "
+          f"({report['duplicates_removed']} overlap duplicates removed, "
+          f"{report['boundary_breaks']} balance breaks between statements)")
+    sys.exit(1 if args.strict and report['boundary_breaks'] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 import pandas as pd
 import logging
 import re
+import csv
+from collections import deque
 from datetime import datetime
 from io import StringIO
 
+from transactions import CSV_COLUMNS, parse_amount, parse_date, format_amount, parse_transactions, transactions_to_csv
+from date_normalizer import normalize_transaction_dates
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,12 +27,13 @@ def validate_csv(csv_string):
         'warnings': [],
         'errors': [],
         'row_count': 0,
-        'issues_found': []
+        'issues_found': [],
+        'flagged_rows': []
     }
     
     try:
-        # Read CSV string into DataFrame
-        df = pd.read_csv(StringIO(csv_string))
+        # Read CSV string into DataFrame, keeping amounts as text for exact parsing
+        df = pd.read_csv(StringIO(csv_string), dtype=str)
         validation_report['row_count'] = len(df)
         
         logger.info(f"CSV loaded successfully with {len(df)} rows")
@@ -44,6 +50,9 @@ def validate_csv(csv_string):
         # Validate date format
         date_issues = validate_dates(df, validation_report)
         
+        # Check that dates run in chronological order
+        date_order_issues = validate_date_order(df, validation_report)
+        
         # Check for rows with both Debit and Credit filled
         debit_credit_issues = validate_debit_credit(df, validation_report)
         
@@ -67,7 +76,7 @@ def validate_csv(csv_string):
             logger.info("Validation passed - CSV is clean!")
         
         return df, validation_report
-        
+    
     except Exception as e:
         validation_report['errors'].append(f"Failed to parse CSV: {str(e)}")
         validation_report['is_valid'] = False
@@ -89,6 +98,23 @@ def validate_dates(df, report):
         report['warnings'].append(f"Invalid date formats found: {invalid_dates[:5]}")  # Show first 5
         report['issues_found'].append('date_format')
 
+def validate_date_order(df, report):
+    """Check that transaction dates never go backwards"""
+    out_of_order = []
+    prev_date = None
+    
+    for idx, date_val in df['Date'].items():
+        ordinal = parse_date(date_val) if pd.notna(date_val) else None
+        if ordinal is None:
+            continue
+        if prev_date is not None and ordinal < prev_date:
+            out_of_order.append(f"Row {idx + 1}: '{str(date_val).strip()}'")
+        prev_date = ordinal
+    
+    if out_of_order:
+        report['warnings'].append(f"Dates out of order: {out_of_order[:5]}")
+        report['issues_found'].append('date_order')
+
 def validate_debit_credit(df, report):
     """Check for rows with both Debit and Credit filled"""
     both_filled = []
@@ -99,6 +125,7 @@ def validate_debit_credit(df, report):
         
         if debit and credit:
             both_filled.append(idx + 1)
+            report['flagged_rows'].append(idx)
     
     if both_filled:
         report['errors'].append(f"Rows with both Debit and Credit filled: {both_filled}")
@@ -138,31 +165,100 @@ def validate_numeric_fields(df, report):
             report['warnings'].append(f"Invalid numeric values in {field}: {invalid_values[:3]}")
             report['issues_found'].append(f'invalid_{field.lower()}')
 
+class BalanceChain:
+    """
+    Running-balance check that accepts either statement order
+    
+    Oldest-first rows satisfy balance = previous balance - debit + credit.
+    Newest-first rows satisfy the same relation read upwards, and a break is
+    charged to the newer row whose amounts explain the step. Both readings
+    are checked as rows arrive (constant memory) and the one with fewer
+    breaks is reported, so a consistent statement passes in either order.
+    Ties are settled by the direction the dates run.
+    """
+    __slots__ = ('_previous', '_previous_date', '_date_steps', 'breaks', 'examples', 'flagged', 'max_flagged')
+    
+    MAX_EXAMPLES = 5
+    
+    def __init__(self, max_flagged=None):
+        """
+        Args:
+            max_flagged (int): Flagged row indices kept per order (None for no limit);
+                breaks are still counted past the limit
+        """
+        self.max_flagged = max_flagged
+        self._previous = None
+        self._previous_date = None
+        self._date_steps = {False: 0, True: 0}
+        self.breaks = {False: 0, True: 0}
+        self.examples = {False: [], True: []}
+        self.flagged = {False: [], True: []}
+    
+    def feed(self, idx, balance, debit, credit, ordinal=None):
+        """
+        Check one row's amounts against the previous balance
+        
+        Args:
+            idx (int): Zero-based row index
+            balance, debit, credit (int): Amounts in minor units (None when absent)
+            ordinal (int): The row's date as a day ordinal, if known
+        """
+        if ordinal is not None:
+            if self._previous_date is not None and ordinal != self._previous_date:
+                self._date_steps[ordinal < self._previous_date] += 1
+            self._previous_date = ordinal
+        if balance is None:
+            return
+        if self._previous is not None:
+            prev_idx, prev_balance, prev_debit, prev_credit = self._previous
+            self._check(False, idx, prev_balance - (debit or 0) + (credit or 0), balance)
+            self._check(True, prev_idx, balance - (prev_debit or 0) + (prev_credit or 0), prev_balance)
+        self._previous = (idx, balance, debit, credit)
+    
+    def _check(self, newest_first, idx, expected, actual):
+        if expected == actual:
+            return
+        self.breaks[newest_first] += 1
+        if len(self.examples[newest_first]) < self.MAX_EXAMPLES:
+            self.examples[newest_first].append(f"Row {idx + 1}: Expected {format_amount(expected)}, "
+                                               f"got {format_amount(actual)}")
+        if self.max_flagged is None or len(self.flagged[newest_first]) < self.max_flagged:
+            self.flagged[newest_first].append(idx)
+    
+    @property
+    def newest_first(self):
+        """True if the rows read as a newest-first chain"""
+        if self.breaks[True] != self.breaks[False]:
+            return self.breaks[True] < self.breaks[False]
+        return self._date_steps[True] > self._date_steps[False]
+    
+    def add_to_report(self, report, max_flagged=None):
+        """
+        Add the breaks of the better-fitting order to a validation report
+        
+        Args:
+            report (dict): Validation report to update
+            max_flagged (int): Upper bound on the report's flagged_rows list (None for no limit)
+        """
+        newest_first = self.newest_first
+        if not self.breaks[newest_first]:
+            return
+        flagged = self.flagged[newest_first]
+        if max_flagged is not None:
+            flagged = flagged[:max(0, max_flagged - len(report['flagged_rows']))]
+        report['flagged_rows'].extend(flagged)
+        report['warnings'].append(f"Balance inconsistencies: {self.examples[newest_first][:3]}")
+        report['issues_found'].append('balance_inconsistency')
+
 def validate_balance_consistency(df, report):
-    """Check if running balance makes mathematical sense"""
+    """Check if running balance makes mathematical sense (exact, in minor units, in either row order)"""
     try:
-        inconsistencies = []
-        prev_balance = None
-        
+        chain = BalanceChain()
         for idx, row in df.iterrows():
-            current_balance = parse_numeric_value(row['Balance'])
-            debit = parse_numeric_value(row['Debit'])
-            credit = parse_numeric_value(row['Credit'])
-            
-            if current_balance is not None and prev_balance is not None:
-                expected_balance = prev_balance - (debit or 0) + (credit or 0)
-                difference = abs(expected_balance - current_balance)
-                
-                if difference > 0.01:  # Allow for small rounding differences
-                    inconsistencies.append(f"Row {idx + 1}: Expected {expected_balance:.2f}, got {current_balance:.2f}")
-            
-            if current_balance is not None:
-                prev_balance = current_balance
-        
-        if inconsistencies:
-            report['warnings'].append(f"Balance inconsistencies: {inconsistencies[:3]}")
-            report['issues_found'].append('balance_inconsistency')
-            
+            chain.feed(idx, parse_amount(row['Balance']), parse_amount(row['Debit']), parse_amount(row['Credit']),
+                       parse_date(row['Date']) if pd.notna(row['Date']) else None)
+        chain.add_to_report(report)
+    
     except Exception as e:
         report['warnings'].append(f"Could not validate balance consistency: {str(e)}")
 
@@ -182,22 +278,217 @@ def check_duplicates(df, report):
         report['warnings'].append(f"Potential duplicate transactions: {duplicate_count}")
         report['issues_found'].append('duplicates')
 
-def parse_numeric_value(value):
-    """Parse a value as numeric, return None if not possible"""
-    if pd.isna(value) or str(value).strip() == '':
-        return None
-    try:
-        return float(str(value).strip())
-    except ValueError:
-        return None
+class StreamingValidator:
+    """
+    Validate CSV rows one at a time with constant memory
+    
+    Produces the same report structure as validate_csv but keeps only running
+    state: the last balance (checked in both row orders), a bounded window
+    of recent row fingerprints for duplicate detection, the last date seen
+    for ordering checks and at most MAX_FLAGGED_ROWS flagged row indices.
+    Text can be fed in arbitrary chunks (e.g. straight from a streamed LLM
+    response), so validation can run while the CSV is still being produced.
+    """
+    
+    MAX_EXAMPLES = 5
+    # flagged_rows lists at most this many rows, so a badly broken ledger
+    # cannot grow the report with its length (repair only uses the first few)
+    MAX_FLAGGED_ROWS = 10000
+    
+    def __init__(self, duplicate_window=1000):
+        self.report = {
+            'is_valid': True,
+            'warnings': [],
+            'errors': [],
+            'row_count': 0,
+            'issues_found': [],
+            'flagged_rows': []
+        }
+        self._columns = None
+        self._partial = ''
+        self._balance_chain = BalanceChain(self.MAX_FLAGGED_ROWS)
+        self._unlisted_flags = 0
+        self._prev_date = None
+        self._window = deque(maxlen=duplicate_window)
+        self._seen = {}
+        self._duplicates = 0
+        self._missing = {'Date': 0, 'Balance': 0}
+        self._examples = {
+            'date_format': [], 'date_order': [], 'debit_credit': [],
+            'Debit': [], 'Credit': [], 'Balance': []
+        }
+        self._counts = {name: 0 for name in self._examples}
+    
+    def _note(self, kind, example):
+        self._counts[kind] += 1
+        if len(self._examples[kind]) < self.MAX_EXAMPLES:
+            self._examples[kind].append(example)
+    
+    def feed_text(self, chunk):
+        """Validate every complete line in a chunk of CSV text, buffering the remainder"""
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.feed_line(line)
+    
+    def feed_line(self, line):
+        """Validate one CSV line (header lines, fences and blank lines are handled)"""
+        line = line.strip()
+        if not line or line.startswith('```'):
+            return
+        row = next(csv.reader([line]))
+        if self._columns is None:
+            if 'Date' in row and 'Narration' in row:
+                self._set_header(row)
+            return
+        self.feed_row(row)
+    
+    def _set_header(self, header):
+        self._columns = {name.strip(): i for i, name in enumerate(header)}
+        missing_columns = [col for col in CSV_COLUMNS if col not in self._columns]
+        if missing_columns:
+            self.report['errors'].append(f"Missing required columns: {missing_columns}")
+            self.report['is_valid'] = False
+    
+    def feed_row(self, row):
+        """Validate one data row given as a list of cells"""
+        if self._columns is None:
+            self._set_header(CSV_COLUMNS)
+        
+        idx = self.report['row_count']
+        self.report['row_count'] += 1
+        cell = {name: (row[i].strip() if i < len(row) else '') for name, i in self._columns.items()}
+        
+        # Date format and ordering
+        date_str = cell.get('Date', '')
+        ordinal = parse_date(date_str) if date_str else None
+        if not date_str:
+            self._missing['Date'] += 1
+        elif ordinal is None:
+            self._note('date_format', f"Row {idx + 1}: '{date_str}'")
+        elif self._prev_date is not None and ordinal < self._prev_date:
+            self._note('date_order', f"Row {idx + 1}: '{date_str}'")
+        if ordinal is not None:
+            self._prev_date = ordinal
+        
+        # Debit/Credit conflict
+        if cell.get('Debit') and cell.get('Credit'):
+            self._note('debit_credit', idx + 1)
+            if len(self.report['flagged_rows']) < self.MAX_FLAGGED_ROWS:
+                self.report['flagged_rows'].append(idx)
+            else:
+                self._unlisted_flags += 1
+        
+        # Numeric fields
+        amounts = {}
+        for field in ('Debit', 'Credit', 'Balance'):
+            value = cell.get(field, '')
+            if not value:
+                continue
+            try:
+                float(value)
+                amounts[field] = parse_amount(value)
+            except ValueError:
+                self._note(field, f"Row {idx + 1}: '{value}'")
+        
+        # Running balance (in whichever order the rows turn out to run)
+        if not cell.get('Balance'):
+            self._missing['Balance'] += 1
+        self._balance_chain.feed(idx, amounts.get('Balance'), amounts.get('Debit'), amounts.get('Credit'), ordinal)
+        
+        # Duplicates within the recent window
+        fingerprint = (date_str, cell.get('Narration', ''), cell.get('Debit', ''), cell.get('Credit', ''))
+        if len(self._window) == self._window.maxlen:
+            expired = self._window[0]
+            self._seen[expired] -= 1
+            if not self._seen[expired]:
+                del self._seen[expired]
+        self._window.append(fingerprint)
+        count = self._seen.get(fingerprint, 0) + 1
+        self._seen[fingerprint] = count
+        if count > 1:
+            # Count the first occurrence too, matching validate_csv
+            self._duplicates += 2 if count == 2 else 1
+    
+    def finish(self):
+        """
+        Flush any buffered text and build the final report
+        
+        Returns:
+            dict: Validation report with the same keys as validate_csv's
+        """
+        if self._partial:
+            self.feed_line(self._partial)
+            self._partial = ''
+        
+        report = self.report
+        if self._counts['date_format']:
+            report['warnings'].append(f"Invalid date formats found: {self._examples['date_format']}")
+            report['issues_found'].append('date_format')
+        if self._counts['date_order']:
+            report['warnings'].append(f"Dates out of order: {self._examples['date_order']}")
+            report['issues_found'].append('date_order')
+        if self._counts['debit_credit']:
+            report['errors'].append(f"Rows with both Debit and Credit filled: {self._examples['debit_credit']}"
+                                    + (f" and {self._counts['debit_credit'] - self.MAX_EXAMPLES} more"
+                                       if self._counts['debit_credit'] > self.MAX_EXAMPLES else ''))
+            report['issues_found'].append('debit_credit_conflict')
+            report['is_valid'] = False
+        for col, total_missing in self._missing.items():
+            if total_missing:
+                report['warnings'].append(f"Missing values in {col}: {total_missing} rows")
+                report['issues_found'].append(f'missing_{col.lower()}')
+        for field in ('Debit', 'Credit', 'Balance'):
+            if self._counts[field]:
+                report['warnings'].append(f"Invalid numeric values in {field}: {self._examples[field][:3]}")
+                report['issues_found'].append(f'invalid_{field.lower()}')
+        listed = len(report['flagged_rows'])
+        self._balance_chain.add_to_report(report, self.MAX_FLAGGED_ROWS)
+        chain = self._balance_chain
+        self._unlisted_flags += chain.breaks[chain.newest_first] - (len(report['flagged_rows']) - listed)
+        if self._unlisted_flags:
+            report['warnings'].append(f"{self._unlisted_flags} more flagged rows not listed "
+                                      f"(limit {self.MAX_FLAGGED_ROWS})")
+        if self._duplicates:
+            report['warnings'].append(f"Potential duplicate transactions: {self._duplicates}")
+            report['issues_found'].append('duplicates')
+        
+        total_issues = len(report['warnings']) + len(report['errors'])
+        if total_issues > 0:
+            logger.warning(f"Streaming validation completed with {total_issues} issues")
+        else:
+            logger.info("Streaming validation passed - CSV is clean!")
+        return report
+
+def validate_csv_stream(lines, duplicate_window=1000):
+    """
+    Validate CSV lines from any iterable (file, generator, streamed response) in constant memory
+    
+    Returns:
+        dict: Validation report (same structure as validate_csv)
+    """
+    validator = StreamingValidator(duplicate_window)
+    for line in lines:
+        validator.feed_line(line)
+    return validator.finish()
 
-def save_csv_with_validation(csv_string, output_path, validate=True):
-    """Save CSV string to file with optional validation and automatic fixing"""
+def save_csv_with_validation(csv_string, output_path, validate=True, year_hint=None):
+    """
+    Save CSV string to file with optional validation and automatic fixing
+    
+    Dates are normalized to YYYY-MM-DD locally; year_hint supplies the
+    statement year for date formats that carry none.
+    """
     try:
         # Clean and fix the CSV content first
         cleaned_csv = clean_csv_response(csv_string)
         fixed_csv = fix_incomplete_csv(cleaned_csv)
         
+        # Round-trip through typed transactions to normalize amounts and dates
+        transactions = parse_transactions(fixed_csv)
+        normalize_transaction_dates(transactions, year_hint)
+        fixed_csv = transactions_to_csv(transactions)
+        
         if validate:
             df, report = validate_csv(fixed_csv)
             
@@ -218,7 +509,7 @@ def save_csv_with_validation(csv_string, output_path, validate=True):
             return df, report
         else:
             return True
-            
+    
     except Exception as e:
         logger.error(f"Failed to save CSV: {str(e)}")
         raise
@@ -266,7 +557,7 @@ def fix_incomplete_csv(csv_content):
         line = line.strip()
         if not line:
             continue
-            
+        
         # Skip header
         if i == 0 or 'Date,' in line:
             fixed_lines.append(line)
@@ -0,0 +1,252 @@
+"""
+Date Normalizer Module
+Infers a statement's date format once and converts whole date columns locally
+"""
+
+import logging
+import re
+from datetime import datetime, date
+
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Candidate formats, day-first before month-first so ambiguous samples resolve day-first
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%d-%m-%Y',
+    '%d/%m/%Y',
+    '%d.%m.%Y',
+    '%d-%b-%Y',
+    '%d %b %Y',
+    '%d-%B-%Y',
+    '%d %B %Y',
+    '%d-%m-%y',
+    '%d/%m/%y',
+    '%d.%m.%y',
+    '%d-%b-%y',
+    '%d %b %y',
+    '%Y/%m/%d',
+    '%Y.%m.%d',
+    '%m/%d/%Y',
+    '%m-%d-%Y',
+    '%m/%d/%y',
+    '%b %d, %Y',
+    '%B %d, %Y',
+    '%b %d %Y'
+]
+
+# Formats without a year; the year comes from the statement
+YEARLESS_FORMATS = [
+    '%d %b',
+    '%d-%b',
+    '%d/%m',
+    '%d-%m',
+    '%d.%m',
+    '%b %d',
+    '%m/%d'
+]
+
+# Leap year used as a placeholder while parsing yearless dates, so 29 Feb parses
+PLACEHOLDER_YEAR = 2000
+SAMPLE_SIZE = 50
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_MONTH = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?'
+# A plausible year only where it is part of a date, so '2001 Main St' is not read as one
+_DATED_YEAR_PATTERN = re.compile(
+    r'\b\d{1,2}(?:st|nd|rd|th)?[-/. ]+(?:\d{1,2}|' + _MONTH + r')[-/., ]+(19[5-9]\d|20\d\d)\b'
+    r'|\b' + _MONTH + r' \d{1,2}(?:st|nd|rd|th)?,? (19[5-9]\d|20\d\d)\b'
+    r'|\b(19[5-9]\d|20\d\d)[-/.]\d{1,2}[-/.]\d{1,2}\b',
+    re.IGNORECASE
+)
+_PERIOD_LINE_PATTERN = re.compile(r'period|from|between|\bto\b|\bthrough\b|statement', re.IGNORECASE)
+
+def _clean(value):
+    """Normalize whitespace and case so strptime sees consistent input"""
+    return ' '.join(str(value).replace(',', ', ').split()).replace(' ,', ',').title()
+
+def infer_date_format(samples):
+    """
+    Infer the date format used by a statement from a sample of its dates
+    
+    Args:
+        samples (list): Raw date strings (e.g. '01-Jan-2024', '01/01/24', '2024.01.01')
+    
+    Returns:
+        str: strptime format matching the most samples, or None if none match
+    """
+    cleaned = [_clean(value) for value in samples if value and str(value).strip()][:SAMPLE_SIZE]
+    if not cleaned:
+        return None
+    
+    best_format, best_count = None, 0
+    for fmt in DATE_FORMATS + YEARLESS_FORMATS:
+        count = 0
+        for value in cleaned:
+            try:
+                datetime.strptime(value, fmt)
+                count += 1
+            except ValueError:
+                pass
+        # Strictly greater keeps the earlier (preferred) format on ties
+        if count > best_count:
+            best_format, best_count = fmt, count
+            if count == len(cleaned):
+                break
+    
+    if best_format:
+        logger.info(f"Inferred date format '{best_format}' from {best_count}/{len(cleaned)} samples")
+    return best_format
+
+def _dated_years(text):
+    return [int(next(year for year in match.groups() if year))
+            for match in _DATED_YEAR_PATTERN.finditer(text)]
+
+def infer_statement_year(text_data):
+    """
+    Guess the starting year of a statement from its text
+    
+    The earliest year in the first statement-period line ('Statement period
+    01 Dec 2023 to 31 Jan 2024') is used; failing that, the year of the
+    first full date in the text. Only years inside dates count.
+    
+    Returns:
+        int: Year, or None if no dated year appears in the text
+    """
+    text_data = text_data or ''
+    for line in text_data.splitlines():
+        if _PERIOD_LINE_PATTERN.search(line):
+            years = _dated_years(line)
+            if years:
+                return min(years)
+    years = _dated_years(text_data)
+    return years[0] if years else None
+
+def is_yearless(fmt):
+    """True if the format carries no year"""
+    return fmt is not None and '%Y' not in fmt and '%y' not in fmt
+
+def is_newest_first(parsed):
+    """
+    Detect whether a column of dates runs newest first
+    
+    Steps between consecutive dates are compared by day of year; a step of
+    more than half a year is read as a wrap past the new year, so Dec -> Jan
+    counts as forward and Jan -> Dec as backward.
+    
+    Args:
+        parsed (Series): datetime64 values (placeholder year for yearless formats)
+    
+    Returns:
+        bool: True if backward steps outnumber forward steps
+    """
+    steps = parsed.dropna().dt.dayofyear.diff().dropna()
+    forward = (((steps > 0) & (steps < 183)) | (steps <= -183)).sum()
+    backward = (((steps < 0) & (steps > -183)) | (steps >= 183)).sum()
+    return backward > forward
+
+def normalize_dates(values, fmt=None, year_hint=None):
+    """
+    Convert a whole column of raw dates in one vectorized pass
+    
+    For formats without a year, the earliest date is assigned year_hint
+    (the statement period's start year) and the year changes each time the
+    month wraps around. In oldest-first statements that is the first row and
+    years count forwards (Dec -> Jan); in newest-first ones it is the last
+    row and years count backwards from the first (Jan -> Dec).
+    
+    Args:
+        values: Raw date strings (list or Series)
+        fmt (str): Known format, inferred from the values when omitted
+        year_hint (int): Year of the earliest date for yearless formats (defaults to current year)
+    
+    Returns:
+        Series: datetime64 values, NaT where a value could not be parsed
+    """
+    series = pd.Series(values, dtype=object)
+    present = series.notna() & (series.astype(str).str.strip() != '')
+    cleaned = series.where(present, '').astype(str).map(_clean)
+    
+    fmt = fmt or infer_date_format(cleaned[present].tolist())
+    if fmt is None:
+        return pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    
+    if not is_yearless(fmt):
+        return pd.to_datetime(cleaned.where(present), format=fmt, errors='coerce')
+    
+    parsed = pd.to_datetime((cleaned + f' {PLACEHOLDER_YEAR}').where(present),
+                            format=f'{fmt} %Y', errors='coerce')
+    
+    # Change the year whenever the month wraps around, in the column's direction
+    months = parsed.dt.month
+    previous = months.ffill().shift(1)
+    if is_newest_first(parsed):
+        # Anchor on the last (earliest) row, which falls in the period's start year
+        wrapped = (months > previous).fillna(False).astype(int)
+        years = (year_hint or datetime.now().year) + wrapped.sum() - wrapped.cumsum()
+    else:
+        wrapped = (months < previous).fillna(False).astype(int)
+        years = (year_hint or datetime.now().year) + wrapped.cumsum()
+    
+    return pd.to_datetime(
+        pd.DataFrame({'year': years, 'month': months, 'day': parsed.dt.day}),
+        errors='coerce'
+    ).where(parsed.notna())
+
+def normalize_in_passes(values, year_hint=None, passes=2):
+    """
+    Normalize raw dates, re-inferring the format for values the first format missed
+    
+    The extra pass covers statements that mix two date formats.
+    
+    Returns:
+        Series: datetime64 values aligned with the input, NaT where unparsed
+    """
+    series = pd.Series(values, dtype=object).reset_index(drop=True)
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    remaining = series.notna() & (series.astype(str).str.strip() != '')
+    
+    for _ in range(passes):
+        if not remaining.any():
+            break
+        parsed = normalize_dates(series[remaining], year_hint=year_hint)
+        parsed = parsed[parsed.notna()]
+        if parsed.empty:
+            break
+        result[parsed.index] = parsed
+        remaining[parsed.index] = False
+    
+    return result
+
+def normalize_transaction_dates(transactions, year_hint=None):
+    """
+    Fill in day ordinals for transactions whose dates were not in YYYY-MM-DD
+    
+    Args:
+        transactions (list): Transaction objects (modified in place)
+        year_hint (int): Statement start year for yearless formats
+    
+    Returns:
+        int: Number of dates that remain unparsed
+    """
+    pending = [t for t in transactions if t.date is None and t.raw_date]
+    if not pending:
+        return 0
+    
+    parsed = normalize_in_passes([t.raw_date for t in pending], year_hint)
+    parsed = parsed[parsed.notna()]
+    days = parsed.values.astype('datetime64[D]').astype('int64') + _EPOCH_ORDINAL
+    
+    for position, ordinal in zip(parsed.index, days):
+        pending[position].date = int(ordinal)
+        pending[position].raw_date = None
+    
+    unparsed = len(pending) - len(parsed)
+    if unparsed:
+        logger.warning(f"{unparsed} dates could not be normalized to YYYY-MM-DD")
+    else:
+        logger.info(f"Normalized {len(pending)} dates locally")
+    return unparsed
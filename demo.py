@@ -9,10 +9,11 @@ import sys
 from pathlib import Path
 
 # Import our modules
-from pdf_extractor import extract_text_from_pdf
+from pdf_extractor import extract_pages, format_plain_text, format_layout_text
 from llm_parser import parse_with_gemini
 from csv_handler import save_csv_with_validation
 from prompts import BANK_STATEMENT_PROMPT
+from date_normalizer import infer_statement_year
 
 def run_demo():
     """Run a complete demonstration of the parser"""
@@ -42,8 +43,10 @@ def run_demo():
     try:
         # Step 1: Extract text
         print("Step 1: Extracting text from PDF...")
-        text_data = extract_text_from_pdf(input_file)
-        print(f"✓ Extracted {len(text_data)} characters")
+        pages = extract_pages(input_file)
+        text_data = format_plain_text(pages)
+        layout_data = format_layout_text(pages)
+        print(f"✓ Extracted {len(text_data)} characters ({len(layout_data)} with layout) from {len(pages)} pages")
         
         # Step 2: Parse with AI
         print("\nStep 2: Parsing with Google Gemini...")
@@ -61,14 +64,15 @@ def run_demo():
         # Ensure outputs directory exists
         Path("outputs").mkdir(exist_ok=True)
         
-        save_csv_with_validation(csv_result, output_file)
+        save_csv_with_validation(csv_result, output_file, year_hint=infer_statement_year(text_data))
         print(f"✓ Saved to {output_file}")
         
         # Show sample results
         print("\nSample output (first 5 rows):")
         print("-" * 50)
         
-        lines = csv_result.split('\n')
+        # Read back the saved file so the sample shows normalized dates
+        lines = Path(output_file).read_text(encoding='utf-8').split('\n')
         for i, line in enumerate(lines[:6]):  # Header + 5 data rows
             print(line)
         
@@ -0,0 +1,353 @@
+"""
+Hybrid Parsing Module
+Builds row skeletons from extracted tables and asks the LLM only for the ambiguous fields
+"""
+
+import json
+import logging
+import os
+import re
+
+from llm_parser import parse_with_gemini, DEFAULT_MODEL_NAME
+from prompts import HYBRID_FIELDS_PROMPT
+from transactions import Transaction, format_amount, parse_amount, transactions_to_csv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Ambiguous rows sent per request
+HYBRID_BATCH_ROWS = int(os.getenv('HYBRID_BATCH_ROWS', '100'))
+
+# A date cell, optionally followed by a time of day (which is dropped)
+DATE_CELL = re.compile(r'^\s*(\d{1,4}[/\-. ](?:\d{1,2}|[A-Za-z]{3,9})(?:[/\-. ]\d{2,4})?|[A-Za-z]{3,9} \d{1,2}(?:, ?\d{4})?)'
+                       r'(?:\s+\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AaPp][Mm])?)?\s*$')
+DATE_LINE = re.compile(r'^\s*(\d{1,2}[/\-. ](\d{1,2}|[A-Za-z]{3})[/\-. ]\d{2,4}|\d{4}-\d{2}-\d{2})\b')
+AMOUNT = re.compile(r'\d[\d,]*\.\d{2}\b')
+SIDE_SUFFIX = re.compile(r'^(.*?)\s*\b(dr|cr)\.?$', re.IGNORECASE)
+CHEQUE_MENTION = re.compile(r'\b(chq|cheque|check)\b', re.IGNORECASE)
+
+# Request keys for the fields the model may be asked to resolve
+FIELD_KEYS = {'narration': 'n', 'cheque_no': 'c', 'side': 's'}
+
+class RowSkeleton:
+    """
+    One transaction assembled locally from table cells
+    
+    amount holds a value whose side (debit or credit) is not yet known;
+    needs lists the fields that must be resolved by the model.
+    """
+    __slots__ = ('row_id', 'date', 'cheque_no', 'narration', 'debit', 'credit', 'balance', 'amount',
+                 'lines', 'needs')
+    
+    def __init__(self, row_id, date, lines):
+        self.row_id = row_id
+        self.date = date
+        self.cheque_no = ''
+        self.narration = ''
+        self.debit = None
+        self.credit = None
+        self.balance = None
+        self.amount = None
+        self.lines = lines
+        self.needs = set()
+    
+    def to_transaction(self):
+        return Transaction.from_row([
+            self.date, self.cheque_no, self.narration,
+            format_amount(self.debit), format_amount(self.credit), format_amount(self.balance)
+        ], self.row_id)
+
+def _clean_cell(cell):
+    return ' '.join(str(cell).split()) if cell else ''
+
+def column_role(name):
+    """Map a table header cell to the skeleton field it holds (or None)"""
+    name = re.sub(r'[^a-z/ ]', ' ', name.lower())
+    name = ' '.join(name.split())
+    words = set(name.replace('/', ' ').split())
+    
+    if 'balance' in words:
+        return 'balance'
+    if 'date' in words:
+        return 'date'
+    if words & {'chq', 'cheque', 'check'}:
+        return 'cheque_no'
+    if words & {'narration', 'description', 'particulars', 'details', 'remarks'}:
+        return 'narration'
+    if name in ('dr/cr', 'cr/dr', 'dr cr', 'cr dr', 'type'):
+        return 'side'
+    if words & {'debit', 'debits', 'withdrawal', 'withdrawals', 'dr'} or name == 'paid out':
+        return 'debit'
+    if words & {'credit', 'credits', 'deposit', 'deposits', 'cr'} or name == 'paid in':
+        return 'credit'
+    if 'amount' in words:
+        return 'amount'
+    return None
+
+def find_column_map(row):
+    """
+    Recognize a transaction table header
+    
+    Returns:
+        dict: field -> column index, or None if the row is not a usable header
+    """
+    columns = {}
+    for index, cell in enumerate(row):
+        role = column_role(_clean_cell(cell)) if cell else None
+        if role and role not in columns:
+            columns[role] = index
+    
+    has_amounts = ('debit' in columns and 'credit' in columns) or 'amount' in columns
+    if 'date' in columns and 'balance' in columns and has_amounts:
+        return columns
+    return None
+
+def amount_with_side(cell):
+    """
+    Parse an amount cell that may carry a Dr/Cr marker
+    
+    Returns:
+        tuple: (minor units or None, 'D', 'C' or None)
+    """
+    text = _clean_cell(cell)
+    match = SIDE_SUFFIX.match(text)
+    if match:
+        return parse_amount(match.group(1)), match.group(2).upper()[0]
+    return parse_amount(text), None
+
+def _cell(row, columns, field):
+    index = columns.get(field)
+    return row[index] if index is not None and index < len(row) else None
+
+def _fill_row(skeleton, row, columns):
+    """Read the known fields of a dated table row into its skeleton"""
+    skeleton.narration = _clean_cell(_cell(row, columns, 'narration'))
+    skeleton.cheque_no = _clean_cell(_cell(row, columns, 'cheque_no'))
+    
+    balance, balance_side = amount_with_side(_cell(row, columns, 'balance'))
+    if balance is not None and balance_side == 'D':
+        balance = -abs(balance)
+    skeleton.balance = balance
+    
+    if 'amount' in columns:
+        amount, side = amount_with_side(_cell(row, columns, 'amount'))
+        side_cell = _clean_cell(_cell(row, columns, 'side')).upper()
+        side = side or (side_cell[0] if side_cell[:1] in ('D', 'C') else None)
+        if amount is not None and amount < 0:
+            amount, side = -amount, side or 'D'
+        skeleton.amount = amount
+        if side == 'D':
+            skeleton.debit, skeleton.amount = amount, None
+        elif side == 'C':
+            skeleton.credit, skeleton.amount = amount, None
+    else:
+        debit, _ = amount_with_side(_cell(row, columns, 'debit'))
+        credit, _ = amount_with_side(_cell(row, columns, 'credit'))
+        # Some statements print 0.00 in the unused column
+        skeleton.debit = debit or None
+        skeleton.credit = credit or None
+    
+    if 'cheque_no' not in columns and CHEQUE_MENTION.search(skeleton.narration):
+        skeleton.needs.add('cheque_no')
+
+def count_transaction_lines(text):
+    """Count text lines that start with a full date and carry an amount after it"""
+    count = 0
+    for line in (text or '').split('\n'):
+        match = DATE_LINE.match(line)
+        if match and AMOUNT.search(line, match.end()):
+            count += 1
+    return count
+
+def build_skeletons(pages):
+    """
+    Assemble transaction rows from the pages' extracted tables
+    
+    A table header fixes the column roles; headerless tables with the same
+    number of columns (continuation pages) reuse the last header. Rows
+    without a date are wrapped narration lines and are attached to the
+    previous row, whose narration is then left to the model.
+    
+    Every page's table rows are checked against the transaction lines in
+    its text, so a row lost to a misaligned table (a different cell count,
+    an unreadable date cell) sends the statement to full parsing instead of
+    silently disappearing.
+    
+    Args:
+        pages (list): PageExtraction objects
+    
+    Returns:
+        list: RowSkeleton objects, or None when the tables do not cover the
+            statement (no recognizable header, or pages with fewer table rows
+            than transaction lines)
+    """
+    skeletons = []
+    columns = None
+    width = None
+    
+    for extraction in pages:
+        page_rows = 0
+        for table in extraction.tables:
+            for row in table:
+                if not row or not any(row):
+                    continue
+                header = find_column_map(row)
+                if header:
+                    columns, width = header, len(row)
+                    continue
+                if columns is None or len(row) != width:
+                    continue
+                
+                date_match = DATE_CELL.match(_clean_cell(_cell(row, columns, 'date')))
+                text = ' | '.join(_clean_cell(cell) for cell in row if cell)
+                if date_match:
+                    skeleton = RowSkeleton(len(skeletons) + 1, date_match.group(1), [text])
+                    _fill_row(skeleton, row, columns)
+                    skeletons.append(skeleton)
+                    page_rows += 1
+                elif skeletons and page_rows:
+                    # Wrapped narration; anything more is for the model to judge
+                    skeletons[-1].lines.append(text)
+                    skeletons[-1].needs.add('narration')
+        
+        transaction_lines = count_transaction_lines(extraction.text)
+        if transaction_lines > page_rows:
+            logger.info(f"Page {extraction.page_number} has {transaction_lines} transaction lines but only "
+                        f"{page_rows} table rows")
+            return None
+    
+    if not skeletons:
+        return None
+    
+    resolve_sides(skeletons)
+    return skeletons
+
+def resolve_sides(skeletons):
+    """Place single-column amounts as debit or credit from the balance movement where possible"""
+    prev_balance = None
+    for skeleton in skeletons:
+        if skeleton.amount is not None:
+            delta = skeleton.balance - prev_balance if None not in (skeleton.balance, prev_balance) else None
+            if delta == skeleton.amount:
+                skeleton.credit, skeleton.amount = skeleton.amount, None
+            elif delta == -skeleton.amount:
+                skeleton.debit, skeleton.amount = skeleton.amount, None
+            else:
+                skeleton.needs.add('side')
+        if skeleton.balance is not None:
+            prev_balance = skeleton.balance
+
+def build_fields_request(batch):
+    """Describe ambiguous rows as JSON lines for HYBRID_FIELDS_PROMPT"""
+    lines = []
+    for skeleton in batch:
+        lines.append(json.dumps({
+            'id': skeleton.row_id,
+            'need': sorted(FIELD_KEYS[field] for field in skeleton.needs),
+            'date': skeleton.date,
+            'amount': format_amount(skeleton.amount if skeleton.amount is not None else (skeleton.debit or skeleton.credit)),
+            'balance': format_amount(skeleton.balance),
+            'lines': skeleton.lines
+        }, ensure_ascii=False))
+    return '\n'.join(lines)
+
+def decode_fields_response(response):
+    """Parse the model's JSON answer (tolerating a markdown fence)"""
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', response.strip())
+    answers = json.loads(text)
+    if not isinstance(answers, dict):
+        raise ValueError("expected a JSON object keyed by row id")
+    return answers
+
+def apply_answers(skeletons_by_id, answers):
+    """
+    Merge resolved fields into their rows
+    
+    Returns:
+        int: Fields applied
+    """
+    applied = 0
+    for row_id, fields in answers.items():
+        skeleton = skeletons_by_id.get(str(row_id))
+        if skeleton is None or not isinstance(fields, dict):
+            continue
+        if 'narration' in skeleton.needs and isinstance(fields.get('n'), str):
+            skeleton.narration = _clean_cell(fields['n'])
+            skeleton.needs.discard('narration')
+            applied += 1
+        if 'cheque_no' in skeleton.needs and isinstance(fields.get('c'), str):
+            skeleton.cheque_no = _clean_cell(fields['c'])
+            skeleton.needs.discard('cheque_no')
+            applied += 1
+        side = str(fields.get('s', '')).upper()[:1]
+        if 'side' in skeleton.needs and side in ('D', 'C') and skeleton.amount is not None:
+            if side == 'D':
+                skeleton.debit = skeleton.amount
+            else:
+                skeleton.credit = skeleton.amount
+            skeleton.amount = None
+            skeleton.needs.discard('side')
+            applied += 1
+    return applied
+
+def resolve_ambiguous(skeletons, binding=None, batch_rows=HYBRID_BATCH_ROWS, model_name=DEFAULT_MODEL_NAME):
+    """
+    Ask the model only for the fields that could not be settled locally
+    
+    Rows the model does not answer keep their local values: wrapped
+    narration lines are joined, and amounts with an unknown side are left
+    out so the balance check flags them for repair.
+    
+    Args:
+        skeletons (list): RowSkeleton objects from build_skeletons
+        binding (dict): Optional prompt binding for the field-resolution model
+        batch_rows (int): Ambiguous rows per request
+        model_name (str): Model for field resolution when no binding is given
+    
+    Returns:
+        dict: Counts of 'rows', 'ambiguous_rows', 'requests' and 'fields_applied'
+    """
+    ambiguous = [skeleton for skeleton in skeletons if skeleton.needs]
+    stats = {'rows': len(skeletons), 'ambiguous_rows': len(ambiguous), 'requests': 0, 'fields_applied': 0}
+    by_id = {str(skeleton.row_id): skeleton for skeleton in ambiguous}
+    
+    for start in range(0, len(ambiguous), max(1, batch_rows)):
+        batch = ambiguous[start:start + batch_rows]
+        stats['requests'] += 1
+        try:
+            response = parse_with_gemini(build_fields_request(batch), HYBRID_FIELDS_PROMPT, binding=binding,
+                                         generation_config={'response_mime_type': 'application/json'},
+                                         model_name=model_name)
+            stats['fields_applied'] += apply_answers(by_id, decode_fields_response(response or '{}'))
+        except Exception as e:
+            logger.warning(f"Field resolution for rows {batch[0].row_id}-{batch[-1].row_id} failed: {str(e)}")
+    
+    for skeleton in ambiguous:
+        if 'narration' in skeleton.needs:
+            skeleton.narration = ' '.join([skeleton.narration] + [line.replace(' | ', ' ') for line in skeleton.lines[1:]]).strip()
+    
+    logger.info(f"Hybrid mode: {stats['rows']} rows built from tables, {stats['ambiguous_rows']} sent for "
+                f"field resolution in {stats['requests']} requests ({stats['fields_applied']} fields resolved)")
+    return stats
+
+def parse_hybrid(pages, binding=None, model_name=DEFAULT_MODEL_NAME):
+    """
+    Parse a statement from its extracted tables, using the model only for ambiguous fields
+    
+    Args:
+        pages (list): PageExtraction objects
+        binding (dict): Optional prompt binding for the field-resolution model
+        model_name (str): Model for field resolution when no binding is given
+    
+    Returns:
+        str: CSV string, or None when the tables do not cover the statement
+            (the caller should fall back to full LLM parsing)
+    """
+    skeletons = build_skeletons(pages)
+    if skeletons is None:
+        logger.info("Tables do not cover the statement, hybrid mode not applicable")
+        return None
+    
+    resolve_ambiguous(skeletons, binding, model_name=model_name)
+    return transactions_to_csv([skeleton.to_transaction() for skeleton in skeletons])
@@ -0,0 +1,255 @@
+"""
+Worker Isolation Module
+Runs each document in a recyclable child process with a wall-clock deadline
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DOC_TIMEOUT = float(os.getenv('BATCH_DOC_TIMEOUT', '600'))
+MAX_TASKS_PER_WORKER = int(os.getenv('BATCH_MAX_TASKS_PER_WORKER', '50'))
+MAX_WORKER_RSS_MB = int(os.getenv('BATCH_MAX_WORKER_RSS_MB', '1024'))
+# Seconds a recycled or stopped child gets to exit before it is killed
+REAP_TIMEOUT = 5
+
+class DocumentTimeout(Exception):
+    """A document exceeded its deadline and its worker was killed"""
+
+class WorkerCrashed(Exception):
+    """The worker process died while handling a document (crash or OOM kill)"""
+
+def current_rss_mb():
+    """
+    Resident memory of this process in MB
+    
+    Reads /proc where available; elsewhere falls back to the peak RSS
+    reported by getrusage, which only ever grows and so errs towards recycling.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if peak > 1 << 32 else peak / 1024
+
+def merge_counters(totals, current, previous):
+    """
+    Add the growth of one child's cumulative counters to the running totals
+    
+    Counters are nested dicts of numbers; keys ending in '_max' keep the
+    largest value seen instead of being summed.
+    
+    Args:
+        totals (dict): Running totals, updated in place
+        current (dict): The child's latest cumulative counters
+        previous (dict): The child's counters at its previous reply ({} for a new child)
+    """
+    for key, value in current.items():
+        if isinstance(value, dict):
+            merge_counters(totals.setdefault(key, {}), value, previous.get(key, {}))
+        elif key.endswith('_max'):
+            totals[key] = max(totals.get(key, 0), value)
+        else:
+            totals[key] = totals.get(key, 0) + value - previous.get(key, 0)
+
+def _serve(conn, process, max_tasks, max_rss_mb, collect_stats=None):
+    """
+    Child process loop: run documents until told to stop or due for recycling
+    
+    Each reply is (status, value, recycle, rss_mb, counters), counters being
+    collect_stats()'s cumulative snapshot (or None); the child exits right
+    after a reply with recycle set.
+    """
+    # Own process group, so a kill also takes down OCR workers started by this child
+    # (the child is not daemonic precisely so it may start that pool)
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    
+    tasks = 0
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        
+        try:
+            status, value = 'ok', process(*task)
+        except Exception as e:
+            status, value = 'error', f"{type(e).__name__}: {str(e)}"
+        
+        tasks += 1
+        rss_mb = current_rss_mb()
+        recycle = bool((max_tasks and tasks >= max_tasks) or (max_rss_mb and rss_mb >= max_rss_mb))
+        counters = collect_stats() if collect_stats else None
+        conn.send((status, value, recycle, rss_mb, counters))
+        if recycle:
+            return
+
+class IsolatedProcess:
+    """
+    Callable wrapper that runs process(input_path, output_path) in a child process
+    
+    The child is reused across documents and replaced after max_tasks
+    documents, once its resident memory passes max_rss_mb, or when it has to
+    be killed. A document that runs past the deadline gets its worker (and
+    the worker's process group) killed and raises DocumentTimeout, so one
+    pathological PDF cannot hang or bloat the batch worker.
+    
+    The child is non-daemonic so it can run the OCR process pool; close() is
+    registered with atexit while a child is running so it is never left behind.
+    
+    Per-process state starts afresh in every new child. The RPM/TPM buckets
+    of scheduler.get_scheduler() start empty for this reason, so a recycled
+    worker does not admit a fresh burst on top of what its predecessor just
+    spent. Use collect_stats to carry the child's metrics back: its
+    snapshot travels with each reply and the growth is summed into
+    counters, so counters span all children (work done after a child's
+    last reply is lost when it is killed).
+    """
+    
+    def __init__(self, process, deadline=DOC_TIMEOUT, max_tasks=MAX_TASKS_PER_WORKER,
+                 max_rss_mb=MAX_WORKER_RSS_MB, collect_stats=None):
+        """
+        Args:
+            process (callable): Picklable process(input_path, output_path) -> bool
+            deadline (float): Wall-clock seconds allowed per document (0 for none)
+            max_tasks (int): Documents per child before it is replaced (0 for no limit)
+            max_rss_mb (int): Resident memory after which the child is replaced (0 for no limit)
+            collect_stats (callable): Picklable function run in the child after each
+                document, returning cumulative counters (nested dicts of numbers)
+        """
+        self.process = process
+        self.deadline = deadline
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self.collect_stats = collect_stats
+        self._context = multiprocessing.get_context('spawn')
+        self._conn = None
+        self._child = None
+        self._child_counters = {}
+        self.stats = {'documents': 0, 'timeouts': 0, 'crashes': 0, 'recycled': 0}
+        self.counters = {}
+    
+    def _start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        self._child = self._context.Process(
+            target=_serve,
+            args=(child_conn, self.process, self.max_tasks, self.max_rss_mb, self.collect_stats),
+            daemon=False
+        )
+        self._child_counters = {}
+        self._child.start()
+        child_conn.close()
+        self._conn = parent_conn
+        atexit.register(self.close)
+    
+    def _kill(self):
+        """Kill the child and its process group"""
+        if self._child is None:
+            return
+        # The group can outlive a crashed child (orphaned OCR workers), so signal it regardless
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self._child.pid, signal.SIGKILL)
+            elif self._child.is_alive():
+                self._child.kill()
+        except (ProcessLookupError, PermissionError):
+            if self._child.is_alive():
+                self._child.kill()
+        self._child.join()
+        self._release()
+    
+    def _reap(self):
+        """Wait for a child that is exiting on its own, killing it if it lingers"""
+        self._child.join(timeout=REAP_TIMEOUT)
+        if self._child.is_alive():
+            self._kill()
+        else:
+            self._release()
+    
+    def _release(self):
+        self._conn.close()
+        self._child = self._conn = None
+        atexit.unregister(self.close)
+    
+    def __call__(self, input_path, output_path):
+        """
+        Process one document in the child
+        
+        Raises:
+            DocumentTimeout: The deadline passed and the child was killed
+            WorkerCrashed: The child died without replying
+            RuntimeError: process raised inside the child
+        """
+        if self._child is None or not self._child.is_alive():
+            if self._child is not None:
+                self._reap()
+            self._start()
+        
+        self.stats['documents'] += 1
+        started = time.monotonic()
+        self._conn.send((input_path, output_path))
+        
+        if not self._conn.poll(self.deadline or None):
+            self.stats['timeouts'] += 1
+            self._kill()
+            raise DocumentTimeout(f"{os.path.basename(input_path)} exceeded the {self.deadline:.0f}s deadline")
+        
+        try:
+            status, value, recycle, rss_mb, counters = self._conn.recv()
+        except (EOFError, ConnectionError):
+            self.stats['crashes'] += 1
+            self._child.join(timeout=1)
+            exit_code = self._child.exitcode
+            self._kill()
+            raise WorkerCrashed(f"Worker died while processing {os.path.basename(input_path)} (exit code {exit_code})")
+        
+        if counters:
+            merge_counters(self.counters, counters, self._child_counters)
+            self._child_counters = counters
+        
+        if recycle:
+            self.stats['recycled'] += 1
+            logger.info(f"Recycling document worker after {time.monotonic() - started:.1f}s task "
+                        f"(RSS {rss_mb:.0f} MB)")
+            self._reap()
+        
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
+    
+    def close(self):
+        """Stop the child process"""
+        if self._child is None:
+            return
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._reap()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -4,10 +4,20 @@ Handles intelligent parsing of bank statement text using Google Gemini 2.0 Flash
 """
 
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+import datetime
+import hashlib
 import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 import logging
 
+from scheduler import get_scheduler
+
 # Load environment variables
 load_dotenv()
 
@@ -15,10 +25,78 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def configure_gemini():
+DEFAULT_MODEL_NAME = 'gemini-2.0-flash-exp'
+
+# Static prompts are uploaded once as cached content and reused until the TTL expires
+PROMPT_CACHE_ENABLED = os.getenv('GEMINI_PROMPT_CACHE', '1') != '0'
+PROMPT_CACHE_TTL = int(os.getenv('GEMINI_PROMPT_CACHE_TTL', '3600'))
+
+_prompt_bindings = {}
+_bindings_lock = threading.Lock()
+
+_token_usage = {
+    'requests': 0,
+    'prompt_tokens': 0,
+    'cached_tokens': 0,
+    'output_tokens': 0,
+    'static_prompt_tokens': 0
+}
+# The same counters per model name, so tiers of a model ladder can be costed separately
+_model_usage = {}
+_usage_lock = threading.Lock()
+
+# Request deadlines, retries and hedging
+REQUEST_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '120'))
+TOTAL_DEADLINE = float(os.getenv('GEMINI_TOTAL_DEADLINE', '600'))
+MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '3'))
+RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', '1.0'))
+RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', '30'))
+# Retries may add at most this fraction of extra load on top of first attempts
+RETRY_BUDGET_RATIO = float(os.getenv('GEMINI_RETRY_BUDGET', '0.2'))
+RETRY_BUDGET_MIN = 10
+HEDGE_ENABLED = os.getenv('GEMINI_HEDGE', '0') == '1'
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout
+)
+
+# Calls run on a shared pool so a stuck request can be abandoned at its deadline
+_request_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GEMINI_MAX_CONCURRENCY', '16')),
+    thread_name_prefix='gemini-request'
+)
+_latencies = deque(maxlen=500)
+_request_stats = {
+    'requests': 0,
+    'attempts': 0,
+    'retries': 0,
+    'timeouts': 0,
+    'hedged': 0,
+    'hedge_wins': 0,
+    'hedges_skipped': 0
+}
+_stats_lock = threading.Lock()
+
+class GeminiRequestError(Exception):
+    """Raised when a Gemini request fails after deadlines and retries are exhausted"""
+
+def configure_gemini(system_instruction=None, model_name=DEFAULT_MODEL_NAME):
     """
     Configure the Gemini API with the API key from environment variables
     
+    Args:
+        system_instruction (str): Optional static instructions attached to the model
+        model_name (str): Gemini model to use
+        
     Returns:
         GenerativeModel: Configured Gemini model instance
         
@@ -30,31 +108,413 @@ def configure_gemini():
         raise ValueError("GEMINI_API_KEY not found in environment variables. Please add it to your .env file.")
     
     genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-2.0-flash-exp')
+    if system_instruction:
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+    return genai.GenerativeModel(model_name)
 
-def parse_with_gemini(text_data, prompt):
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token) used when the API reports no usage"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+def make_binding(model, prompt, mode='inline', expires_at=None, model_name=None):
+    """
+    Pair a model with the static prompt it should be used with
+    
+    Args:
+        model: Object exposing generate_content() - a Gemini model or a local stand-in
+        prompt (str): Static parsing instructions
+        mode (str): 'cached' (prompt lives in cached content), 'system' (prompt is
+            the model's system instruction) or 'inline' (prompt is prepended to every request)
+        expires_at (float): Epoch time after which the binding must be recreated
+        model_name (str): Model the binding targets, used to attribute token usage
+        
+    Returns:
+        dict: Prompt binding consumed by parse_with_gemini
+    """
+    return {
+        'model': model,
+        'mode': mode,
+        'prompt': prompt,
+        'prompt_tokens': estimate_tokens(prompt),
+        'expires_at': expires_at,
+        'model_name': model_name
+    }
+
+def bind_prompt(prompt, model_name=DEFAULT_MODEL_NAME):
+    """
+    Get a model with the static prompt attached once and reused by later calls
+    
+    Explicit context caching is tried first. If caching is disabled, unsupported by
+    the installed SDK or rejected by the API (e.g. prompt below the minimum cacheable
+    size), the prompt is attached as a system instruction instead, and as a last
+    resort it is sent inline with every request.
+    
+    Args:
+        prompt (str): Static parsing instructions
+        model_name (str): Gemini model to use
+        
+    Returns:
+        dict: Prompt binding (see make_binding)
+    """
+    key = (model_name, hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+    
+    with _bindings_lock:
+        binding = _prompt_bindings.get(key)
+        if binding and (binding['expires_at'] is None or binding['expires_at'] > time.time()):
+            return binding
+        
+        configure_gemini()
+        binding = None
+        
+        if PROMPT_CACHE_ENABLED:
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=model_name,
+                    display_name=f"statement-prompt-{key[1][:12]}",
+                    system_instruction=prompt,
+                    ttl=datetime.timedelta(seconds=PROMPT_CACHE_TTL)
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                # Refresh a minute early so in-flight requests never hit an expired cache
+                binding = make_binding(model, prompt, 'cached', time.time() + PROMPT_CACHE_TTL - 60, model_name)
+                logger.info(f"Static prompt cached as {cached.name}")
+            except Exception as e:
+                logger.info(f"Context caching unavailable, using system instruction: {str(e)}")
+        
+        if binding is None:
+            try:
+                binding = make_binding(configure_gemini(prompt, model_name), prompt, 'system',
+                                       model_name=model_name)
+            except TypeError:
+                binding = make_binding(configure_gemini(model_name=model_name), prompt, 'inline',
+                                       model_name=model_name)
+        
+        _prompt_bindings[key] = binding
+        return binding
+
+def build_request(binding, text_data):
+    """Build the per-call request contents for a prompt binding"""
+    if binding['mode'] == 'inline':
+        return f"{binding['prompt']}\n\nBank Statement Text to Parse:\n{text_data}"
+    return f"Bank Statement Text to Parse:\n{text_data}"
+
+def record_usage(binding, request_text, response):
+    """
+    Add a response's token usage to the running totals
+    
+    Uses the API's usage metadata when available and falls back to estimates.
+    
+    Returns:
+        dict: Token usage of this single request
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    static_tokens = binding['prompt_tokens']
+    
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    if not prompt_tokens:
+        prompt_tokens = estimate_tokens(request_text)
+        if binding['mode'] != 'inline':
+            prompt_tokens += static_tokens
+    
+    cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+    if usage is None and binding['mode'] == 'cached':
+        cached_tokens = static_tokens
+    
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    if not output_tokens:
+        output_tokens = estimate_tokens(getattr(response, 'text', '') or '')
+    
+    request_usage = {
+        'prompt_tokens': prompt_tokens,
+        'cached_tokens': cached_tokens,
+        'output_tokens': output_tokens,
+        'static_prompt_tokens': static_tokens
+    }
+    
+    with _usage_lock:
+        model_usage = _model_usage.setdefault(binding.get('model_name'), dict.fromkeys(_token_usage, 0))
+        for totals in (_token_usage, model_usage):
+            totals['requests'] += 1
+            for name, count in request_usage.items():
+                totals[name] += count
+    
+    return request_usage
+
+def get_token_usage():
+    """
+    Get cumulative token usage for this process
+    
+    Returns:
+        dict: Totals plus 'uncached_prompt_tokens' (prompt tokens actually processed)
+            and 'cache_savings' (fraction of prompt tokens served from cache)
+    """
+    with _usage_lock:
+        usage = dict(_token_usage)
+    
+    usage['uncached_prompt_tokens'] = usage['prompt_tokens'] - usage['cached_tokens']
+    usage['cache_savings'] = usage['cached_tokens'] / usage['prompt_tokens'] if usage['prompt_tokens'] else 0.0
+    return usage
+
+def get_model_usage():
+    """
+    Get cumulative token usage per model name for this process
+    
+    Returns:
+        dict: {model name: totals as in get_token_usage (without the derived fields)};
+            bindings made without a model name are counted under None
+    """
+    with _usage_lock:
+        return {model_name: dict(usage) for model_name, usage in _model_usage.items()}
+
+def reset_token_usage():
+    """Reset the cumulative token usage counters"""
+    with _usage_lock:
+        for name in _token_usage:
+            _token_usage[name] = 0
+        _model_usage.clear()
+
+def latency_percentile(percentile):
+    """
+    Get a percentile of recently observed successful request latencies
+    
+    Returns:
+        float: Latency in seconds, or None if too few requests have been observed
+    """
+    with _stats_lock:
+        samples = sorted(_latencies)
+    
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(percentile * len(samples)))]
+
+def get_request_stats():
+    """Get counters for attempts, retries, timeouts and hedged requests"""
+    with _stats_lock:
+        stats = dict(_request_stats)
+    stats['p95_latency'] = latency_percentile(0.95)
+    stats['p99_latency'] = latency_percentile(0.99)
+    return stats
+
+def reset_request_stats():
+    """Reset request counters and the observed latency window"""
+    with _stats_lock:
+        for name in _request_stats:
+            _request_stats[name] = 0
+        _latencies.clear()
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _request_stats[name] += amount
+
+def _timed_call(model, contents, timeout, kwargs):
+    """Run one generate_content call and record its latency on success"""
+    started = time.monotonic()
+    response = model.generate_content(contents, request_options={'timeout': timeout}, **kwargs)
+    with _stats_lock:
+        _latencies.append(time.monotonic() - started)
+    return response
+
+def call_with_deadline(model, contents, timeout=None, hedge=None, scheduler=None, tokens=0, **kwargs):
+    """
+    Make a single generate_content call bounded by a wall-clock deadline
+    
+    With hedging enabled, a duplicate request is fired once the call has run longer
+    than the observed p95 latency and whichever finishes first is used. The
+    duplicate counts against the quota like any request; when the scheduler has
+    no capacity left it is skipped rather than queued.
+    
+    Args:
+        model: Gemini model or local stand-in exposing generate_content()
+        contents: Request contents
+        timeout (float): Deadline in seconds (defaults to GEMINI_TIMEOUT)
+        hedge (bool): Enable hedged requests (defaults to GEMINI_HEDGE)
+        scheduler (QuotaScheduler): Optional quota scheduler that must admit a hedged duplicate
+        tokens (int): Estimated input tokens of the request, for the scheduler
+        **kwargs: Extra generate_content arguments
+        
+    Returns:
+        Response from whichever attempt succeeded first
+        
+    Raises:
+        TimeoutError: If no attempt finished before the deadline
+    """
+    timeout = REQUEST_TIMEOUT if timeout is None else timeout
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    
+    started = time.monotonic()
+    deadline = started + timeout
+    hedge_after = latency_percentile(HEDGE_PERCENTILE) if hedge else None
+    
+    _count('attempts')
+    pending = {_request_executor.submit(_timed_call, model, contents, timeout, kwargs)}
+    hedged_future = None
+    last_error = None
+    
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        
+        wait_for = deadline - now
+        if hedge_after is not None:
+            wait_for = min(wait_for, max(0.0, started + hedge_after - now))
+        
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedged_future:
+                    _count('hedge_wins')
+                return future.result()
+            last_error = future.exception()
+        
+        if not pending:
+            break
+        
+        if hedge_after is not None and time.monotonic() - started >= hedge_after:
+            threshold, hedge_after = hedge_after, None
+            if scheduler is not None and not scheduler.try_acquire(tokens):
+                logger.info("Skipping hedged request: no rate-limit capacity")
+                _count('hedges_skipped')
+                continue
+            logger.info(f"Request exceeded p95 latency ({threshold:.2f}s), sending hedged request")
+            _count('hedged')
+            _count('attempts')
+            hedged_future = _request_executor.submit(_timed_call, model, contents,
+                                                     deadline - time.monotonic(), kwargs)
+            pending.add(hedged_future)
+    
+    if last_error is not None and not pending:
+        raise last_error
+    
+    # Abandoned calls keep running on the pool; their results are discarded
+    for future in pending:
+        future.cancel()
+    _count('timeouts')
+    raise TimeoutError(f"Gemini request exceeded {timeout:g}s deadline")
+
+def is_retryable(error):
+    """Check whether an error is transient and worth retrying"""
+    return isinstance(error, RETRYABLE_ERRORS)
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff delay for a retry attempt (0-based)"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+def _take_retry_budget():
+    """Reserve one retry if the process-wide retry budget allows it"""
+    with _stats_lock:
+        allowed = RETRY_BUDGET_MIN + RETRY_BUDGET_RATIO * _request_stats['requests']
+        if _request_stats['retries'] >= allowed:
+            return False
+        _request_stats['retries'] += 1
+        return True
+
+def generate_with_retry(model, contents, timeout=None, max_retries=None, hedge=None,
+                        total_deadline=None, scheduler=None, tokens=0, **kwargs):
+    """
+    Call generate_content with per-attempt deadlines and budgeted, jittered retries
+    
+    When a quota scheduler is given, every attempt waits for RPM/TPM capacity
+    first, and quota errors drain its buckets so other callers back off too.
+    
+    Args:
+        model: Gemini model or local stand-in exposing generate_content()
+        contents: Request contents
+        timeout (float): Per-attempt deadline in seconds
+        max_retries (int): Maximum retries for retryable errors
+        hedge (bool): Enable hedged requests
+        total_deadline (float): Overall time budget in seconds across all attempts
+        scheduler (QuotaScheduler): Optional quota scheduler to admit each attempt
+        tokens (int): Estimated input tokens of the request, for the scheduler
+        **kwargs: Extra generate_content arguments
+        
+    Returns:
+        Gemini response
+        
+    Raises:
+        GeminiRequestError: If the request failed permanently or retries ran out
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    total_deadline = TOTAL_DEADLINE if total_deadline is None else total_deadline
+    give_up_at = time.monotonic() + total_deadline
+    _count('requests')
+    
+    attempt = 0
+    while True:
+        try:
+            if scheduler is not None:
+                delay = scheduler.acquire(tokens)
+                if delay > 1:
+                    logger.info(f"Waited {delay:.1f}s for rate-limit capacity")
+            return call_with_deadline(model, contents, timeout=timeout, hedge=hedge,
+                                      scheduler=scheduler, tokens=tokens, **kwargs)
+        except Exception as e:
+            if scheduler is not None and isinstance(e, (google_exceptions.TooManyRequests,
+                                                        google_exceptions.ResourceExhausted)):
+                scheduler.throttled()
+            if not is_retryable(e):
+                raise GeminiRequestError(f"Gemini request failed: {str(e)}") from e
+            
+            delay = backoff_delay(attempt)
+            if attempt >= max_retries or time.monotonic() + delay >= give_up_at:
+                raise GeminiRequestError(f"Gemini request failed after {attempt + 1} attempts: {str(e)}") from e
+            if not _take_retry_budget():
+                raise GeminiRequestError(f"Gemini request failed and retry budget is exhausted: {str(e)}") from e
+            
+            logger.warning(f"Retryable Gemini error ({type(e).__name__}: {str(e)}), "
+                           f"retrying in {delay:.1f}s (attempt {attempt + 2}/{max_retries + 1})")
+            time.sleep(delay)
+            attempt += 1
+
+def parse_with_gemini(text_data, prompt, binding=None, timeout=None, max_retries=None, hedge=None,
+                      generation_config=None, model_name=DEFAULT_MODEL_NAME):
     """
     Parse bank statement text using Google Gemini 2.0 Flash
     
     Args:
         text_data (str): Extracted text from PDF bank statement
         prompt (str): System prompt with parsing instructions
+        binding (dict): Optional prompt binding to use instead of the shared one
+            (e.g. a local stand-in built with make_binding)
+        timeout (float): Per-attempt deadline in seconds (defaults to GEMINI_TIMEOUT)
+        max_retries (int): Retries for transient errors (defaults to GEMINI_MAX_RETRIES)
+        hedge (bool): Fire a duplicate request when a call exceeds the p95 latency
+        generation_config (dict): Optional generation settings, e.g. a JSON response schema
+        model_name (str): Model for the shared binding when no binding is given
         
     Returns:
         str: Parsed CSV string or None if parsing fails
         
     Raises:
-        Exception: If API call fails or response is invalid
+        GeminiRequestError: If API call fails or response is invalid
     """
     try:
-        logger.info("Initializing Gemini model...")
-        model = configure_gemini()
+        if binding is None:
+            logger.info("Initializing Gemini model...")
+            binding = bind_prompt(prompt, model_name)
+        
+        # The static prompt is only sent inline when no cached/system context is available
+        request_text = build_request(binding, text_data)
+        
+        # Quotas count the static prompt too, even when it is cached or a system instruction
+        scheduler = get_scheduler()
+        estimated_tokens = estimate_tokens(request_text)
+        if binding['mode'] != 'inline':
+            estimated_tokens += binding['prompt_tokens']
         
-        # Combine prompt and text data for processing
-        full_prompt = f"{prompt}\n\nBank Statement Text to Parse:\n{text_data}"
+        logger.info(f"Sending request to Gemini API ({binding['mode']} prompt)...")
+        extra = {'generation_config': generation_config} if generation_config else {}
+        response = generate_with_retry(binding['model'], request_text, timeout=timeout,
+                                       max_retries=max_retries, hedge=hedge,
+                                       scheduler=scheduler, tokens=estimated_tokens, **extra)
         
-        logger.info("Sending request to Gemini API...")
-        response = model.generate_content(full_prompt)
+        usage = record_usage(binding, request_text, response)
+        if scheduler is not None:
+            scheduler.reconcile(estimated_tokens, usage['prompt_tokens'])
+        logger.info(f"Token usage: {usage['prompt_tokens']} prompt "
+                    f"({usage['cached_tokens']} cached), {usage['output_tokens']} output")
         
         if response.text:
             logger.info("Successfully received response from Gemini")
@@ -65,7 +525,7 @@ def parse_with_gemini(text_data, prompt):
             
     except Exception as e:
         logger.error(f"Error in Gemini parsing: {str(e)}")
-        raise Exception(f"Gemini parsing failed: {str(e)}")
+        raise GeminiRequestError(f"Gemini parsing failed: {str(e)}") from e
 
 def validate_api_connection():
     """
@@ -77,7 +537,7 @@ def validate_api_connection():
     try:
         model = configure_gemini()
         # Simple test request
-        test_response = model.generate_content("Hello")
+        test_response = call_with_deadline(model, "Hello", timeout=30)
         return test_response.text is not None
     except Exception as e:
         logger.error(f"API connection test failed: {str(e)}")
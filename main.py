@@ -5,16 +5,22 @@ Professional PDF-to-CSV converter using Google Gemini AI
 """
 
 import argparse
+import functools
 import os
 import sys
 import logging
+import time
 from pathlib import Path
 
 # Import our modules
-from pdf_extractor import extract_text_from_pdf
-from llm_parser import parse_with_gemini, validate_api_connection
-from csv_handler import save_csv_with_validation
-from prompts import BANK_STATEMENT_PROMPT
+from pdf_extractor import TABLE_PROFILES
+from llm_parser import validate_api_connection, get_model_usage
+from statement_parser import StatementParser
+from cascade import MODEL_LADDER, parse_ladder, get_cascade_stats, get_tier_counters
+from batch import run_worker, read_manifest, LEASE_TTL, QUARANTINE_AFTER
+from isolation import IsolatedProcess, DOC_TIMEOUT, MAX_TASKS_PER_WORKER, MAX_WORKER_RSS_MB
+from scheduler import get_scheduler, summarize_counters, GEMINI_RPM, GEMINI_TPM
+from date_normalizer import infer_statement_year
 
 # Configure logging
 logging.basicConfig(
@@ -29,10 +35,10 @@ def validate_input_file(file_path):
     
     Args:
         file_path (str): Path to input file
-        
+    
     Returns:
         bool: True if valid
-        
+    
     Raises:
         FileNotFoundError: If file doesn't exist
         ValueError: If file is not a PDF
@@ -57,14 +63,24 @@ def ensure_output_directory(output_path):
         os.makedirs(output_dir)
         logger.info(f"Created output directory: {output_dir}")
 
-def process_bank_statement(input_path, output_path):
+def process_bank_statement(input_path, output_path, repair=True, layout=False, accounts='column',
+                           table_profile=None, hybrid=False, structured=False, model_ladder=None):
     """
     Main processing function that orchestrates the conversion
     
     Args:
         input_path (str): Path to input PDF file
         output_path (str): Path for output CSV file
-        
+        repair (bool): Re-query the source pages of rows flagged by validation
+        layout (bool): Send layout-preserving text instead of plain text
+        accounts (str): For statements covering several accounts, 'column' writes
+            one CSV with an Account column, 'split' writes one CSV per account
+        table_profile (str): Table finder profile for the document family (see TABLE_PROFILES)
+        hybrid (bool): Build rows from extracted tables, asking the model only for ambiguous fields
+        structured (bool): Ask for compact schema-constrained JSON rows instead of free-form CSV
+        model_ladder (tuple): Model names, cheapest first; stronger tiers only see text
+            whose parse fails validation (default: the single default model)
+    
     Returns:
         bool: True if successful, False otherwise
     """
@@ -74,9 +90,12 @@ def process_bank_statement(input_path, output_path):
         validate_input_file(input_path)
         ensure_output_directory(output_path)
         
+        statement_parser = StatementParser(repair=repair, layout=layout, table_profile=table_profile,
+                                           hybrid=hybrid, structured=structured, model_ladder=model_ladder)
+        
         # Step 2: Extract text from PDF
         logger.info("Extracting text from PDF...")
-        text_data = extract_text_from_pdf(input_path)
+        pages, text_data = statement_parser.extract(input_path)
         
         if not text_data or len(text_data.strip()) == 0:
             logger.error("No text extracted from PDF")
@@ -84,25 +103,120 @@ def process_bank_statement(input_path, output_path):
         
         logger.info(f"Extracted {len(text_data)} characters from PDF")
         
-        # Step 3: Parse with Gemini AI
+        # Step 3: Parse with Gemini AI (combined statements: one job per account)
         logger.info("Parsing with Google Gemini AI...")
-        csv_result = parse_with_gemini(text_data, BANK_STATEMENT_PROMPT)
+        result = statement_parser.parse_document(pages, text_data, infer_statement_year(text_data))
         
-        if not csv_result:
-            logger.error("Failed to parse with Gemini")
+        if result is None:
             return False
         
-        # Step 4: Save and validate output
+        # Step 4: Save validated output
         logger.info("Saving and validating CSV output...")
-        save_csv_with_validation(csv_result, output_path)
+        result.save(output_path, mode=accounts)
         
-        logger.info(f"Successfully converted PDF to CSV: {output_path}")
-        return True
+        if result.report.get('failed_accounts'):
+            return False
         
+        logger.info(f"Successfully converted {len(result.accounts)} account(s) from PDF to CSV: {output_path}")
+        return True
+    
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
         return False
 
+def collect_stats():
+    """
+    Cumulative scheduler, cascade and token counters of this process
+    
+    Run inside isolated workers after each document so the parent can log
+    totals for the whole batch.
+    """
+    scheduler = get_scheduler()
+    return {
+        'scheduler': scheduler.get_counters() if scheduler is not None else {},
+        'tiers': get_tier_counters(),
+        'models': get_model_usage()
+    }
+
+def log_scheduler_stats(counters=None, minutes=None):
+    """
+    Log queueing delay and quota utilization when rate limiting is configured
+    
+    Args:
+        counters (dict): Admission counters summed across isolated workers
+            (defaults to this process's scheduler)
+        minutes (float): Period the counters cover
+    """
+    if counters is None:
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return
+        stats = scheduler.get_stats()
+    elif counters:
+        stats = summarize_counters(counters, minutes, GEMINI_RPM, GEMINI_TPM)
+    else:
+        return
+    
+    utilization = ", ".join(
+        f"{name} {stats[f'{name.lower()}_utilization']:.0%}"
+        for name in ('RPM', 'TPM') if stats[f'{name.lower()}_utilization'] is not None
+    )
+    logger.info(f"Rate limiting: {stats['requests']} requests, queue delay avg "
+                f"{stats['queue_delay_avg']:.2f}s / max {stats['queue_delay_max']:.2f}s, "
+                f"{stats['throttled']} throttled, utilization {utilization}")
+
+def print_manifest(output_dir):
+    """Print the batch manifest shared by all workers writing to output_dir"""
+    manifest = read_manifest(output_dir)
+    
+    print(f"Done: {len(manifest['done'])}")
+    print(f"Failed: {len(manifest['failed'])}")
+    for name, record in manifest['failed'].items():
+        print(f"  {name} (attempts {record.get('attempts', 0)}, worker {record.get('worker')}): {record.get('error')}")
+    print(f"Quarantined: {len(manifest['quarantine'])}")
+    for name, record in manifest['quarantine'].items():
+        print(f"  {name} (worker killed {record.get('killed', 0)} times): {record.get('error')}")
+    print(f"In progress: {len(manifest['in_progress'])}")
+    for name in manifest['in_progress']:
+        print(f"  {name}")
+
+def log_cascade_stats(tiers=None, usage=None):
+    """
+    Log per-tier hit rate, latency and cost when a model ladder was used
+    
+    Args:
+        tiers (dict): Tier counters summed across isolated workers (defaults to this process's)
+        usage (dict): Token usage per model summed across isolated workers (defaults to this process's)
+    """
+    stats = get_cascade_stats(tiers, usage)
+    if not stats:
+        return
+    
+    for model_name, tier in stats.items():
+        cost = f"${tier['cost']:.4f}" if tier['cost'] is not None else "unknown cost"
+        logger.info(f"Model tier {model_name}: {tier['accepted']}/{tier['attempts']} accepted "
+                    f"({tier['hit_rate']:.0%}), {tier['escalated']} escalated, "
+                    f"{tier['failed_requests']} failed, avg {tier['latency_avg']:.1f}s, "
+                    f"{tier['prompt_tokens']} prompt / {tier['output_tokens']} output tokens, {cost}")
+
+def log_token_usage(usage=None):
+    """
+    Log Gemini token totals
+    
+    Args:
+        usage (dict): Token usage per model summed across isolated workers (defaults to this process's)
+    """
+    usage = get_model_usage() if usage is None else usage
+    if not usage:
+        return
+    
+    totals = {}
+    for model_usage in usage.values():
+        for name, count in model_usage.items():
+            totals[name] = totals.get(name, 0) + count
+    logger.info(f"Token usage: {totals['requests']} requests, {totals['prompt_tokens']} prompt "
+                f"({totals['cached_tokens']} cached) / {totals['output_tokens']} output tokens")
+
 def main():
     """Main CLI function"""
     parser = argparse.ArgumentParser(
@@ -112,7 +226,9 @@ def main():
 Examples:
   python main.py --input statement.pdf --output data.csv
   python main.py -i bank_statement.pdf -o parsed_data.csv
-  
+  python main.py --input-dir /shared/inputs --output-dir /shared/outputs
+  python main.py --output-dir /shared/outputs --manifest
+
 Requirements:
   - Google Gemini API key in .env file
   - PDF bank statement file
@@ -121,22 +237,133 @@ Requirements:
     
     parser.add_argument(
         '--input', '-i',
-        required=True,
         help='Path to input PDF bank statement'
     )
     
     parser.add_argument(
         '--output', '-o',
-        required=True,
         help='Path for output CSV file'
     )
     
+    parser.add_argument(
+        '--input-dir',
+        help='Batch mode: directory of PDFs shared with other workers'
+    )
+    
+    parser.add_argument(
+        '--output-dir',
+        help='Batch mode: directory for CSV outputs and the shared manifest'
+    )
+    
+    parser.add_argument(
+        '--worker-id',
+        help='Batch mode: worker identity (defaults to hostname-pid)'
+    )
+    
+    parser.add_argument(
+        '--order',
+        choices=['smallest_first', 'largest_first', 'name'],
+        default='smallest_first',
+        help='Batch mode: order in which documents are claimed'
+    )
+    
+    parser.add_argument(
+        '--lease-ttl',
+        type=int,
+        default=LEASE_TTL,
+        help='Batch mode: seconds before a dead worker\'s claim can be taken over'
+    )
+    
+    parser.add_argument(
+        '--doc-timeout',
+        type=float,
+        default=DOC_TIMEOUT,
+        help='Batch mode: seconds a document may run before its worker is killed (0 for no limit)'
+    )
+    
+    parser.add_argument(
+        '--max-tasks-per-worker',
+        type=int,
+        default=MAX_TASKS_PER_WORKER,
+        help='Batch mode: documents handled by one worker process before it is replaced'
+    )
+    
+    parser.add_argument(
+        '--max-worker-rss',
+        type=int,
+        default=MAX_WORKER_RSS_MB,
+        help='Batch mode: resident memory (MB) after which the worker process is replaced'
+    )
+    
+    parser.add_argument(
+        '--quarantine-after',
+        type=int,
+        default=QUARANTINE_AFTER,
+        help='Batch mode: skip documents whose worker was killed this many times (0 to never quarantine)'
+    )
+    
+    parser.add_argument(
+        '--no-isolate',
+        action='store_true',
+        help='Batch mode: process documents in this process (no deadline or recycling)'
+    )
+    
+    parser.add_argument(
+        '--manifest',
+        action='store_true',
+        help='Batch mode: print done/failed/quarantined/in-progress documents for --output-dir and exit'
+    )
+    
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
         help='Enable verbose logging'
     )
     
+    parser.add_argument(
+        '--layout',
+        action='store_true',
+        help='Preserve page layout in the text sent for parsing (complex formats)'
+    )
+    
+    parser.add_argument(
+        '--table-profile',
+        choices=sorted(TABLE_PROFILES),
+        help='Table detection settings for the statement family (default: TABLE_PROFILE or "default")'
+    )
+    
+    parser.add_argument(
+        '--hybrid',
+        action='store_true',
+        help='Build rows from extracted tables and ask the model only for ambiguous fields'
+    )
+    
+    parser.add_argument(
+        '--structured',
+        action='store_true',
+        help='Request compact JSON rows (amounts in minor units) instead of free-form CSV'
+    )
+    
+    parser.add_argument(
+        '--model-ladder',
+        default=','.join(MODEL_LADDER),
+        help='Comma-separated models, cheapest first; a parse is escalated to the next model only '
+             'when validation finds errors or balance breaks (default: GEMINI_MODEL_LADDER or "%(default)s")'
+    )
+    
+    parser.add_argument(
+        '--accounts',
+        choices=['column', 'split'],
+        default='column',
+        help='Multi-account statements: one CSV with an Account column, or one CSV per account'
+    )
+    
+    parser.add_argument(
+        '--no-repair',
+        action='store_true',
+        help='Skip the targeted repair pass for rows flagged by validation'
+    )
+    
     parser.add_argument(
         '--test-connection',
         action='store_true',
@@ -159,8 +386,57 @@ Requirements:
             logger.error("✗ API connection failed")
             sys.exit(1)
     
+    if args.manifest:
+        if not args.output_dir:
+            parser.error("--manifest requires --output-dir")
+        print_manifest(args.output_dir)
+        sys.exit(0)
+    
+    process = functools.partial(process_bank_statement, repair=not args.no_repair,
+                                layout=args.layout, accounts=args.accounts,
+                                table_profile=args.table_profile, hybrid=args.hybrid,
+                                structured=args.structured,
+                                model_ladder=parse_ladder(args.model_ladder))
+    
+    # Batch mode: drain a shared directory alongside any other workers
+    if args.input_dir or args.output_dir:
+        if not (args.input_dir and args.output_dir):
+            parser.error("--input-dir and --output-dir must be used together")
+        if args.accounts == 'split':
+            parser.error("--accounts split is not supported in batch mode (outputs are committed as one file)")
+        run = functools.partial(run_worker, args.input_dir, args.output_dir, worker_id=args.worker_id,
+                                lease_ttl=args.lease_ttl, order=args.order,
+                                quarantine_after=args.quarantine_after)
+        if args.no_isolate:
+            summary = run(process)
+            log_scheduler_stats()
+            log_cascade_stats()
+            log_token_usage()
+        else:
+            # Each document runs in a child process that is killed at the deadline and
+            # replaced periodically, so a hung or leaking parse cannot stall this worker.
+            # Each child's rate-limit buckets start empty, so recycling never adds a burst.
+            started = time.monotonic()
+            with IsolatedProcess(process, deadline=args.doc_timeout, max_tasks=args.max_tasks_per_worker,
+                                 max_rss_mb=args.max_worker_rss, collect_stats=collect_stats) as isolated:
+                summary = run(isolated)
+            stats = isolated.stats
+            logger.info(f"Isolation: {stats['documents']} documents, {stats['timeouts']} timed out, "
+                        f"{stats['crashes']} crashed, {stats['recycled']} worker recycles")
+            counters = isolated.counters
+            log_scheduler_stats(counters.get('scheduler', {}), (time.monotonic() - started) / 60.0)
+            log_cascade_stats(counters.get('tiers', {}), counters.get('models', {}))
+            log_token_usage(counters.get('models', {}))
+        print(f"✓ Processed {summary['processed']} files, {summary['failed']} failed")
+        sys.exit(1 if summary['failed'] else 0)
+    
+    if not (args.input and args.output):
+        parser.error("--input and --output are required")
+    
     # Process the bank statement
-    success = process_bank_statement(args.input, args.output)
+    success = process(args.input, args.output)
+    log_scheduler_stats()
+    log_cascade_stats()
     
     if success:
         print(f"✓ Successfully converted {args.input} to {args.output}")
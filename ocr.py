@@ -0,0 +1,177 @@
+"""
+OCR Module
+Recovers text from scanned pages that have no text layer, in parallel worker processes
+"""
+
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OCR_ENABLED = os.getenv('OCR_ENABLED', '1') != '0'
+OCR_RESOLUTION = int(os.getenv('OCR_RESOLUTION', '300'))
+OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', '.ocr_cache')
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(os.cpu_count() or 1)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def ocr_available():
+    """
+    Check whether OCR can run (pytesseract installed and tesseract on PATH)
+    
+    Returns:
+        bool: True if scanned pages can be OCR'd
+    """
+    if not OCR_ENABLED:
+        return False
+    if pytesseract is None:
+        logger.warning("pytesseract not installed - scanned pages will be skipped (pip install pytesseract)")
+        return False
+    if not shutil.which(pytesseract.pytesseract.tesseract_cmd):
+        logger.warning("Tesseract binary not found - scanned pages will be skipped")
+        return False
+    return True
+
+def _stream_bytes(stream):
+    """Get a PDF stream's bytes, whether or not pdfminer has already decoded it"""
+    data = stream.get_rawdata()
+    return data if data is not None else stream.get_data()
+
+def page_fingerprint(page):
+    """
+    Hash a page's content streams and embedded images
+    
+    Identical scanned pages (e.g. the same statement uploaded twice) share a
+    fingerprint, so their OCR result is reused from the cache.
+    
+    Args:
+        page: pdfplumber page
+    
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256(f"{page.width}x{page.height}".encode('utf-8'))
+    
+    contents = page.page_obj.contents or []
+    for stream in contents:
+        digest.update(_stream_bytes(stream))
+    
+    for image in page.images:
+        stream = image.get('stream')
+        if stream is not None:
+            digest.update(_stream_bytes(stream))
+    
+    return digest.hexdigest()
+
+def _cache_path(fingerprint):
+    return os.path.join(OCR_CACHE_DIR, f"{fingerprint}-{OCR_RESOLUTION}-{OCR_LANGUAGE}.txt")
+
+def read_cached_text(fingerprint):
+    """Return cached OCR text for a page fingerprint, or None"""
+    try:
+        with open(_cache_path(fingerprint), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def write_cached_text(fingerprint, text):
+    """Store OCR text for a page fingerprint (atomic rename, safe across workers)"""
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        path = _cache_path(fingerprint)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write OCR cache: {str(e)}")
+
+def ocr_page(source, page_number, resolution=OCR_RESOLUTION, language=OCR_LANGUAGE):
+    """
+    Rasterize and OCR a single page (runs inside a worker process)
+    
+    Args:
+        source: PDF path or raw PDF bytes
+        page_number (int): 1-based page number
+        resolution (int): Rasterization DPI
+        language (str): Tesseract language code
+    
+    Returns:
+        str: Recognized text
+    """
+    pdf_source = io.BytesIO(source) if isinstance(source, bytes) else source
+    with pdfplumber.open(pdf_source, pages=[page_number]) as pdf:
+        image = pdf.pages[0].to_image(resolution=resolution).original
+    return pytesseract.image_to_string(image, lang=language)
+
+def get_executor(replace_broken=False):
+    """Get the shared OCR process pool, created on first use or after a worker crash"""
+    global _executor
+    with _executor_lock:
+        if replace_broken and _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            # Spawned workers do not inherit the parent's request threads
+            _executor = ProcessPoolExecutor(
+                max_workers=max(1, OCR_WORKERS),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+def submit_ocr(source, page_number, fingerprint):
+    """
+    Start OCR for a page without waiting for it
+    
+    Cached pages complete immediately; others run on the shared process pool
+    while the caller continues with native-text pages.
+    
+    Returns:
+        Future: Resolves to the page text
+    """
+    cached = read_cached_text(fingerprint)
+    if cached is not None:
+        logger.info(f"Using cached OCR text for page {page_number}")
+        future = Future()
+        future.set_result(cached)
+        return future
+    
+    logger.info(f"Page {page_number} has no text layer, queued for OCR")
+    try:
+        future = get_executor().submit(ocr_page, source, page_number)
+    except BrokenProcessPool:
+        logger.warning("OCR worker pool crashed, starting a new one")
+        future = get_executor(replace_broken=True).submit(ocr_page, source, page_number)
+    
+    def cache_result(done):
+        if done.exception() is None:
+            write_cached_text(fingerprint, done.result())
+    
+    future.add_done_callback(cache_result)
+    return future
+
+def shutdown():
+    """Stop the OCR worker processes"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -1,95 +1,421 @@
 # Import pdfplumber
 import pdfplumber
+import io
 import logging
+import os
+import tempfile
+from collections import defaultdict
+
+import ocr
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(pdf_path):
+# Table finder settings per document family. The pre-check skips extract_tables()
+# on pages that cannot hold a table under the family's strategy: 'lines' needs
+# at least two ruling edges each way, 'text' needs words aligned in columns.
+# min_aligned_columns > 0 also applies the alignment test to ruled families.
+TABLE_PROFILES = {
+    'default': {
+        'table_settings': {},
+        'min_aligned_columns': 0
+    },
+    'ruled': {
+        'table_settings': {'vertical_strategy': 'lines', 'horizontal_strategy': 'lines'},
+        'min_aligned_columns': 3
+    },
+    'borderless': {
+        'table_settings': {'vertical_strategy': 'text', 'horizontal_strategy': 'text'},
+        'min_aligned_columns': 3
+    }
+}
+TABLE_PROFILE = os.getenv('TABLE_PROFILE', 'default')
+TABLE_PRECHECK = os.getenv('TABLE_PRECHECK', '1') != '0'
+
+# Word edges within this many points count as the same column
+ALIGNMENT_TOLERANCE = 3
+# A column must line up across at least this many text lines, and at least
+# this share of the page's lines (so prose cannot line up by chance)
+MIN_ALIGNED_ROWS = 3
+MIN_ALIGNED_SHARE = 0.25
+
+class PageExtraction:
     """
-    Write a function extract_text_from_pdf(pdf_path) that:
-    1. Opens the PDF using pdfplumber
-    2. Iterates through all pages
-    3. Extracts both text and table data
-    4. Returns a combined string of all text and table data for LLM processing
+    Everything extracted from one PDF page
+    
+    Computed once per page so every output format (plain text, layout text)
+    and every fallback reads from the same results instead of re-running
+    pdfminer on the page.
     """
+    __slots__ = ('page_number', 'tables', 'text', 'layout_text', 'words', 'ocr', 'table_checked')
+    
+    def __init__(self, page_number, tables=None, text='', layout_text='', words=None, ocr=False,
+                 table_checked=False):
+        self.page_number = page_number
+        self.tables = tables or []
+        self.text = text
+        self.layout_text = layout_text
+        self.words = words or []
+        self.ocr = ocr
+        self.table_checked = table_checked
+    
+    @property
+    def has_text(self):
+        """True if the page has a text layer"""
+        return bool(self.words) or bool(self.text and self.text.strip())
+
+def _extract_view(page_number, view_name, extract):
+    """Run one extraction view, logging and returning None if it fails"""
     try:
-        all_text = []
-        
-        with pdfplumber.open(pdf_path) as pdf:
+        return extract()
+    except Exception as e:
+        logger.warning(f"Could not extract {view_name} on page {page_number}: {str(e)}")
+        return None
+
+def get_table_profile(profile=None):
+    """
+    Resolve a table profile by name (or pass a profile dict through)
+    
+    Args:
+        profile: Profile name from TABLE_PROFILES, a profile dict, or None for TABLE_PROFILE
+    
+    Returns:
+        dict: Profile with 'table_settings', 'min_aligned_columns' and 'precheck'
+    """
+    if isinstance(profile, dict):
+        resolved = dict(profile)
+    else:
+        name = profile or TABLE_PROFILE
+        if name not in TABLE_PROFILES:
+            raise ValueError(f"Unknown table profile '{name}' (choose from {', '.join(TABLE_PROFILES)})")
+        resolved = dict(TABLE_PROFILES[name])
+    
+    resolved.setdefault('table_settings', {})
+    resolved.setdefault('min_aligned_columns', 0)
+    resolved.setdefault('precheck', TABLE_PRECHECK)
+    return resolved
+
+def count_ruling_edges(page, min_length=3):
+    """
+    Count horizontal and vertical ruling edges from the page's lines and rectangles
+    
+    Only reads the object lists pdfminer already parsed; no table geometry
+    is computed.
+    
+    Returns:
+        tuple: (horizontal, vertical) edge counts
+    """
+    horizontal = vertical = 0
+    
+    for line in page.lines:
+        if abs(line['top'] - line['bottom']) < 1 and line['x1'] - line['x0'] >= min_length:
+            horizontal += 1
+        elif abs(line['x0'] - line['x1']) < 1 and line['bottom'] - line['top'] >= min_length:
+            vertical += 1
+    
+    for rect in page.rects:
+        # A rectangle contributes its top/bottom and left/right sides
+        if rect['width'] >= min_length:
+            horizontal += 2
+        if rect['height'] >= min_length:
+            vertical += 2
+    
+    return horizontal, vertical
+
+def count_aligned_columns(words, tolerance=ALIGNMENT_TOLERANCE, min_rows=MIN_ALIGNED_ROWS,
+                          min_share=MIN_ALIGNED_SHARE):
+    """
+    Estimate how many columns the page's words line up in
+    
+    Word left edges (text columns), right edges (amount columns) and centres
+    are bucketed by x position; a bucket is a column when words from at least
+    min_rows different text lines (and min_share of all lines) fall in it.
+    Prose gives one column (the margin), a statement table gives one per field.
+    
+    Args:
+        words (list): Words from page.extract_words()
+        tolerance (float): Bucket width in points
+        min_rows (int): Lines that must share a bucket
+        min_share (float): Fraction of the page's lines that must share a bucket
+    
+    Returns:
+        int: Aligned columns by left edge, right edge or centre, whichever is most
+    """
+    buckets = (defaultdict(set), defaultdict(set), defaultdict(set))
+    all_rows = set()
+    
+    for word in words:
+        row = round(word['top'])
+        all_rows.add(row)
+        for bucket, x in zip(buckets, (word['x0'], word['x1'], (word['x0'] + word['x1']) / 2)):
+            bucket[int(x // tolerance)].add(row)
+    
+    needed = max(min_rows, min_share * len(all_rows))
+    return max(sum(1 for rows in bucket.values() if len(rows) >= needed) for bucket in buckets)
+
+def needs_table_finder(page, words, profile):
+    """
+    Decide cheaply whether pdfplumber's table finder can find anything on the page
+    
+    Args:
+        page: pdfplumber page
+        words (list): Words already extracted from the page
+        profile (dict): Resolved table profile
+    
+    Returns:
+        bool: False if the page cannot hold a table under the profile's strategy
+    """
+    settings = profile['table_settings']
+    vertical_strategy = settings.get('vertical_strategy', 'lines')
+    horizontal_strategy = settings.get('horizontal_strategy', 'lines')
+    
+    if settings.get('explicit_vertical_lines') or settings.get('explicit_horizontal_lines'):
+        return True
+    
+    line_strategies = ('lines', 'lines_strict')
+    if vertical_strategy in line_strategies or horizontal_strategy in line_strategies:
+        # Curves also produce edges; leave those pages to the full finder
+        if not page.curves:
+            horizontal, vertical = count_ruling_edges(page, settings.get('edge_min_length', 3))
+            if vertical_strategy in line_strategies and vertical < 2:
+                return False
+            if horizontal_strategy in line_strategies and horizontal < 2:
+                return False
+    
+    min_columns = profile['min_aligned_columns']
+    min_rows = MIN_ALIGNED_ROWS
+    if vertical_strategy == 'text':
+        # The text strategy needs two word-aligned edges to bound any cell
+        min_columns = max(min_columns, 2)
+        min_rows = settings.get('min_words_vertical', 3)
+    if min_columns and count_aligned_columns(words, min_rows=min_rows) < min_columns:
+        return False
+    
+    return True
+
+def extract_page(page, page_number, profile=None):
+    """
+    Extract tables, plain text, layout text and words from a single page
+    
+    Each view is extracted independently, so a failure in one (e.g. layout
+    text) only falls back for that view and that page. The table finder only
+    runs when the geometric pre-check says the page can hold a table.
+    
+    Args:
+        page: pdfplumber page
+        page_number (int): 1-based page number
+        profile: Table profile name or dict (defaults to TABLE_PROFILE)
+    
+    Returns:
+        PageExtraction: Extraction results for the page
+    """
+    profile = get_table_profile(profile)
+    
+    words = _extract_view(page_number, 'words', page.extract_words) or []
+    text = _extract_view(page_number, 'text', page.extract_text) or ''
+    layout_text = _extract_view(page_number, 'layout text', lambda: page.extract_text(layout=True))
+    
+    tables = []
+    table_checked = not profile['precheck'] or needs_table_finder(page, words, profile)
+    if table_checked:
+        tables = _extract_view(page_number, 'tables',
+                               lambda: page.extract_tables(profile['table_settings'])) or []
+    
+    if layout_text is None:
+        layout_text = text
+    
+    return PageExtraction(page_number, tables, text, layout_text, words, table_checked=table_checked)
+
+def _write_temp_pdf(data):
+    """Write in-memory PDF bytes to a temporary file and return its path"""
+    handle, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(handle, 'wb') as f:
+        f.write(data)
+    return path
+
+def extract_pages(pdf_path, use_ocr=True, profile=None):
+    """
+    Open the PDF once and extract every page
+    
+    Pages without a text layer (scans) are OCR'd in worker processes while
+    the native-text pages continue to be extracted. In-memory input is
+    written to one temporary file for the OCR workers, so each job carries a
+    path instead of a copy of the whole document.
+    
+    Args:
+        pdf_path: Path to the PDF file, or its contents as bytes or a binary file-like object
+        use_ocr (bool): OCR pages that have no text layer
+        profile: Table profile name or dict for the document family (defaults to TABLE_PROFILE)
+    
+    Returns:
+        list: PageExtraction for each page in order
+    """
+    pages = []
+    ocr_jobs = {}
+    ocr_ready = None
+    profile = get_table_profile(profile)
+    
+    # In-memory input: pdfplumber reads a buffer over the bytes
+    if hasattr(pdf_path, 'read'):
+        pdf_path = pdf_path.read()
+    if isinstance(pdf_path, bytearray):
+        pdf_path = bytes(pdf_path)
+    pdf_source = io.BytesIO(pdf_path) if isinstance(pdf_path, bytes) else pdf_path
+    ocr_source = None if isinstance(pdf_path, bytes) else pdf_path
+    temp_path = None
+    
+    try:
+        with pdfplumber.open(pdf_source) as pdf:
             logger.info(f"Processing PDF with {len(pdf.pages)} pages")
             
             for page_num, page in enumerate(pdf.pages, 1):
                 logger.info(f"Processing page {page_num}")
+                extraction = extract_page(page, page_num, profile)
                 
-                # Add page separator
-                all_text.append(f"\n--- PAGE {page_num} ---\n")
+                if extraction.tables:
+                    logger.info(f"Found {len(extraction.tables)} tables on page {page_num}")
+                pages.append(extraction)
                 
-                # Extract tables first (higher priority for bank statements)
-                tables = page.extract_tables()
-                if tables:
-                    logger.info(f"Found {len(tables)} tables on page {page_num}")
-                    for table_num, table in enumerate(tables, 1):
-                        all_text.append(f"\n[TABLE {table_num} START]\n")
-                        for row in table:
-                            if row:  # Skip empty rows
-                                # Join non-empty cells with pipe separator
-                                row_text = " | ".join([cell.strip() if cell else "" for cell in row])
-                                if row_text.strip():  # Only add non-empty rows
-                                    all_text.append(row_text)
-                        all_text.append(f"[TABLE {table_num} END]\n")
+                if use_ocr and not extraction.has_text:
+                    if ocr_ready is None:
+                        ocr_ready = ocr.ocr_available()
+                    if ocr_ready:
+                        if ocr_source is None:
+                            temp_path = ocr_source = _write_temp_pdf(pdf_path)
+                        ocr_jobs[page_num] = ocr.submit_ocr(ocr_source, page_num, ocr.page_fingerprint(page))
                 
-                # Extract remaining text (non-table content)
-                page_text = page.extract_text()
-                if page_text:
-                    # Remove excessive whitespace and clean up
-                    cleaned_text = "\n".join([line.strip() for line in page_text.split('\n') if line.strip()])
-                    all_text.append(cleaned_text)
-                    
-        combined_text = "\n".join(all_text)
-        logger.info(f"Extracted {len(combined_text)} characters total")
+                # Release pdfminer's per-page layout caches once the page is extracted
+                page.close()
+        
+        skipped = sum(1 for extraction in pages if not extraction.table_checked)
+        if skipped:
+            logger.info(f"Skipped table detection on {skipped} of {len(pages)} pages without table geometry")
+        
+        for page_num, job in ocr_jobs.items():
+            try:
+                text = job.result()
+            except Exception as e:
+                logger.warning(f"OCR failed on page {page_num}: {str(e)}")
+                continue
+            extraction = pages[page_num - 1]
+            extraction.text = extraction.layout_text = text
+            extraction.ocr = True
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+    
+    if ocr_jobs:
+        logger.info(f"OCR recovered text for {sum(p.ocr for p in pages)} of {len(ocr_jobs)} scanned pages")
+    
+    return pages
+
+def format_plain_text(pages):
+    """
+    Combine page extractions into text for LLM processing (tables first, then text)
+    
+    Args:
+        pages (list): PageExtraction objects
+    
+    Returns:
+        str: Combined text and table data
+    """
+    all_text = []
+    
+    for extraction in pages:
+        # Add page separator
+        all_text.append(f"\n--- PAGE {extraction.page_number} ---\n")
+        
+        # Tables first (higher priority for bank statements)
+        for table_num, table in enumerate(extraction.tables, 1):
+            all_text.append(f"\n[TABLE {table_num} START]\n")
+            for row in table:
+                if row:  # Skip empty rows
+                    # Join non-empty cells with pipe separator
+                    row_text = " | ".join([cell.strip() if cell else "" for cell in row])
+                    if row_text.strip():  # Only add non-empty rows
+                        all_text.append(row_text)
+            all_text.append(f"[TABLE {table_num} END]\n")
+        
+        # Remaining text (non-table content)
+        if extraction.text:
+            # Remove excessive whitespace and clean up
+            cleaned_text = "\n".join([line.strip() for line in extraction.text.split('\n') if line.strip()])
+            all_text.append(cleaned_text)
+    
+    combined_text = "\n".join(all_text)
+    logger.info(f"Extracted {len(combined_text)} characters total")
+    
+    return combined_text
+
+def format_layout_text(pages):
+    """
+    Combine page extractions preserving layout, followed by structured table data
+    
+    Args:
+        pages (list): PageExtraction objects
+    
+    Returns:
+        str: Layout-preserving text with table data
+    """
+    all_content = []
+    
+    for extraction in pages:
+        all_content.append(f"\n=== PAGE {extraction.page_number} ===\n")
         
-        return combined_text
+        if extraction.layout_text:
+            all_content.append(extraction.layout_text)
         
+        # Tables separately for better structure
+        for table in extraction.tables:
+            all_content.append("\n[STRUCTURED TABLE DATA]\n")
+            for row in table:
+                if row and any(cell for cell in row if cell):
+                    row_data = []
+                    for cell in row:
+                        if cell:
+                            row_data.append(str(cell).strip())
+                        else:
+                            row_data.append("")
+                    all_content.append(" | ".join(row_data))
+            all_content.append("[END TABLE DATA]\n")
+    
+    return "\n".join(all_content)
+
+def extract_text_from_pdf(pdf_path, pages=None):
+    """
+    Extract text and table data from all pages as a combined string for LLM processing
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        pages (list): Optional PageExtraction results to reuse instead of re-reading the PDF
+    """
+    try:
+        if pages is None:
+            pages = extract_pages(pdf_path)
+        return format_plain_text(pages)
+    
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         raise
 
-def extract_text_with_layout(pdf_path):
+def extract_text_with_layout(pdf_path, pages=None):
     """
     Alternative extraction method that preserves layout better
     Useful for complex bank statement formats
+    
+    Pages whose layout text fails fall back to their plain text; the PDF is
+    never re-read for the fallback.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        pages (list): Optional PageExtraction results to reuse instead of re-reading the PDF
     """
     try:
-        all_content = []
-        
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
-                all_content.append(f"\n=== PAGE {page_num} ===\n")
-                
-                # Try to extract with layout preservation
-                text_with_layout = page.extract_text(layout=True)
-                if text_with_layout:
-                    all_content.append(text_with_layout)
-                
-                # Also extract tables separately for better structure
-                tables = page.extract_tables()
-                for table in tables:
-                    all_content.append("\n[STRUCTURED TABLE DATA]\n")
-                    for row in table:
-                        if row and any(cell for cell in row if cell):
-                            row_data = []
-                            for cell in row:
-                                if cell:
-                                    row_data.append(str(cell).strip())
-                                else:
-                                    row_data.append("")
-                            all_content.append(" | ".join(row_data))
-                    all_content.append("[END TABLE DATA]\n")
-        
-        return "\n".join(all_content)
-        
+        if pages is None:
+            pages = extract_pages(pdf_path)
+        return format_layout_text(pages)
+    
     except Exception as e:
         logger.error(f"Error in layout extraction: {str(e)}")
-        return extract_text_from_pdf(pdf_path)  # Fallback to regular extraction
+        raise
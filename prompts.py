@@ -8,7 +8,7 @@ REQUIRED CSV COLUMNS (in exact order):
 Date, Cheque No., Narration, Debit, Credit, Balance
 
 CRITICAL RULES:
-1. STANDARDIZE DATES: Convert all dates to YYYY-MM-DD format (e.g., "01-Jan-2024" becomes "2024-01-01")
+1. DATES: Copy each date exactly as printed in the statement (e.g., "01-Jan-2024" stays "01-Jan-2024"); dates are standardized after parsing
 2. MISSING VALUES: If a value is missing or not applicable, leave the cell empty (not "N/A" or "null")
 3. CURRENCY HANDLING: Remove all currency symbols (₹, $, Rs., etc.). Only include numbers with decimals in Debit/Credit/Balance
 4. DEBIT/CREDIT VALIDATION: Never fill both Debit AND Credit for the same transaction row
@@ -28,15 +28,15 @@ OUTPUT REQUIREMENTS:
 VALIDATION CHECKLIST:
 - Count input transactions vs output rows (must match)
 - Verify no row has both Debit and Credit filled
-- Ensure all dates follow YYYY-MM-DD format
+- Ensure every row has its date copied from the statement
 - Confirm Balance column shows running totals
 - Check that numeric fields contain only numbers and decimals
 
 EXAMPLE OUTPUT FORMAT:
 Date,Cheque No.,Narration,Debit,Credit,Balance
-2024-01-15,,Opening Balance,,,10000.00
-2024-01-16,123456,Salary Credit,,5000.00,15000.00
-2024-01-17,,ATM Withdrawal,500.00,,14500.00
+15-Jan-2024,,Opening Balance,,,10000.00
+16-Jan-2024,123456,Salary Credit,,5000.00,15000.00
+17-Jan-2024,,ATM Withdrawal,500.00,,14500.00
 
 Remember: Output MUST be a valid CSV string and nothing else. No additional text or explanations.
 """
@@ -59,7 +59,7 @@ Apply the same CSV output rules as the main prompt, but be more flexible in pars
 VALIDATION_PROMPT = """
 Review this CSV data for a bank statement and identify any issues:
 
-1. Date format consistency (YYYY-MM-DD)
+1. Dates copied exactly as printed in the statement
 2. Mathematical accuracy of running balance
 3. Proper Debit/Credit separation
 4. Complete transaction information
@@ -67,3 +67,64 @@ Review this CSV data for a bank statement and identify any issues:
 
 If you find issues, provide a corrected version following the same format rules.
 """
+
+# Targeted repair of a flagged segment - sent with the source page text and balance anchors
+SEGMENT_REPAIR_PROMPT = VALIDATION_PROMPT + """
+You are given only a SEGMENT of a larger statement:
+- OPENING BALANCE: the balance immediately before the first row of the segment
+- CLOSING BALANCE: the balance of the row immediately after the segment (if any)
+- CURRENT ROWS: the rows previously extracted for this segment, some of them flagged as wrong
+- SOURCE PAGES: the original statement text the segment was extracted from
+
+Re-read the source pages and return the corrected rows for this segment only:
+- Start directly with the CSV header row: Date,Cheque No.,Narration,Debit,Credit,Balance
+- Include every transaction between the two anchor balances, in statement order
+- Each row's Balance must equal the previous balance minus Debit plus Credit
+- Do not include rows outside the segment and do not add explanations
+"""
+
+# Hybrid mode - rows are built from the statement's tables; only ambiguous fields are asked for
+HYBRID_FIELDS_PROMPT = """
+You are completing bank statement rows that were already extracted from the statement's tables.
+Dates, amounts and balances are known. Each input line is a JSON object for one row:
+- "id": row id
+- "need": the fields to resolve for this row
+- "date", "amount", "balance": values already extracted
+- "lines": the raw table text of the row, followed by any wrapped lines printed below it
+
+Fields you may be asked for:
+- "n": narration - the full transaction description; join wrapped lines that belong to this row, drop lines that do not (page footers, headers)
+- "c": cheque number - the cheque/check number mentioned for this row, or "" if there is none
+- "s": side - "D" if money left the account (debit), "C" if money came in (credit)
+
+OUTPUT REQUIREMENTS:
+- Return ONLY a JSON object keyed by row id, with only the requested keys for each row
+- No explanatory text, no markdown
+
+EXAMPLE OUTPUT FORMAT:
+{"3": {"n": "NEFT transfer to John Smith ref 8812"}, "7": {"c": "004512", "s": "D"}}
+"""
+
+# Structured output - rows come back as compact JSON arrays instead of free-form CSV
+STRUCTURED_STATEMENT_PROMPT = """
+You are an expert financial data parser specializing in bank statements. Extract every transaction row from the bank statement text.
+
+Return a JSON array with one array per transaction, in statement order:
+[date, cheque_no, narration, debit, credit, balance]
+- date: copied exactly as printed in the statement
+- cheque_no: cheque/check number as a string, or "" if none
+- narration: the complete transaction description, with wrapped lines joined
+- debit: money out as an integer number of minor units (cents/paise), 0 if none
+- credit: money in as an integer number of minor units (cents/paise), 0 if none
+- balance: running balance after the transaction as an integer number of minor units, negative if overdrawn, null if not printed
+
+CRITICAL RULES:
+1. MINOR UNITS: 1,500.00 becomes 150000; 12.5 becomes 1250. Never use decimals or separators in amounts
+2. Never fill both debit and credit for the same row
+3. Include opening/closing balance lines as rows only if they are printed as rows in the transaction table
+4. Do not skip, merge or invent transactions: one array per printed transaction
+
+EXAMPLE OUTPUT FORMAT:
+[["15-Jan-2024","","Opening Balance",0,0,1000000],
+["16-Jan-2024","123456","Salary Credit",0,500000,1500000]]
+"""
@@ -0,0 +1,211 @@
+"""
+Targeted Repair Module
+Re-queries only the statement pages behind rows flagged by validation
+"""
+
+import csv
+import logging
+import re
+from io import StringIO
+
+from csv_handler import validate_csv, clean_csv_response, fix_incomplete_csv
+from llm_parser import parse_with_gemini, DEFAULT_MODEL_NAME
+from prompts import SEGMENT_REPAIR_PROMPT
+from transactions import parse_amount
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PAGE_MARKER = re.compile(r'^\s*(?:---|===) PAGE (\d+) (?:---|===)\s*$', re.MULTILINE)
+AMOUNT_PATTERN = re.compile(r'\d[\d,]*\.\d{1,2}')
+
+# Rows this close together are repaired as a single segment
+SEGMENT_GAP = 2
+
+def split_pages(text_data):
+    """
+    Split extracted text back into pages using the extractor's page separators
+    
+    Args:
+        text_data (str): Text produced by pdf_extractor
+        
+    Returns:
+        list: (page_number, page_text) tuples in document order
+    """
+    markers = list(PAGE_MARKER.finditer(text_data))
+    if not markers:
+        return [(1, text_data)]
+    
+    pages = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text_data)
+        pages.append((int(marker.group(1)), text_data[marker.end():end]))
+    return pages
+
+def page_amounts(page_text):
+    """Collect the amounts printed on a page, in minor units"""
+    return {parse_amount(match) for match in AMOUNT_PATTERN.findall(page_text)}
+
+def locate_row_pages(rows, pages):
+    """
+    Map each CSV row back to the page it was most likely extracted from
+    
+    Statements are sequential, so the search for each row starts at the page of the
+    previous row. Rows are matched by balance first, then by transaction amount;
+    unmatched rows inherit the previous row's page.
+    
+    Args:
+        rows (list): CSV data rows (Date, Cheque No., Narration, Debit, Credit, Balance)
+        pages (list): (page_number, page_text) tuples from split_pages
+        
+    Returns:
+        list: Index into pages for every row
+    """
+    amounts = [page_amounts(text) for _, text in pages]
+    row_pages = []
+    current = 0
+    
+    for row in rows:
+        found = None
+        for column in (5, 3, 4):
+            value = parse_amount(row[column]) if len(row) > column else None
+            if value is None:
+                continue
+            for page_index in range(current, len(pages)):
+                if value in amounts[page_index]:
+                    found = page_index
+                    break
+            if found is not None:
+                break
+        
+        if found is not None:
+            current = found
+        row_pages.append(current)
+    
+    return row_pages
+
+def find_segments(flagged_rows, row_count):
+    """
+    Group flagged row indices into contiguous segments to repair
+    
+    A balance mismatch on a row may be caused by the row before it (e.g. a missed
+    transaction), so each segment starts one row early.
+    
+    Returns:
+        list: (start, end) row index ranges, end exclusive
+    """
+    segments = []
+    for idx in sorted(set(flagged_rows)):
+        start = max(0, idx - 1)
+        end = min(row_count, idx + 1)
+        if segments and start <= segments[-1][1] + SEGMENT_GAP:
+            segments[-1] = (segments[-1][0], max(segments[-1][1], end))
+        else:
+            segments.append((start, end))
+    return segments
+
+def row_balance(row):
+    """Get the Balance cell of a CSV row, or '' if the row is short"""
+    return row[5] if len(row) > 5 else ''
+
+def build_repair_request(header, rows, start, end, pages, row_pages):
+    """Build the repair request text for one segment with its page window and anchors"""
+    opening = row_balance(rows[start - 1]) if start > 0 else ''
+    closing = row_balance(rows[end]) if end < len(rows) else ''
+    
+    first_page = row_pages[start]
+    last_page = row_pages[end - 1]
+    
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(rows[start:end])
+    
+    source = "\n".join(f"--- PAGE {pages[i][0]} ---\n{pages[i][1].strip()}"
+                       for i in range(first_page, last_page + 1))
+    
+    return (
+        f"OPENING BALANCE: {opening or 'unknown'}\n"
+        f"CLOSING BALANCE: {closing or 'none (segment ends the statement)'}\n\n"
+        f"CURRENT ROWS:\n{buffer.getvalue()}\n"
+        f"SOURCE PAGES:\n{source}"
+    )
+
+def read_rows(csv_string):
+    """Split a CSV string into its header and data rows"""
+    rows = list(csv.reader(StringIO(csv_string)))
+    if not rows:
+        return [], []
+    return rows[0], [row for row in rows[1:] if row]
+
+def write_rows(header, rows):
+    """Join a header and data rows back into a CSV string"""
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().rstrip('\n')
+
+def repair_csv(csv_string, text_data, max_segments=5, binding=None, model_name=DEFAULT_MODEL_NAME):
+    """
+    Repair rows flagged by validation by re-querying only their source pages
+    
+    For each flagged segment, the page window it came from is re-sent together
+    with the neighbouring balances as anchors. Corrected rows are spliced back in
+    and kept only if they reduce the number of flagged rows.
+    
+    Args:
+        csv_string (str): Parsed CSV (cleaned and fixed)
+        text_data (str): Extracted PDF text the CSV was parsed from
+        max_segments (int): Upper bound on repair requests for one document
+        binding (dict): Optional prompt binding for the repair model
+        model_name (str): Model for repair requests when no binding is given
+        
+    Returns:
+        str: CSV string with repaired segments spliced in
+    """
+    _, report = validate_csv(csv_string)
+    if not report['flagged_rows']:
+        return csv_string
+    
+    header, rows = read_rows(csv_string)
+    pages = split_pages(text_data)
+    row_pages = locate_row_pages(rows, pages)
+    segments = find_segments(report['flagged_rows'], len(rows))
+    flagged_count = len(set(report['flagged_rows']))
+    
+    logger.info(f"Repairing {min(len(segments), max_segments)} of {len(segments)} flagged segments")
+    
+    # Splice from the end so earlier segment indices stay valid
+    for start, end in reversed(segments[:max_segments]):
+        request = build_repair_request(header, rows, start, end, pages, row_pages)
+        
+        try:
+            response = parse_with_gemini(request, SEGMENT_REPAIR_PROMPT, binding=binding,
+                                         model_name=model_name)
+        except Exception as e:
+            logger.warning(f"Repair request for rows {start + 1}-{end} failed: {str(e)}")
+            continue
+        
+        if not response:
+            continue
+        
+        _, corrected = read_rows(fix_incomplete_csv(clean_csv_response(response)))
+        corrected = [row for row in corrected if len(row) == len(header)]
+        if not corrected:
+            logger.warning(f"Repair for rows {start + 1}-{end} returned no usable rows")
+            continue
+        
+        candidate = rows[:start] + corrected + rows[end:]
+        _, candidate_report = validate_csv(write_rows(header, candidate))
+        candidate_count = len(set(candidate_report['flagged_rows']))
+        
+        if candidate_count < flagged_count:
+            logger.info(f"Repaired rows {start + 1}-{end}: flagged rows {flagged_count} -> {candidate_count}")
+            rows = candidate
+            flagged_count = candidate_count
+        else:
+            logger.warning(f"Repair for rows {start + 1}-{end} did not reduce issues, keeping original rows")
+    
+    return write_rows(header, rows)
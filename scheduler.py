@@ -0,0 +1,254 @@
+"""
+Request Scheduler Module
+Keeps LLM traffic within requests-per-minute and tokens-per-minute quotas
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Quotas from the Gemini console; unset means unlimited
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', '0'))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', '0'))
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '4'))
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate
+    
+    The balance may go negative when a request costs more than the bucket
+    holds or a reservation is corrected upwards; the debt delays later
+    requests instead of tripping the provider's limiter.
+    """
+    
+    def __init__(self, per_minute, full=True):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute) if full else 0.0
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount):
+        """Seconds until amount can be taken (amounts above capacity wait for a full bucket)"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+    
+    def take(self, amount):
+        self.tokens -= amount
+
+class QuotaScheduler:
+    """
+    Admits LLM requests only when both the RPM and TPM buckets allow them
+    
+    Thread-safe. Callers of acquire() are admitted strictly in arrival order,
+    so a large TPM request is not starved by smaller ones that would fit
+    sooner; the time spent waiting is recorded as queueing delay.
+    """
+    
+    def __init__(self, rpm=0, tpm=0, start_full=True):
+        """
+        Args:
+            rpm (int): Requests-per-minute quota (0 for unlimited)
+            tpm (int): Tokens-per-minute quota (0 for unlimited)
+            start_full (bool): Allow a full minute's burst straight away; when False
+                the buckets start empty and fill at the quota rate
+        """
+        self.rpm = TokenBucket(rpm, start_full) if rpm else None
+        self.tpm = TokenBucket(tpm, start_full) if tpm else None
+        self._lock = threading.Lock()
+        self._turn = threading.Condition(self._lock)
+        self._waiting = deque()
+        self._stats = {
+            'requests': 0,
+            'tokens': 0,
+            'throttled': 0,
+            'queue_delay_total': 0.0,
+            'queue_delay_max': 0.0
+        }
+        self._started = time.monotonic()
+    
+    def acquire(self, tokens):
+        """
+        Block until a request of the estimated token cost fits both quotas
+        
+        Args:
+            tokens (int): Estimated input tokens for the request
+        
+        Returns:
+            float: Queueing delay in seconds
+        """
+        requested = time.monotonic()
+        ticket = object()
+        
+        with self._turn:
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    # Only the caller at the head of the queue may take capacity
+                    if self._waiting[0] is ticket:
+                        wait_for = self._reserve(tokens, requested)
+                        if wait_for <= 0:
+                            return time.monotonic() - requested
+                        self._turn.wait(wait_for)
+                    else:
+                        self._turn.wait()
+            finally:
+                self._waiting.remove(ticket)
+                self._turn.notify_all()
+    
+    def try_acquire(self, tokens):
+        """
+        Admit a request only if both quotas have room for it right now
+        
+        Used for optional traffic such as hedged duplicates, which should be
+        dropped rather than queued when the quota is exhausted (or jump
+        ahead of callers already waiting in acquire()).
+        
+        Returns:
+            bool: True if capacity was taken
+        """
+        with self._lock:
+            return not self._waiting and self._reserve(tokens, time.monotonic()) <= 0
+    
+    def _reserve(self, tokens, requested):
+        """Take capacity if both buckets allow it; returns the seconds to wait (0 once admitted). Call with the lock held."""
+        now = time.monotonic()
+        buckets = [(b, amount) for b, amount in ((self.rpm, 1), (self.tpm, tokens)) if b]
+        for bucket, _ in buckets:
+            bucket.refill(now)
+        
+        wait_for = max([bucket.wait_time(amount) for bucket, amount in buckets] or [0.0])
+        if wait_for > 0:
+            return wait_for
+        
+        for bucket, amount in buckets:
+            bucket.take(amount)
+        delay = now - requested
+        self._stats['requests'] += 1
+        self._stats['tokens'] += tokens
+        self._stats['queue_delay_total'] += delay
+        self._stats['queue_delay_max'] = max(self._stats['queue_delay_max'], delay)
+        return 0.0
+    
+    def reconcile(self, estimated, actual):
+        """Correct the TPM bucket once the request's real token count is known"""
+        if not self.tpm or not actual:
+            return
+        with self._lock:
+            self.tpm.tokens -= actual - estimated
+            self._stats['tokens'] += actual - estimated
+    
+    def throttled(self):
+        """Empty the buckets after a quota error so callers back off until they refill"""
+        with self._lock:
+            self._stats['throttled'] += 1
+            for bucket in (self.rpm, self.tpm):
+                if bucket:
+                    bucket.tokens = min(bucket.tokens, 0.0)
+    
+    def get_counters(self):
+        """Raw admission counters (summed across processes by isolation.IsolatedProcess)"""
+        with self._lock:
+            return dict(self._stats)
+    
+    def get_stats(self):
+        """
+        Get admission metrics
+        
+        Returns:
+            dict: Request/token counts, throttling events, average and maximum queueing
+                delay, and RPM/TPM utilization over the scheduler's lifetime
+        """
+        minutes = (time.monotonic() - self._started) / 60.0
+        return summarize_counters(self.get_counters(), minutes,
+                                  self.rpm.capacity if self.rpm else 0, self.tpm.capacity if self.tpm else 0)
+
+def summarize_counters(counters, minutes, rpm=0, tpm=0):
+    """
+    Derive average queueing delay and RPM/TPM utilization from raw admission counters
+    
+    Args:
+        counters (dict): Counters from QuotaScheduler.get_counters (possibly summed)
+        minutes (float): Period the counters cover
+        rpm (int): Requests-per-minute quota (0 if unlimited)
+        tpm (int): Tokens-per-minute quota (0 if unlimited)
+    
+    Returns:
+        dict: Counters plus 'queue_delay_avg', 'rpm_utilization' and 'tpm_utilization'
+    """
+    stats = dict(counters)
+    minutes = max(minutes, 1e-9)
+    stats['queue_delay_avg'] = stats['queue_delay_total'] / stats['requests'] if stats['requests'] else 0.0
+    stats['rpm_utilization'] = stats['requests'] / minutes / rpm if rpm else None
+    stats['tpm_utilization'] = stats['tokens'] / minutes / tpm if tpm else None
+    return stats
+
+def run_jobs(jobs, handler, policy='smallest_first', workers=SCHEDULER_WORKERS):
+    """
+    Run a set of LLM jobs through a worker pool in quota-friendly order
+    
+    'smallest_first' finishes many small documents quickly (latency);
+    'largest_first' starts big requests early so small ones fill the gaps
+    left in each minute's token budget (throughput), and finishes a fixed
+    set of jobs soonest.
+    
+    Args:
+        jobs (dict): key -> request text
+        handler (callable): handler(key, text) -> result; its LLM calls go through acquire()
+        policy (str): 'smallest_first', 'largest_first' or 'fifo'
+        workers (int): Concurrent requests
+    
+    Returns:
+        dict: key -> result, or the exception raised for that key (in the order of jobs)
+    """
+    order = list(jobs)
+    if policy == 'smallest_first':
+        order.sort(key=lambda key: len(jobs[key]))
+    elif policy == 'largest_first':
+        order.sort(key=lambda key: len(jobs[key]), reverse=True)
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='scheduler') as executor:
+        futures = {key: executor.submit(handler, key, jobs[key]) for key in order}
+        for key in jobs:
+            try:
+                results[key] = futures[key].result()
+            except Exception as e:
+                results[key] = e
+    return results
+
+def get_scheduler():
+    """
+    Get the process-wide scheduler configured by GEMINI_RPM / GEMINI_TPM
+    
+    Its buckets start empty: this process cannot know what the quota's
+    other users (the worker it replaced, other batch nodes) just spent, so
+    it only admits traffic at the quota rate instead of a fresh burst.
+    
+    Returns:
+        QuotaScheduler: Shared scheduler, or None when no quota is configured
+    """
+    global _default_scheduler
+    if not (GEMINI_RPM or GEMINI_TPM):
+        return None
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = QuotaScheduler(GEMINI_RPM, GEMINI_TPM, start_full=False)
+            logger.info(f"Scheduling requests within {GEMINI_RPM or 'unlimited'} RPM / "
+                        f"{GEMINI_TPM or 'unlimited'} TPM")
+        return _default_scheduler
@@ -0,0 +1,389 @@
+"""
+Statement Parser Module
+Reusable in-memory API: PDF bytes in, validated transactions out
+"""
+
+import csv
+import io
+import logging
+
+import pandas as pd
+
+from pdf_extractor import extract_pages, format_plain_text, format_layout_text
+from llm_parser import parse_with_gemini, bind_prompt, get_token_usage, DEFAULT_MODEL_NAME
+from csv_handler import StreamingValidator, clean_csv_response, fix_incomplete_csv
+from repair import repair_csv
+from hybrid import parse_hybrid
+from structured_output import parse_structured
+from cascade import parse_with_cascade
+from accounts import detect_account_sections, parse_sections, group_by_account, account_output_path
+from transactions import CSV_COLUMNS, parse_transactions, transactions_to_csv
+from date_normalizer import infer_statement_year, normalize_transaction_dates
+from prompts import BANK_STATEMENT_PROMPT, STRUCTURED_STATEMENT_PROMPT
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def validate_transactions(transactions):
+    """
+    Validate parsed transactions without serializing them to CSV first
+    
+    Returns:
+        dict: Validation report (same structure as validate_csv)
+    """
+    validator = StreamingValidator()
+    for transaction in transactions:
+        validator.feed_row(transaction.to_row())
+    return validator.finish()
+
+class StatementResult:
+    """
+    Transactions parsed from one statement plus their validation report
+    
+    Rows stay as typed Transaction objects; conversions to dicts, a
+    DataFrame or CSV text happen only when asked for. A combined statement
+    covering several accounts gives one result per account in accounts, each
+    validated on its own balance chain; the combined result lists every
+    account's rows and adds an Account column to its outputs.
+    """
+    __slots__ = ('transactions', 'report', 'account', 'accounts')
+    
+    def __init__(self, transactions, report, account=None, accounts=None):
+        self.transactions = transactions
+        self.report = report
+        self.account = account
+        self.accounts = accounts if accounts is not None else {account: self}
+    
+    @classmethod
+    def combine(cls, results):
+        """
+        Combine per-account results into one
+        
+        Args:
+            results (dict): account -> StatementResult, or None for accounts that failed to parse
+        
+        Returns:
+            StatementResult: All parsed rows with a merged report; its report lists
+                'failed_accounts' and is only valid if every account parsed and validated
+        """
+        parsed = {account: result for account, result in results.items() if result is not None}
+        failed = [account for account, result in results.items() if result is None]
+        report = {
+            'is_valid': not failed and all(result.is_valid for result in parsed.values()),
+            'warnings': [],
+            'errors': [f"Account {account} could not be parsed" for account in failed],
+            'row_count': 0,
+            'issues_found': [],
+            'flagged_rows': [],
+            'failed_accounts': failed
+        }
+        transactions = []
+        for account, result in parsed.items():
+            report['warnings'].extend(f"{account}: {warning}" for warning in result.report['warnings'])
+            report['errors'].extend(f"{account}: {error}" for error in result.report['errors'])
+            report['issues_found'].extend(issue for issue in result.report['issues_found']
+                                          if issue not in report['issues_found'])
+            report['flagged_rows'].extend(len(transactions) + row for row in result.report['flagged_rows'])
+            report['row_count'] += result.report['row_count']
+            transactions.extend(result.transactions)
+        return cls(transactions, report, accounts=parsed)
+    
+    @property
+    def is_valid(self):
+        return self.report['is_valid']
+    
+    def _account_rows(self):
+        """(account, row) pairs across all accounts"""
+        for account, result in self.accounts.items():
+            for transaction in result.transactions:
+                yield account or '', transaction.to_row()
+    
+    def to_rows(self):
+        """Rows as dicts keyed by CSV column name (plus 'Account' for combined statements)"""
+        if len(self.accounts) < 2:
+            return [dict(zip(CSV_COLUMNS, transaction.to_row())) for transaction in self.transactions]
+        return [dict(zip(['Account'] + CSV_COLUMNS, [account] + row)) for account, row in self._account_rows()]
+    
+    def to_dataframe(self):
+        """Rows as a pandas DataFrame with the CSV columns (values as text)"""
+        if len(self.accounts) < 2:
+            return pd.DataFrame([transaction.to_row() for transaction in self.transactions], columns=CSV_COLUMNS)
+        return pd.DataFrame([[account] + row for account, row in self._account_rows()],
+                            columns=['Account'] + CSV_COLUMNS)
+    
+    def to_csv(self):
+        """Rows as a CSV string with a header row"""
+        if len(self.accounts) < 2:
+            return transactions_to_csv(self.transactions)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(['Account'] + CSV_COLUMNS)
+        for account, row in self._account_rows():
+            writer.writerow([account] + row)
+        return buffer.getvalue()
+    
+    def save(self, output_path, mode='column'):
+        """
+        Write the rows as CSV to output_path
+        
+        Args:
+            output_path (str): Output CSV path
+            mode (str): For combined statements, 'column' writes one CSV with an
+                Account column, 'split' writes one CSV per account next to output_path
+        """
+        if mode == 'split' and len(self.accounts) > 1:
+            for account, result in self.accounts.items():
+                result.save(account_output_path(output_path, account))
+            return
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_csv())
+        logger.info(f"CSV saved successfully to: {output_path}")
+
+class StatementParser:
+    """
+    Parse bank statements from paths, bytes or file-like objects entirely in memory
+    
+    One instance can be shared by many threads: it keeps no per-call state,
+    and the warm state it relies on (configured client, cached prompt
+    binding, rate limiter) is process-wide and lock-protected. Create it
+    once at service start-up and call parse() per request.
+    """
+    
+    def __init__(self, prompt=BANK_STATEMENT_PROMPT, model_name=DEFAULT_MODEL_NAME, binding=None,
+                 repair_binding=None, repair=True, layout=False, table_profile=None, use_ocr=True,
+                 hybrid=False, hybrid_binding=None, structured=False, model_ladder=None):
+        """
+        Args:
+            prompt (str): Parsing instructions
+            model_name (str): Gemini model to use
+            binding (dict): Optional prompt binding to use instead of the shared one
+            repair_binding (dict): Optional prompt binding for repair requests
+            repair (bool): Re-query the source pages of rows flagged by validation
+            layout (bool): Send layout-preserving text instead of plain text
+            table_profile: Table profile name or dict for the document family
+            use_ocr (bool): OCR pages that have no text layer
+            hybrid (bool): Build rows from extracted tables and ask the model only for
+                ambiguous fields, falling back to full parsing when tables do not cover the statement
+            hybrid_binding (dict): Optional prompt binding for hybrid field resolution
+            structured (bool): Ask for schema-constrained JSON rows instead of free-form CSV
+                (an explicit binding must then carry STRUCTURED_STATEMENT_PROMPT)
+            model_ladder (tuple): Model names, cheapest first; each text is parsed with the first
+                tier and escalated only when validation fails (replaces model_name; ignored with
+                an explicit binding, which pins the model). Hybrid field resolution and its
+                repair are single-model on the first tier; only the full-parse fallback escalates
+        """
+        self.prompt = prompt
+        self.model_name = model_name
+        self.binding = binding
+        self.repair_binding = repair_binding
+        self.repair = repair
+        self.layout = layout
+        self.table_profile = table_profile
+        self.use_ocr = use_ocr
+        self.hybrid = hybrid
+        self.hybrid_binding = hybrid_binding
+        self.structured = structured
+        self.model_ladder = tuple(model_ladder) if model_ladder else (model_name,)
+    
+    def get_binding(self, model_name=None):
+        """Explicit binding, or the shared binding for the active prompt (created once, refreshed when its cache expires)"""
+        if self.binding:
+            return self.binding
+        return bind_prompt(STRUCTURED_STATEMENT_PROMPT if self.structured else self.prompt,
+                           model_name or self.model_ladder[0])
+    
+    def warm_up(self):
+        """Configure the client and bind the prompt ahead of the first request"""
+        self.get_binding()
+        return self
+    
+    def extract(self, source):
+        """
+        Extract pages and the text sent for parsing
+        
+        Args:
+            source: PDF path, bytes or binary file-like object
+        
+        Returns:
+            tuple: (list of PageExtraction, formatted text)
+        """
+        pages = extract_pages(source, use_ocr=self.use_ocr, profile=self.table_profile)
+        formatter = format_layout_text if self.layout else format_plain_text
+        return pages, formatter(pages)
+    
+    def parse_text(self, text_data):
+        """
+        Parse extracted statement text into cleaned CSV, repairing flagged rows
+        
+        With a model ladder the cheapest tier goes first and stronger models
+        are only asked when validation fails (see cascade.parse_with_cascade).
+        
+        Args:
+            text_data (str): Extracted text of one statement (or one account section)
+        
+        Returns:
+            str: CSV string, or None if parsing failed
+        """
+        if len(self.model_ladder) > 1 and not self.binding:
+            return parse_with_cascade(text_data, self.parse_text_with_model, self.model_ladder)
+        return self.parse_text_with_model(text_data, self.model_ladder[0])
+    
+    def parse_text_with_model(self, text_data, model_name):
+        """
+        Parse extracted statement text with one model, repairing flagged rows with the same model
+        
+        Returns:
+            str: CSV string, or None if parsing failed
+        """
+        csv_result = None
+        if self.structured:
+            try:
+                csv_result = parse_structured(text_data, binding=self.get_binding(model_name))
+            except ValueError as e:
+                logger.warning(f"Structured output could not be decoded ({str(e)}), retrying as CSV")
+        
+        if csv_result is None:
+            binding = bind_prompt(self.prompt, model_name) if self.structured else self.get_binding(model_name)
+            csv_result = parse_with_gemini(text_data, self.prompt, binding=binding)
+            if csv_result:
+                csv_result = fix_incomplete_csv(clean_csv_response(csv_result))
+        
+        if not csv_result:
+            logger.error("Failed to parse with Gemini")
+            return None
+        
+        usage = get_token_usage()
+        logger.info(f"Token usage so far: {usage['prompt_tokens']} prompt, "
+                    f"{usage['cached_tokens']} served from cache ({usage['cache_savings']:.0%}), "
+                    f"{usage['output_tokens']} output")
+        
+        # Repair flagged rows from their source pages only
+        if self.repair:
+            logger.info("Checking for rows that need repair...")
+            csv_result = repair_csv(csv_result, text_data, binding=self.repair_binding, model_name=model_name)
+        
+        return csv_result
+    
+    def parse_pages(self, pages, text_data):
+        """
+        Parse extracted pages, from their tables in hybrid mode or from the text otherwise
+        
+        Args:
+            pages (list): PageExtraction objects
+            text_data (str): Formatted text of the same pages
+        
+        Returns:
+            str: CSV string, or None if parsing failed
+        """
+        if not self.hybrid:
+            return self.parse_text(text_data)
+        
+        # Field questions are small and checked by the balance chain, so they stay on the
+        # cheapest tier; the full-parse fallback below goes through the cascade
+        model_name = self.model_ladder[0]
+        csv_result = parse_hybrid(pages, binding=self.hybrid_binding, model_name=model_name)
+        if csv_result is None:
+            logger.info("Falling back to full LLM parsing")
+            return self.parse_text(text_data)
+        
+        if self.repair:
+            logger.info("Checking for rows that need repair...")
+            csv_result = repair_csv(csv_result, text_data, binding=self.repair_binding, model_name=model_name)
+        
+        return csv_result
+    
+    def build_result(self, csv_result, year_hint=None):
+        """
+        Turn parsed CSV (as returned by parse_pages) into typed, date-normalized and validated transactions
+        
+        Returns:
+            StatementResult: Transactions and validation report
+        """
+        return self.validate_result(parse_transactions(csv_result), year_hint)
+    
+    def validate_result(self, transactions, year_hint=None, account=None):
+        """
+        Normalize dates and validate one balance chain
+        
+        Returns:
+            StatementResult: Transactions and validation report
+        """
+        normalize_transaction_dates(transactions, year_hint)
+        
+        report = validate_transactions(transactions)
+        prefix = f"Account {account}: " if account else ""
+        if not report['is_valid']:
+            logger.error(f"{prefix}Validation errors: {report['errors']}")
+        if report['warnings']:
+            logger.warning(f"{prefix}Warnings: {report['warnings']}")
+        
+        return StatementResult(transactions, report, account)
+    
+    def parse_document(self, pages, text_data, year_hint=None):
+        """
+        Parse extracted pages, splitting combined statements into per-account jobs
+        
+        Each account's balance chain is parsed and validated on its own (see
+        accounts.detect_account_sections); a single-account statement goes
+        through parse_pages.
+        
+        Args:
+            pages (list): PageExtraction objects
+            text_data (str): Formatted text of the same pages
+            year_hint (int): Statement start year for yearless dates
+        
+        Returns:
+            StatementResult: Transactions and validation report (combined across accounts),
+                or None if nothing could be parsed
+        """
+        sections = detect_account_sections(pages)
+        if len(sections) < 2:
+            csv_result = self.parse_pages(pages, text_data)
+            return self.build_result(csv_result, year_hint) if csv_result else None
+        
+        logger.info(f"Parsing {len(sections)} account sections in parallel...")
+        formatter = format_layout_text if self.layout else format_plain_text
+        results = parse_sections(sections, self.parse_text, formatter)
+        
+        accounts = {
+            account: None if transactions is None else self.validate_result(transactions, year_hint, account)
+            for account, transactions in group_by_account(sections, results).items()
+        }
+        if all(result is None for result in accounts.values()):
+            return None
+        
+        result = StatementResult.combine(accounts)
+        if result.report['failed_accounts']:
+            logger.error(f"Failed to parse accounts: {result.report['failed_accounts']}")
+        return result
+    
+    def parse(self, source, output_path=None, year_hint=None):
+        """
+        Parse one statement
+        
+        Args:
+            source: PDF path, bytes or binary file-like object
+            output_path (str): Also write the CSV here (optional; nothing is written by default)
+            year_hint (int): Statement start year for yearless dates (inferred from the text when omitted)
+        
+        Returns:
+            StatementResult: Transactions and validation report, or None if nothing could be parsed.
+                Combined statements give one result whose accounts attribute holds each account's.
+        """
+        pages, text_data = self.extract(source)
+        
+        if not text_data or len(text_data.strip()) == 0:
+            logger.error("No text extracted from PDF")
+            return None
+        
+        logger.info(f"Extracted {len(text_data)} characters from PDF")
+        
+        result = self.parse_document(pages, text_data, year_hint or infer_statement_year(text_data))
+        if result is None:
+            return None
+        
+        if output_path:
+            result.save(output_path)
+        
+        return result
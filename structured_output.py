@@ -0,0 +1,114 @@
+"""
+Structured Output Module
+Requests statement rows as compact positional JSON and decodes them locally in one pass
+"""
+
+import json
+import logging
+import re
+
+from llm_parser import parse_with_gemini
+from prompts import STRUCTURED_STATEMENT_PROMPT
+from transactions import Transaction, parse_date, transactions_to_csv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Positional rows keep keys out of the output entirely:
+# [date, cheque_no, narration, debit, credit, balance] with amounts in integer minor
+# units, "" for no cheque number and 0 for an unused debit/credit column. Mixed-type
+# arrays cannot be expressed as a response schema, so JSON mode guarantees the
+# syntax and decode_rows checks the shape.
+ROW_WIDTH = 6
+
+INTEGER_TEXT = re.compile(r'^-?\d+$')
+
+STRUCTURED_GENERATION_CONFIG = {
+    'response_mime_type': 'application/json'
+}
+
+def _minor_units(value, column, index):
+    """
+    Accept integer minor units only
+    
+    Floats and decimal strings are rejected rather than rescaled: 1500.0 and
+    "23450.50" could each be minor or major units, and guessing per value would
+    mix scales within one response. The ValueError sends the text to the CSV
+    fallback instead.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Row {index}: {column} is not an amount")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and INTEGER_TEXT.match(value.strip()):
+        return int(value.strip())
+    raise ValueError(f"Row {index}: {column} value {value!r} is not an integer amount in minor units")
+
+def decode_rows(response_text):
+    """
+    Decode a structured response into transactions in a single pass
+    
+    Every row must decode; a truncated or malformed response raises instead
+    of silently losing rows.
+    
+    Args:
+        response_text (str): JSON array of positional rows
+    
+    Returns:
+        list: Transaction objects in statement order
+    
+    Raises:
+        ValueError: If the response is not complete, well-formed JSON rows
+    """
+    try:
+        rows = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Structured response is not complete JSON ({str(e)})") from e
+    if not isinstance(rows, list):
+        raise ValueError("Structured response is not a JSON array of rows")
+    
+    transactions = []
+    for index, row in enumerate(rows, 1):
+        if not isinstance(row, list) or len(row) != ROW_WIDTH:
+            raise ValueError(f"Row {index} is not a {ROW_WIDTH}-field array: {row!r}")
+        date_value, cheque_no, narration, debit, credit, balance = row
+        date_text = str(date_value or '').strip()
+        ordinal = parse_date(date_text)
+        transactions.append(Transaction(
+            date=ordinal,
+            raw_date=None if ordinal is not None or not date_text else date_text,
+            cheque_no=str(cheque_no or '').strip(),
+            narration=' '.join(str(narration or '').split()),
+            # 0 marks the unused side
+            debit=_minor_units(debit, 'debit', index) or None,
+            credit=_minor_units(credit, 'credit', index) or None,
+            balance=_minor_units(balance, 'balance', index)
+        ))
+    
+    return transactions
+
+def parse_structured(text_data, binding=None):
+    """
+    Parse statement text with compact JSON output
+    
+    Args:
+        text_data (str): Extracted text from the PDF
+        binding (dict): Optional prompt binding to use instead of the shared one
+    
+    Returns:
+        str: CSV string built from the decoded rows, or None for an empty response
+    
+    Raises:
+        ValueError: If the response cannot be decoded completely
+    """
+    response = parse_with_gemini(text_data, STRUCTURED_STATEMENT_PROMPT, binding=binding,
+                                 generation_config=STRUCTURED_GENERATION_CONFIG)
+    if not response:
+        return None
+    
+    transactions = decode_rows(response)
+    logger.info(f"Decoded {len(transactions)} rows from structured output")
+    return transactions_to_csv(transactions)
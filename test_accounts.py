@@ -0,0 +1,105 @@
+"""
+Tests for account section detection and per-account outputs
+"""
+
+import re
+
+from accounts import detect_account_sections, group_by_account
+from llm_parser import make_binding
+from pdf_extractor import PageExtraction, format_plain_text
+from statement_parser import StatementParser
+from transactions import Transaction, parse_date, transactions_to_csv
+
+def page(number, *lines):
+    text = '\n'.join(lines)
+    return PageExtraction(number, text=text, layout_text=text)
+
+def test_counterparty_accounts_in_narrations_are_not_sections():
+    pages = [
+        page(1, "Account Number: 1111 2222 3333", "Opening Balance: 1,000.00",
+             "01/01/2024 NEFT TRF TO A/C 99887766554 100.00 900.00",
+             "02/01/2024 IMPS FROM ACCOUNT 12345678901 50.00 950.00",
+             "TO A/C 99887766554 BILL PAY"),
+        page(2, "Account Number: 1111 2222 3333", "03/01/2024 ATM 50.00 900.00")
+    ]
+    
+    sections = detect_account_sections(pages)
+    
+    assert [section['account'] for section in sections] == ['111122223333']
+    assert sections[0]['opening_balance'] == 100000
+    assert len(sections[0]['pages']) == 2
+
+def test_second_account_mid_page_starts_a_section():
+    pages = [
+        page(1, "Account No: 1111 2222 3333", "01/01/2024 ATM 100.00 900.00",
+             "Account No: 9999-8888", "Opening Balance 5,000.00", "01/01/2024 Salary 1,000.00 6,000.00")
+    ]
+    
+    sections = detect_account_sections(pages)
+    
+    assert [section['account'] for section in sections] == ['111122223333', '99998888']
+    assert sections[1]['opening_balance'] == 500000
+
+def row(day, narration, debit, balance):
+    return Transaction(date=parse_date(f"2024-01-{day:02d}"), narration=narration, debit=debit, balance=balance)
+
+def test_repeated_account_sections_are_merged():
+    sections = [{'account': 'A'}, {'account': 'B'}, {'account': 'A'}]
+    results = [
+        transactions_to_csv([row(1, "NEFT, SALARY ACME", 100, 900)]),
+        transactions_to_csv([row(1, "ATM", 100, 4900)]),
+        transactions_to_csv([row(2, "Shop", 50, 850)])
+    ]
+    
+    accounts = group_by_account(sections, results)
+    
+    assert [(t.narration, t.debit, t.balance) for t in accounts['A']] == [
+        ("NEFT, SALARY ACME", 100, 900), ("Shop", 50, 850)
+    ]
+    assert [t.narration for t in accounts['B']] == ["ATM"]
+
+def test_failed_section_fails_its_account():
+    sections = [{'account': 'A'}, {'account': 'A'}, {'account': 'B'}]
+    results = [transactions_to_csv([row(1, "ATM", 100, 900)]), None, transactions_to_csv([row(1, "ATM", 100, 900)])]
+    
+    accounts = group_by_account(sections, results)
+    
+    assert accounts['A'] is None
+    assert len(accounts['B']) == 1
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+class EchoModel:
+    """Stand-in model that turns 'DD/MM/YYYY Narration debit balance' lines into CSV"""
+    
+    def generate_content(self, contents, **kwargs):
+        rows = re.findall(r'(\d\d)/(\d\d)/(\d{4}) (\w+) ([\d,.]+) ([\d,.]+)', contents)
+        lines = [f"{y}-{m}-{d},,{narration},{debit.replace(',', '')},,{balance.replace(',', '')}"
+                 for d, m, y, narration, debit, balance in rows]
+        return Response('\n'.join(["Date,Cheque No.,Narration,Debit,Credit,Balance"] + lines))
+
+def test_library_api_splits_combined_statements(tmp_path):
+    parser = StatementParser(binding=make_binding(EchoModel(), 'prompt', 'system'), repair=False)
+    pages = [
+        page(1, "Account No: 1111 2222 3333", "Opening Balance: 1,000.00",
+             "01/01/2024 ATM 100.00 900.00", "02/01/2024 Shop 50.00 850.00"),
+        page(2, "Account No: 1111 2222 3333", "03/01/2024 Rent 50.00 800.00",
+             "Account No: 9999-8888", "Opening Balance 5,000.00", "01/01/2024 Salary 1,000.00 4,000.00"),
+        page(3, "A/C No. 9999 8888", "02/01/2024 ATM 100.00 3,900.00")
+    ]
+    
+    result = parser.parse_document(pages, format_plain_text(pages), 2024)
+    
+    assert list(result.accounts) == ['111122223333', '99998888']
+    assert result.is_valid
+    assert [len(r.transactions) for r in result.accounts.values()] == [3, 2]
+    assert result.to_rows()[3] == {
+        'Account': '99998888', 'Date': '2024-01-01', 'Cheque No.': '', 'Narration': 'Salary',
+        'Debit': '1000.00', 'Credit': '', 'Balance': '4000.00'
+    }
+    
+    result.save(str(tmp_path / "out.csv"), mode='split')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['out_111122223333.csv', 'out_99998888.csv']
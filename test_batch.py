@@ -0,0 +1,85 @@
+"""
+Tests for workers draining a shared directory through lease files
+"""
+
+import json
+import multiprocessing
+import os
+import time
+
+from batch import (
+    LeaseKeeper, acquire_lease, owns_lease, process_one, read_manifest, run_worker, state_paths
+)
+
+def slow_process(input_path, output_path):
+    """Dummy conversion that takes long enough for workers to overlap"""
+    time.sleep(0.05)
+    with open(output_path, 'w') as f:
+        f.write(f"{os.path.basename(input_path)},{os.getpid()}\n")
+    return True
+
+def drain(input_dir, output_dir, worker_id):
+    return worker_id, run_worker(input_dir, output_dir, slow_process, worker_id=worker_id, lease_ttl=30)
+
+def make_inputs(directory, count):
+    directory.mkdir()
+    for n in range(count):
+        (directory / f"doc{n:02d}.pdf").write_bytes(b'%PDF-1.4' + b' ' * n)
+
+def test_three_workers_process_each_document_once(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    make_inputs(input_dir, 24)
+    
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        results = dict(pool.starmap(drain, [(str(input_dir), str(output_dir), f"w{n}") for n in range(3)]))
+    
+    manifest = read_manifest(str(output_dir))
+    assert sum(summary['processed'] for summary in results.values()) == 24
+    assert sum(summary['failed'] for summary in results.values()) == 0
+    assert len(manifest['done']) == 24
+    assert manifest['failed'] == {} and manifest['in_progress'] == []
+    assert sorted(path.name for path in output_dir.glob('*.csv')) == [f"doc{n:02d}.csv" for n in range(24)]
+    assert not list(output_dir.glob('.*.tmp'))
+
+def test_expired_lease_is_taken_over(tmp_path):
+    lease_path = str(tmp_path / 'doc.pdf.lease')
+    
+    assert acquire_lease(lease_path, 'w1', ttl=30)
+    assert not acquire_lease(lease_path, 'w2', ttl=30)
+    
+    # w1 died without renewing
+    with open(lease_path, 'w') as f:
+        json.dump({'worker': 'w1', 'expires_at': time.time() - 1}, f)
+    assert acquire_lease(lease_path, 'w2', ttl=30)
+    assert owns_lease(lease_path, 'w2') and not owns_lease(lease_path, 'w1')
+
+def test_lease_renewed_while_processing(tmp_path):
+    lease_path = str(tmp_path / 'doc.pdf.lease')
+    assert acquire_lease(lease_path, 'w1', ttl=1)
+    
+    with LeaseKeeper(lease_path, 'w1', ttl=1):
+        time.sleep(1.5)
+        assert not acquire_lease(lease_path, 'w2', ttl=1)
+    assert owns_lease(lease_path, 'w1')
+
+def test_result_discarded_after_losing_lease(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    make_inputs(input_dir, 1)
+    output_dir.mkdir()
+    paths = state_paths(str(output_dir))
+    pdf = input_dir / 'doc00.pdf'
+    lease_path = str(paths['leases'] / 'doc00.pdf.lease')
+    assert acquire_lease(lease_path, 'w1', ttl=30)
+    
+    def stalled_process(input_path, output_path):
+        # The lease expires and another worker takes the document over meanwhile
+        with open(lease_path, 'w') as f:
+            json.dump({'worker': 'w2', 'expires_at': time.time() + 30}, f)
+        return slow_process(input_path, output_path)
+    
+    assert process_one(pdf, str(output_dir), paths, 'w1', stalled_process, lease_ttl=30) is None
+    
+    manifest = read_manifest(str(output_dir))
+    assert manifest['done'] == {} and manifest['failed'] == {}
+    assert not list(output_dir.glob('*.csv')) and not list(output_dir.glob('.*.tmp'))
+    assert owns_lease(lease_path, 'w2')
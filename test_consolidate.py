@@ -0,0 +1,40 @@
+"""
+Tests for merging statement outputs into one ledger
+"""
+
+import csv
+
+from consolidate import consolidate
+
+HEADER = "Date,Cheque No.,Narration,Debit,Credit,Balance\n"
+
+def write(path, rows):
+    path.write_text(HEADER + ''.join(row + '\n' for row in rows))
+    return path
+
+def read_narrations(path):
+    with open(path, newline='') as f:
+        return [row['Narration'] for row in csv.DictReader(f)]
+
+def test_opening_balance_rows_stay_with_their_statement(tmp_path):
+    february = write(tmp_path / "feb.csv", [",,Opening Balance,,,850.00", "2024-02-03,,Rent,50.00,,800.00"])
+    january = write(tmp_path / "jan.csv", [",,Opening Balance,,,1000.00", "2024-01-02,,ATM,100.00,,900.00",
+                                           "2024-01-20,,Shop,50.00,,850.00"])
+    output = tmp_path / "ledger.csv"
+    
+    report = consolidate([february, january], str(output))
+    
+    assert read_narrations(output) == ["Opening Balance", "ATM", "Shop", "Opening Balance", "Rent"]
+    assert report['boundary_breaks'] == 0
+    assert report['balance_breaks'] == 0
+
+def test_overlapping_periods_are_deduplicated(tmp_path):
+    first = write(tmp_path / "a.csv", ["2024-01-02,,ATM,100.00,,900.00", "2024-01-05,,Shop,50.00,,850.00"])
+    second = write(tmp_path / "b.csv", ["2024-01-05,,Shop,50.00,,850.00", "2024-01-09,,Rent,50.00,,800.00"])
+    output = tmp_path / "ledger.csv"
+    
+    report = consolidate([first, second], str(output))
+    
+    assert read_narrations(output) == ["ATM", "Shop", "Rent"]
+    assert report['duplicates_removed'] == 1
+    assert report['boundary_breaks'] == 0
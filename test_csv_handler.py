@@ -0,0 +1,83 @@
+"""
+Tests for CSV validation of running balances in both statement orders
+"""
+
+import pytest
+
+import repair
+from cascade import escalation_reason, parse_with_cascade
+from csv_handler import StreamingValidator, validate_csv, validate_csv_stream
+
+HEADER = "Date,Cheque No.,Narration,Debit,Credit,Balance"
+OLDEST_FIRST = [
+    "2024-01-01,,Opening,,,1000.00",
+    "2024-01-02,,ATM,100.00,,900.00",
+    "2024-01-03,,Salary,,500.00,1400.00",
+    "2024-01-04,,Rent,400.00,,1000.00",
+]
+
+def as_csv(rows):
+    return '\n'.join([HEADER] + rows)
+
+def both_reports(rows):
+    _, report = validate_csv(as_csv(rows))
+    return report, validate_csv_stream(as_csv(rows).split('\n'))
+
+@pytest.mark.parametrize('rows', [OLDEST_FIRST, OLDEST_FIRST[::-1]])
+def test_consistent_chain_passes_in_either_order(rows):
+    for report in both_reports(rows):
+        assert report['flagged_rows'] == []
+        assert 'balance_inconsistency' not in report['issues_found']
+        assert escalation_reason(report) is None
+
+def test_newest_first_break_flags_the_newer_row():
+    rows = OLDEST_FIRST[::-1]
+    rows[1] = "2024-01-03,,Salary,,500.00,1500.00"
+    
+    for report in both_reports(rows):
+        # The wrong balance breaks the step into the Salary row and the step out of it into Rent
+        assert report['flagged_rows'] == [0, 1]
+        assert 'balance_inconsistency' in report['issues_found']
+
+def test_clean_newest_first_statement_needs_no_repair_or_escalation(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("no model request expected")
+    monkeypatch.setattr(repair, 'parse_with_gemini', fail)
+    csv_text = as_csv(OLDEST_FIRST[::-1])
+    
+    assert repair.repair_csv(csv_text, "statement text") == csv_text
+    
+    tiers = []
+    def parse_tier(text_data, model_name):
+        tiers.append(model_name)
+        return csv_text
+    assert parse_with_cascade("statement text", parse_tier, ('cheap', 'strong')) == csv_text
+    assert tiers == ['cheap']
+
+def test_streaming_report_matches_validate_csv():
+    rows = [
+        "2024-01-01,,Opening,,,1000.00",
+        "02/01/2024,,ATM,100.00,,900.00",
+        "2024-01-03,,Salary,,500.00,1400.00",
+        "2024-01-02,,Refund,50.00,50.00,1400.00",
+        "2024-01-04,,Rent,abc,,1000.00",
+        "2024-01-05,,Fee,10.00,,",
+        "2024-01-06,,Shop,20.00,,970.00",
+        "2024-01-06,,Shop,20.00,,950.00",
+        "2024-01-07,,Transfer,,100.00,1100.00",
+    ]
+    
+    batch, streaming = both_reports(rows)
+    
+    assert streaming == batch
+    assert {'date_format', 'date_order', 'debit_credit_conflict', 'missing_balance', 'invalid_debit',
+            'balance_inconsistency', 'duplicates'} <= set(batch['issues_found'])
+
+def test_streaming_flagged_rows_are_capped(monkeypatch):
+    monkeypatch.setattr(StreamingValidator, 'MAX_FLAGGED_ROWS', 10)
+    rows = [f"2024-01-01,,Row {n},1.00,1.00,{n}.00" for n in range(100)]
+    
+    report = validate_csv_stream(as_csv(rows).split('\n'))
+    
+    assert len(report['flagged_rows']) == 10
+    assert any('more flagged rows not listed' in warning for warning in report['warnings'])
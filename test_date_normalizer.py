@@ -0,0 +1,43 @@
+"""
+Tests for yearless date normalization in both statement orders
+"""
+
+from datetime import date
+
+from date_normalizer import infer_statement_year, normalize_dates
+
+def as_dates(values, year_hint):
+    return [value.date() for value in normalize_dates(values, year_hint=year_hint)]
+
+def test_oldest_first_wraps_into_next_year():
+    assert as_dates(['28 Dec', '30 Dec', '02 Jan', '05 Jan'], 2023) == [
+        date(2023, 12, 28), date(2023, 12, 30), date(2024, 1, 2), date(2024, 1, 5)
+    ]
+
+def test_newest_first_wraps_into_previous_year():
+    assert as_dates(['05 Jan', '02 Jan', '30 Dec'], 2023) == [
+        date(2024, 1, 5), date(2024, 1, 2), date(2023, 12, 30)
+    ]
+
+def test_newest_first_over_several_months():
+    assert as_dates(['15 Mar', '10 Feb', '05 Jan', '20 Dec', '10 Nov'], 2023) == [
+        date(2024, 3, 15), date(2024, 2, 10), date(2024, 1, 5), date(2023, 12, 20), date(2023, 11, 10)
+    ]
+
+def test_year_hint_from_statement_period():
+    header = ("Acme Bank, 2001 Main St, Springfield\n"
+              "Customer since 1998\n"
+              "Statement period: 01 Dec 2023 to 31 Jan 2024\n")
+    
+    assert infer_statement_year(header) == 2023
+    assert as_dates(['05 Jan', '02 Jan', '30 Dec'], infer_statement_year(header)) == [
+        date(2024, 1, 5), date(2024, 1, 2), date(2023, 12, 30)
+    ]
+    assert as_dates(['30 Dec', '02 Jan', '05 Jan'], infer_statement_year(header)) == [
+        date(2023, 12, 30), date(2024, 1, 2), date(2024, 1, 5)
+    ]
+
+def test_statement_year_ignores_years_outside_dates():
+    assert infer_statement_year("Branch 2019, PO Box 1987\nDate Narration\n2024-03-01 Opening") == 2024
+    assert infer_statement_year("Statement for March 5, 2022 - April 4, 2022") == 2022
+    assert infer_statement_year("Unit 2001, Tower B") is None
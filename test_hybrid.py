@@ -0,0 +1,89 @@
+"""
+Tests for building rows from extracted tables in hybrid mode
+"""
+
+from hybrid import RowSkeleton, apply_answers, build_skeletons, resolve_sides
+from pdf_extractor import PageExtraction
+
+HEADER = ['Date', 'Narration', 'Chq No', 'Withdrawal', 'Deposit', 'Balance']
+
+def page(number, rows, text):
+    return PageExtraction(number, tables=[rows], text='\n'.join(text))
+
+def statement_pages(continuation_row):
+    first = page(1, [
+        HEADER,
+        ['01/01/2024', 'Opening', '', '', '', '1,000.00'],
+        ['02/01/2024 10:32', 'ATM CASH', '', '100.00', '', '900.00'],
+        ['', 'MAIN ST BRANCH', '', '', '', ''],
+    ], [
+        'Statement period 01/01/2024 to 31/01/2024',
+        '01/01/2024 Opening 1,000.00',
+        '02/01/2024 10:32 ATM CASH 100.00 900.00',
+        'MAIN ST BRANCH',
+    ])
+    second = page(2, [
+        ['03/01/2024', 'SALARY', '', '', '500.00', '1,400.00'],
+        continuation_row,
+    ], [
+        '03/01/2024 SALARY 500.00 1,400.00',
+        '04/01/2024 RENT 400.00 1,000.00',
+    ])
+    return [first, second]
+
+def test_builds_rows_across_continuation_pages():
+    skeletons = build_skeletons(statement_pages(['04/01/2024', 'RENT', '', '400.00', '', '1,000.00']))
+    
+    assert [(s.date, s.narration, s.debit, s.credit, s.balance) for s in skeletons] == [
+        ('01/01/2024', 'Opening', None, None, 100000),
+        ('02/01/2024', 'ATM CASH', 10000, None, 90000),
+        ('03/01/2024', 'SALARY', None, 50000, 140000),
+        ('04/01/2024', 'RENT', 40000, None, 100000),
+    ]
+    # The wrapped line is kept for the model to merge into the narration
+    assert skeletons[1].needs == {'narration'}
+    assert skeletons[1].lines[-1] == 'MAIN ST BRANCH'
+
+def test_misaligned_row_falls_back_to_full_parsing():
+    # A 7-cell row cannot be mapped onto the 6-column header; it must not vanish
+    pages = statement_pages(['04/01/2024', 'RENT', '', '', '400.00', '', '1,000.00'])
+    
+    assert build_skeletons(pages) is None
+
+def test_page_without_tables_falls_back_to_full_parsing():
+    pages = statement_pages(['04/01/2024', 'RENT', '', '400.00', '', '1,000.00'])
+    pages.append(PageExtraction(3, text='05/01/2024 ATM 50.00 950.00'))
+    
+    assert build_skeletons(pages) is None
+
+def skeleton(row_id, amount=None, balance=None, debit=None):
+    row = RowSkeleton(row_id, '01/01/2024', ['line'])
+    row.amount, row.balance, row.debit = amount, balance, debit
+    return row
+
+def test_resolve_sides_from_balance_movement():
+    rows = [skeleton(1, balance=100000), skeleton(2, amount=2500, balance=97500),
+            skeleton(3, amount=5000, balance=102500), skeleton(4, amount=700, balance=110000)]
+    
+    resolve_sides(rows)
+    
+    assert (rows[1].debit, rows[1].credit, rows[1].amount) == (2500, None, None)
+    assert (rows[2].debit, rows[2].credit, rows[2].amount) == (None, 5000, None)
+    assert rows[3].amount == 700 and rows[3].needs == {'side'}
+
+def test_apply_answers_fills_only_requested_fields():
+    row = skeleton(7, amount=700, balance=110000)
+    row.needs = {'side', 'narration'}
+    other = skeleton(8, debit=100)
+    
+    applied = apply_answers({'7': row, '8': other}, {
+        '7': {'s': 'cr', 'n': ' UPI  REFUND ', 'c': '123'},
+        '8': {'n': 'ignored'},
+        '9': {'s': 'D'},
+        '10': 'not an object',
+    })
+    
+    assert applied == 2
+    assert (row.credit, row.amount, row.narration, row.cheque_no) == (700, None, 'UPI REFUND', '')
+    assert row.needs == set()
+    assert other.narration == ''
@@ -0,0 +1,77 @@
+"""
+Tests for isolated document workers: deadlines, recycling, quarantine and counters
+"""
+
+import os
+import time
+
+import pytest
+
+from batch import read_manifest, run_worker
+from isolation import DocumentTimeout, IsolatedProcess, merge_counters
+
+def fake_process(input_path, output_path):
+    """Writes the worker's pid; documents named hang* never finish"""
+    if os.path.basename(input_path).startswith('hang'):
+        time.sleep(60)
+    with open(output_path, 'w') as f:
+        f.write(f"{os.getpid()}\n")
+    return os.getpid()
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+def test_worker_killed_at_deadline(tmp_path):
+    with IsolatedProcess(fake_process, deadline=1, max_tasks=0) as isolated:
+        first = isolated(str(tmp_path / 'a.pdf'), str(tmp_path / 'a.csv'))
+        
+        started = time.monotonic()
+        with pytest.raises(DocumentTimeout):
+            isolated(str(tmp_path / 'hang.pdf'), str(tmp_path / 'hang.csv'))
+        assert time.monotonic() - started < 5
+        assert not pid_alive(first)
+        
+        # The next document gets a fresh worker
+        second = isolated(str(tmp_path / 'b.pdf'), str(tmp_path / 'b.csv'))
+    
+    assert second != first
+    assert isolated.stats == {'documents': 3, 'timeouts': 1, 'crashes': 0, 'recycled': 0}
+
+def test_worker_recycled_after_max_tasks(tmp_path):
+    with IsolatedProcess(fake_process, deadline=10, max_tasks=2) as isolated:
+        pids = [isolated(str(tmp_path / f'{n}.pdf'), str(tmp_path / f'{n}.csv')) for n in 'abc']
+    
+    assert pids[0] == pids[1] != pids[2]
+    assert isolated.stats['recycled'] == 1
+
+def test_document_quarantined_after_repeated_kills(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    input_dir.mkdir()
+    for name in ('a.pdf', 'hang.pdf', 'b.pdf'):
+        (input_dir / name).write_bytes(b'%PDF-1.4')
+    
+    with IsolatedProcess(fake_process, deadline=1, max_tasks=0) as isolated:
+        summary = run_worker(str(input_dir), str(output_dir), isolated, worker_id='w1',
+                             lease_ttl=30, quarantine_after=2)
+    
+    manifest = read_manifest(str(output_dir))
+    assert summary == {'processed': 2, 'failed': 2}
+    assert sorted(manifest['done']) == ['a.pdf', 'b.pdf']
+    assert list(manifest['quarantine']) == ['hang.pdf']
+    assert isolated.stats['timeouts'] == 2
+
+def test_counters_sum_growth_across_children():
+    totals = {}
+    # First child reports twice, then is recycled; a second child starts from zero
+    merge_counters(totals, {'scheduler': {'requests': 2, 'queue_delay_max': 0.5}}, {})
+    merge_counters(totals, {'scheduler': {'requests': 5, 'queue_delay_max': 0.7}},
+                   {'scheduler': {'requests': 2, 'queue_delay_max': 0.5}})
+    merge_counters(totals, {'scheduler': {'requests': 1, 'queue_delay_max': 0.2},
+                            'models': {None: {'requests': 1}}}, {})
+    
+    assert totals == {'scheduler': {'requests': 6, 'queue_delay_max': 0.7},
+                      'models': {None: {'requests': 1}}}
@@ -0,0 +1,173 @@
+"""
+Tests for request deadlines, retries, hedging and token accounting
+Run against a local fault-injecting stand-in for the Gemini model
+"""
+
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import llm_parser
+from llm_parser import (
+    GeminiRequestError, call_with_deadline, generate_with_retry, get_request_stats,
+    get_token_usage, make_binding, parse_with_gemini, reset_request_stats, reset_token_usage
+)
+from scheduler import QuotaScheduler
+
+class Response:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class Usage:
+    def __init__(self, prompt_token_count, cached_content_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.candidates_token_count = candidates_token_count
+
+class FaultyModel:
+    """
+    Stand-in for a Gemini model that injects 503s and stalls
+    
+    Calls listed in fail_calls raise ServiceUnavailable; every stall_every-th
+    call sleeps for stall seconds; all other calls take latency seconds.
+    """
+    
+    def __init__(self, latency=0.005, stall=0.0, stall_every=0, fail_calls=(), usage=None):
+        self.latency = latency
+        self.stall = stall
+        self.stall_every = stall_every
+        self.fail_calls = set(fail_calls)
+        self.usage = usage
+        self.calls = 0
+        self.contents = []
+        self._lock = threading.Lock()
+    
+    def generate_content(self, contents, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.contents.append(contents)
+        if call in self.fail_calls:
+            raise google_exceptions.ServiceUnavailable("injected 503")
+        stalled = self.stall_every and call % self.stall_every == 0
+        time.sleep(self.stall if stalled else self.latency)
+        return Response("Date,Cheque No.,Narration,Debit,Credit,Balance", self.usage)
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(llm_parser, 'RETRY_BASE_DELAY', 0.001)
+    monkeypatch.setattr(llm_parser, 'RETRY_MAX_DELAY', 0.01)
+    reset_request_stats()
+    reset_token_usage()
+    yield
+    reset_request_stats()
+    reset_token_usage()
+
+def p99(samples):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(0.99 * len(samples)))]
+
+def test_retries_transient_errors():
+    model = FaultyModel(fail_calls={1, 2})
+    
+    response = generate_with_retry(model, "text", timeout=1, max_retries=3, hedge=False)
+    
+    assert response.text.startswith("Date")
+    assert model.calls == 3
+    assert get_request_stats()['retries'] == 2
+
+def test_gives_up_after_max_retries():
+    model = FaultyModel(fail_calls={1, 2, 3})
+    
+    with pytest.raises(GeminiRequestError):
+        generate_with_retry(model, "text", timeout=1, max_retries=1, hedge=False)
+    assert model.calls == 2
+
+def test_deadline_abandons_stalled_call():
+    model = FaultyModel(stall=1.0, stall_every=1)
+    
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        call_with_deadline(model, "text", timeout=0.2, hedge=False)
+    
+    assert time.monotonic() - started < 0.6
+    assert get_request_stats()['timeouts'] == 1
+
+def test_hedging_cuts_tail_latency():
+    def run(hedge, requests=60):
+        model = FaultyModel(latency=0.005, stall=0.3, stall_every=25)
+        reset_request_stats()
+        # Warm up the latency window so a p95 is available for hedging
+        for _ in range(llm_parser.HEDGE_MIN_SAMPLES + 5):
+            call_with_deadline(model, "text", timeout=2, hedge=False)
+        
+        latencies = []
+        for _ in range(requests):
+            started = time.monotonic()
+            call_with_deadline(model, "text", timeout=2, hedge=hedge)
+            latencies.append(time.monotonic() - started)
+        return p99(latencies), get_request_stats()
+    
+    plain_p99, plain_stats = run(hedge=False)
+    hedged_p99, hedged_stats = run(hedge=True)
+    
+    assert plain_stats['hedged'] == 0
+    assert hedged_stats['hedged'] > 0
+    assert hedged_stats['hedge_wins'] > 0
+    assert plain_p99 >= 0.25
+    assert hedged_p99 < plain_p99 / 2
+
+def test_token_usage_from_api_metadata():
+    model = FaultyModel(usage=Usage(1200, 1000, 50))
+    binding = make_binding(model, "static prompt " * 100, 'cached')
+    
+    parse_with_gemini("statement text", binding['prompt'], binding=binding, hedge=False)
+    
+    usage = get_token_usage()
+    assert usage['requests'] == 1
+    assert usage['prompt_tokens'] == 1200
+    assert usage['cached_tokens'] == 1000
+    assert usage['uncached_prompt_tokens'] == 200
+    assert usage['output_tokens'] == 50
+    assert usage['cache_savings'] == pytest.approx(1000 / 1200)
+
+def test_token_usage_estimated_without_metadata():
+    model = FaultyModel(fail_calls={1})
+    prompt = "static prompt " * 100
+    cached = make_binding(model, prompt, 'cached')
+    
+    # The injected 503 is retried and only the successful attempt is counted
+    parse_with_gemini("statement text", prompt, binding=cached, hedge=False)
+    usage = get_token_usage()
+    assert usage['requests'] == 1
+    assert usage['cached_tokens'] == cached['prompt_tokens']
+    assert usage['prompt_tokens'] > cached['prompt_tokens']
+    assert prompt not in model.contents[-1]
+
+def test_inline_binding_sends_prompt_every_request():
+    model = FaultyModel()
+    prompt = "static prompt " * 100
+    inline = make_binding(model, prompt, 'inline')
+    
+    parse_with_gemini("statement text", prompt, binding=inline, hedge=False)
+    
+    assert model.contents[-1].startswith(prompt)
+    assert get_token_usage()['cached_tokens'] == 0
+
+def test_hedge_skipped_without_quota_capacity():
+    model = FaultyModel(latency=0.005, stall=0.3, stall_every=25)
+    for _ in range(llm_parser.HEDGE_MIN_SAMPLES + 4):
+        call_with_deadline(model, "text", timeout=2, hedge=False)
+    
+    # One request per minute, already used by the stalled call itself
+    scheduler = QuotaScheduler(rpm=1)
+    scheduler.acquire(10)
+    call_with_deadline(model, "text", timeout=2, hedge=True, scheduler=scheduler, tokens=10)
+    
+    stats = get_request_stats()
+    assert stats['hedged'] == 0
+    assert stats['hedges_skipped'] == 1
+    assert scheduler.get_stats()['requests'] == 1
@@ -0,0 +1,54 @@
+"""
+Tests for RPM/TPM admission control
+"""
+
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import QuotaScheduler
+
+def test_process_wide_scheduler_starts_without_burst(monkeypatch):
+    monkeypatch.setattr(scheduler, 'GEMINI_RPM', 600)
+    monkeypatch.setattr(scheduler, '_default_scheduler', None)
+    
+    # A replacement worker must not admit a minute's burst on top of what its predecessor spent
+    quota = scheduler.get_scheduler()
+    assert not quota.try_acquire(0)
+    # Capacity arrives at the quota rate (one request per 0.1s)
+    assert quota.acquire(0) <= 0.2
+    
+    assert QuotaScheduler(rpm=600).try_acquire(0)
+
+def test_callers_admitted_in_arrival_order():
+    # 1000 tokens per second, starting empty
+    quota = QuotaScheduler(tpm=60000, start_full=False)
+    admitted = []
+    
+    def request(name, tokens):
+        quota.acquire(tokens)
+        admitted.append(name)
+    
+    large = threading.Thread(target=request, args=('large', 500))
+    large.start()
+    time.sleep(0.05)
+    # Each small request would fit long before the large one; none may overtake it
+    small = [threading.Thread(target=request, args=(f'small{n}', 100)) for n in range(3)]
+    for thread in small:
+        thread.start()
+        time.sleep(0.01)
+    for thread in [large] + small:
+        thread.join()
+    
+    assert admitted == ['large', 'small0', 'small1', 'small2']
+
+def test_request_above_capacity_is_charged_in_full():
+    quota = QuotaScheduler(tpm=600)
+    
+    quota.acquire(1500)
+    
+    # The 900-token overdraft delays later traffic until it is paid back
+    assert quota.tpm.tokens == pytest.approx(-900, abs=1)
+    assert not quota.try_acquire(1)
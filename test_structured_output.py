@@ -0,0 +1,21 @@
+"""
+Tests for decoding positional JSON rows
+"""
+
+import pytest
+
+from structured_output import decode_rows
+
+def test_integer_minor_units():
+    rows = decode_rows('[["2024-01-01", "", "NEFT, SALARY", 0, 150000, "250000"]]')
+    
+    assert [(t.narration, t.debit, t.credit, t.balance) for t in rows] == [("NEFT, SALARY", None, 150000, 250000)]
+
+@pytest.mark.parametrize("amount", ["1500.0", "23450.5", '"23450.50"'])
+def test_amounts_at_another_scale_are_rejected(amount):
+    with pytest.raises(ValueError):
+        decode_rows(f'[["2024-01-01", "", "ATM", {amount}, 0, 100000]]')
+
+def test_truncated_response_is_rejected():
+    with pytest.raises(ValueError):
+        decode_rows('[["2024-01-01", "", "ATM", 100, 0, 1000], ["2024-01-02", "", "Sh')
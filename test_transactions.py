@@ -0,0 +1,48 @@
+"""
+Tests for exact amount parsing and the typed CSV round-trip
+"""
+
+import pytest
+
+from csv_handler import validate_csv
+from statement_parser import validate_transactions
+from transactions import Transaction, parse_amount, parse_transactions, transactions_to_csv
+
+@pytest.mark.parametrize('text, minor', [
+    ('1500', 150000),
+    ('1,500.5', 150050),
+    ('₹ 1,500.50', 150050),
+    ('Rs. 12,34,567.89', 123456789),
+    ('$0.07', 7),
+    ('.5', 50),
+    ('+20.00', 2000),
+    ('-20.00', -2000),
+    ('(20.00)', -2000),
+    ('(-20.00)', 2000),
+    ('10.005', 1001),
+    ('10.004', 1000),
+    ('-10.005', -1001),
+    (12, 1200),
+    (0.1, 10),
+])
+def test_parse_amount(text, minor):
+    assert parse_amount(text) == minor
+
+@pytest.mark.parametrize('text', [None, '', '  ', '.', '-', '1500.00 Dr', '1.2.3', 'abc', '12a', float('nan')])
+def test_parse_amount_rejects_non_numbers(text):
+    assert parse_amount(text) is None
+
+def test_unreadable_amounts_survive_round_trip():
+    transaction = Transaction.from_row(['2024-01-02', '', 'ATM', '1500.00 Dr', '', '8500.00'])
+    
+    assert transaction.debit is None
+    assert transaction.to_row() == ['2024-01-02', '', 'ATM', '1500.00 Dr', '', '8500.00']
+    
+    csv_text = "Date,Cheque No.,Narration,Debit,Credit,Balance\n2024-01-01,,Open,,,10000.00\n" \
+               "2024-01-02,,ATM,1500.00 Dr,,8500.00"
+    transactions = parse_transactions(csv_text)
+    assert transactions_to_csv(transactions) == csv_text
+    
+    _, report = validate_csv(transactions_to_csv(transactions))
+    assert 'invalid_debit' in report['issues_found']
+    assert 'invalid_debit' in validate_transactions(transactions)['issues_found']
@@ -0,0 +1,217 @@
+"""
+Transaction Model Module
+Compact typed representation of statement rows with exact fixed-point amounts
+"""
+
+import csv
+import logging
+import math
+from datetime import date
+from io import StringIO
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ['Date', 'Cheque No.', 'Narration', 'Debit', 'Credit', 'Balance']
+
+# Amounts are stored as integer minor units (paise/cents)
+MINOR_UNITS = 100
+CURRENCY_MARKERS = ('₹', '$', '€', '£', 'Rs.', 'Rs', 'INR')
+
+def parse_amount(value):
+    """
+    Parse an amount into integer minor units without going through float
+    
+    Accepts strings such as '1500', '1,500.5', '₹ 1,500.50', '-20.00' or '(20.00)'.
+    
+    Args:
+        value: Amount as string, int or float
+    
+    Returns:
+        int: Amount in minor units, or None if empty or not a number
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value * MINOR_UNITS
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        value = repr(value)
+    
+    text = str(value).strip()
+    if not text:
+        return None
+    
+    for marker in CURRENCY_MARKERS:
+        if marker in text:
+            text = text.replace(marker, '')
+    text = text.replace(',', '').replace(' ', '')
+    
+    negative = False
+    if text.startswith('(') and text.endswith(')'):
+        negative, text = True, text[1:-1]
+    if text.startswith('-'):
+        negative, text = not negative, text[1:]
+    elif text.startswith('+'):
+        text = text[1:]
+    
+    whole, _, fraction = text.partition('.')
+    if not (whole or fraction) or (whole and not whole.isdigit()) or (fraction and not fraction.isdigit()):
+        return None
+    
+    # Round half up on any digits beyond the minor unit
+    minor = int(whole or '0') * MINOR_UNITS + int((fraction + '00')[:2])
+    if len(fraction) > 2 and fraction[2] >= '5':
+        minor += 1
+    
+    return -minor if negative else minor
+
+def format_amount(minor):
+    """Format integer minor units as a plain decimal string ('' for None)"""
+    if minor is None:
+        return ''
+    sign = '-' if minor < 0 else ''
+    whole, fraction = divmod(abs(minor), MINOR_UNITS)
+    return f"{sign}{whole}.{fraction:02d}"
+
+def parse_date(value):
+    """
+    Parse a YYYY-MM-DD date into an integer day ordinal
+    
+    Returns:
+        int: date.toordinal() value, or None if the value is not an ISO date
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    if len(text) != 10 or text[4] != '-' or text[7] != '-':
+        return None
+    try:
+        return date(int(text[:4]), int(text[5:7]), int(text[8:])).toordinal()
+    except ValueError:
+        return None
+
+def format_date(ordinal):
+    """Format an integer day ordinal as YYYY-MM-DD ('' for None)"""
+    if ordinal is None:
+        return ''
+    return date.fromordinal(ordinal).isoformat()
+
+class Transaction:
+    """
+    A single statement row
+    
+    Dates are integer day ordinals and amounts are integer minor units, so
+    balance arithmetic is exact. raw_date keeps the original text when the
+    date could not be parsed; raw_amounts likewise keeps the (Debit, Credit,
+    Balance) text of unreadable amounts, so they are written back out and
+    flagged by validation instead of disappearing.
+    """
+    __slots__ = ('date', 'raw_date', 'cheque_no', 'narration', 'debit', 'credit', 'balance', 'raw_amounts')
+    
+    def __init__(self, date=None, cheque_no='', narration='', debit=None, credit=None,
+                 balance=None, raw_date=None, raw_amounts=None):
+        self.date = date
+        self.raw_date = raw_date
+        self.raw_amounts = raw_amounts
+        self.cheque_no = cheque_no
+        self.narration = narration
+        self.debit = debit
+        self.credit = credit
+        self.balance = balance
+    
+    @classmethod
+    def from_row(cls, row, row_number=None):
+        """
+        Build a transaction from a CSV row in CSV_COLUMNS order
+        
+        Args:
+            row (list): Cell values
+            row_number (int): Row number used in warnings
+        """
+        cells = list(row) + [''] * (len(CSV_COLUMNS) - len(row))
+        date_text = cells[0].strip()
+        ordinal = parse_date(date_text)
+        
+        amounts = []
+        raw_amounts = None
+        for position, (column, cell) in enumerate(zip(CSV_COLUMNS[3:], cells[3:6])):
+            amount = parse_amount(cell)
+            if amount is None and cell.strip():
+                logger.warning(f"Row {row_number}: unreadable {column} value '{cell.strip()}'")
+                raw_amounts = raw_amounts or ['', '', '']
+                raw_amounts[position] = cell.strip()
+            amounts.append(amount)
+        
+        return cls(
+            date=ordinal,
+            raw_date=None if ordinal is not None or not date_text else date_text,
+            cheque_no=cells[1].strip(),
+            narration=cells[2].strip(),
+            debit=amounts[0],
+            credit=amounts[1],
+            balance=amounts[2],
+            raw_amounts=tuple(raw_amounts) if raw_amounts else None
+        )
+    
+    @property
+    def net_amount(self):
+        """Credit minus debit in minor units"""
+        return (self.credit or 0) - (self.debit or 0)
+    
+    def date_text(self):
+        """Date as YYYY-MM-DD, or the original text if it could not be parsed"""
+        return format_date(self.date) if self.date is not None else (self.raw_date or '')
+    
+    def fingerprint(self):
+        """Key identifying the same transaction across overlapping outputs"""
+        return (self.date, self.raw_date, self.narration, self.debit, self.credit, self.balance,
+                self.raw_amounts)
+    
+    def amount_texts(self):
+        """Debit, Credit and Balance as plain decimals, or the original text where unreadable"""
+        raw_amounts = self.raw_amounts or ('', '', '')
+        return [format_amount(amount) if amount is not None else raw
+                for amount, raw in zip((self.debit, self.credit, self.balance), raw_amounts)]
+    
+    def to_row(self):
+        """Cell values in CSV_COLUMNS order"""
+        return [self.date_text(), self.cheque_no, self.narration] + self.amount_texts()
+    
+    def __repr__(self):
+        return f"Transaction({', '.join(self.to_row())})"
+
+def iter_transactions(lines):
+    """
+    Lazily parse CSV lines (header first) into transactions
+    
+    Args:
+        lines: Iterable of CSV lines, e.g. an open file
+    
+    Yields:
+        Transaction: One per non-empty data row
+    """
+    reader = csv.reader(lines)
+    for row_number, row in enumerate(reader):
+        if row_number == 0 or not any(cell.strip() for cell in row):
+            continue
+        yield Transaction.from_row(row, row_number)
+
+def parse_transactions(csv_string):
+    """Parse a CSV string (header first) into a list of transactions"""
+    return list(iter_transactions(StringIO(csv_string)))
+
+def write_transactions(transactions, output):
+    """Write transactions as CSV with a header row to a file-like object"""
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    for transaction in transactions:
+        writer.writerow(transaction.to_row())
+
+def transactions_to_csv(transactions):
+    """Serialize transactions to a CSV string with a header row"""
+    buffer = StringIO()
+    write_transactions(transactions, buffer)
+    return buffer.getvalue().rstrip('\n')